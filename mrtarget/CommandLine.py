@@ -6,6 +6,7 @@ import sys
 import os
 import os.path
 import itertools
+import contextlib
 
 from mrtarget.modules.Evidences import process_evidences_pipeline
 from mrtarget.common.ElasticsearchLoader import Loader
@@ -24,10 +25,24 @@ from mrtarget.modules.Reactome import ReactomeProcess
 from mrtarget.modules.SearchObjects import SearchObjectProcess
 from mrtarget.modules.Uniprot import UniprotDownloader
 from mrtarget.modules.Metrics import Metrics
+from mrtarget.modules.BulkLoad import bulk_load_folder
 from mrtarget.Settings import Config, file_or_resource
+import mrtarget.common.JsonBackend as JsonBackend
 
 import mrtarget.cfg
 
+
+@contextlib.contextmanager
+def redis_if_needed(args):
+    """a RedisManager, unless the lookup tables are mmap snapshots that
+    need no redis at all"""
+    if args.lookup_backend == 'mmap':
+        yield None
+    else:
+        with RedisManager(args.redis_remote, args.redis_host, args.redis_port) as redis_manager:
+            yield redis_manager
+
+
 def main():
     #parse config file, environment, and command line arguments
     mrtarget.cfg.setup_ops_parser()
@@ -60,14 +75,25 @@ def main():
         Config.RELEASE_VERSION = args.release_tag
         logger.info('setting release version %s' % Config.RELEASE_VERSION)
 
+    Config.ES_SCROLL_SLICES = args.es_scroll_slices
+    Config.ES_BULK_CONCURRENCY = args.es_bulk_workers
+    Config.ES_BULK_QUEUE = args.es_bulk_queue
+    Config.ES_BULK_CHUNK_BYTES = args.es_bulk_chunk_bytes
+    Config.ES_BULK_DEAD_LETTER = args.es_bulk_dead_letter
+    Config.ES_OUTPUT_FOLDER = args.elasticsearch_folder
+    Config.JSON_BACKEND = args.json_backend
+    JsonBackend.set_json_backend(args.json_backend)
+
 
 
     
     
-    with RedisManager(args.redis_remote,args.redis_host, args.redis_port):
+    with redis_if_needed(args) as redis_manager:
 
         es = new_es_client(args.elasticseach_nodes)
-        redis = new_redis_client(args.redis_host, args.redis_port)
+        redis = None
+        if redis_manager is not None:
+            redis = new_redis_client(args.redis_host, args.redis_port)
 
         #create a single query object for future use
         esquery = ESQuery(es)
@@ -149,16 +175,26 @@ def main():
                     num_workers=args.val_workers_validator,
                     num_writers=args.val_workers_writer,
                     max_queued_events=args.val_queue_validator_writer,
+                    batch_size=args.val_batch_size,
                     eco_scores_uri=data_config.eco_scores,
                     schema_uri = data_config.schema,
                     es_hosts=args.elasticseach_nodes,
                     excluded_biotypes = data_config.excluded_biotypes,
-                    datasources_to_datatypes = data_config.datasources_to_datatypes)
+                    datasources_to_datatypes = data_config.datasources_to_datatypes,
+                    lookup_cache_size=args.lookup_cache_size,
+                    lookup_cache_ttl=args.lookup_cache_ttl,
+                    lookup_codec=args.lookup_codec,
+                    lookup_backend=args.lookup_backend,
+                    lookup_snapshot_dir=args.lookup_snapshot_dir,
+                    partition_size=args.val_partition_size if args.val_partition_size >= 0 else None,
+                    send_bytes=args.val_send_bytes,
+                    flush_timeout=args.val_flush_timeout,
+                    scores_folder=args.val_scores_folder)
 
                 #TODO qc
 
             if args.assoc:
-                process = ScoringProcess(args.redis_host, args.redis_port,
+                process = ScoringProcess(args.redis_host if redis else None, args.redis_port,
                     args.elasticseach_nodes)
                 if not args.qc_only:
                     process.process_all(data_config.scoring_weights, 
@@ -167,7 +203,14 @@ def main():
                         args.dry_run,
                         args.as_workers_production,
                         args.as_workers_score,
-                        args.as_queue_production_score)
+                        args.as_queue_production_score,
+                        args.lookup_cache_size,
+                        args.lookup_cache_ttl,
+                        args.lookup_codec,
+                        args.lookup_backend,
+                        args.lookup_snapshot_dir,
+                        args.as_batch_size,
+                        args.as_scores_folder)
                 if not args.skip_qc:
                     qc_metrics.update(process.qc(esquery))
                     pass
@@ -179,7 +222,8 @@ def main():
                         args.ddr_workers_production,
                         args.ddr_workers_score,
                         args.ddr_queue_production_score,
-                        args.ddr_queue_score_result)
+                        args.ddr_queue_score_result,
+                        args.ddr_batch_size)
                 #TODO qc
 
             if args.sea:
@@ -194,6 +238,10 @@ def main():
                         args.dry_run)
                 #TODO qc
 
+            if args.bulk_load:
+                bulk_load_folder(es, args.elasticseach_nodes, args.bulk_load,
+                    args.bulk_load_workers, args.dry_run)
+
             if args.metric:
                 process = Metrics(es, args.metric_file, 
                     data_config.datasources_to_datatypes).generate_metrics()
@@ -105,4 +105,29 @@ class Config():
     ES_CUSTOM_IDXS = read_option('CTTV_ES_CUSTOM_IDXS',
                                  default=False, cast=bool)
     ES_CUSTOM_IDXS_INI = ini if ES_CUSTOM_IDXS else None
+
+    # number of slices full index scans are split into and read in parallel
+    ES_SCROLL_SLICES = read_option('CTTV_ES_SCROLL_SLICES',
+                                   default=1, cast=int)
+
+    # bulk indexing by Loader: number of background threads sending chunks
+    # (0 sends them in the calling thread), chunks waiting to be sent before
+    # put() blocks (0 is twice the threads) and maximum bytes in a chunk
+    # (0 is only limited by its number of documents)
+    ES_BULK_CONCURRENCY = read_option('CTTV_ES_BULK_CONCURRENCY',
+                                      default=0, cast=int)
+    ES_BULK_QUEUE = read_option('CTTV_ES_BULK_QUEUE',
+                                default=0, cast=int)
+    ES_BULK_CHUNK_BYTES = read_option('CTTV_ES_BULK_CHUNK_BYTES',
+                                      default=0, cast=int)
+    # json lines file for documents elasticsearch refused to index
+    ES_BULK_DEAD_LETTER = read_option('CTTV_ES_BULK_DEAD_LETTER',
+                                      default=None)
+    # write gzipped bulk files to this folder instead of indexing
+    ES_OUTPUT_FOLDER = read_option('CTTV_ES_OUTPUT_FOLDER',
+                                   default=None)
+
+    # library used to parse and write json documents, see JsonBackend
+    JSON_BACKEND = read_option('CTTV_JSON_BACKEND',
+                               default='simplejson')
     
\ No newline at end of file
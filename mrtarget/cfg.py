@@ -3,6 +3,8 @@ import yaml
 import configargparse
 import addict
 import mrtarget.common.connection
+import mrtarget.common.Redis
+import mrtarget.common.JsonBackend
 from mrtarget.common import URLZSource
 
 def setup_ops_parser():
@@ -44,12 +46,47 @@ def setup_ops_parser():
         action='store', default='6379',
         env_var='REDIS_PORT')
 
+    # in-process cache in front of the redis lookup tables, in each worker
+    p.add("--lookup-cache-size", help="# of decoded lookup table entries cached in each worker, 0 disables it",
+        env_var="LOOKUP_CACHE_SIZE", action='store', default=0, type=int)
+    p.add("--lookup-cache-ttl", help="seconds a cached lookup table entry is valid for, default forever",
+        env_var="LOOKUP_CACHE_TTL", action='store', default=None, type=int)
+
+    p.add("--lookup-codec", help="how lookup table entries are encoded in redis, msgpack and lz4 codecs need those modules installed",
+        env_var="LOOKUP_CODEC", action='store', default='pickle',
+        choices=mrtarget.common.Redis.LOOKUP_TABLE_CODECS)
+
+    p.add("--json-backend", help="library to parse and write json documents with, ujson needs that module installed",
+        env_var="JSON_BACKEND", action='store', default='simplejson',
+        choices=mrtarget.common.JsonBackend.JSON_BACKENDS)
+
+    # where --val and --as workers read the lookup tables from
+    p.add("--lookup-backend", help="redis, or mmap to share a read-only snapshot file between workers instead, without starting or connecting to redis",
+        env_var="LOOKUP_BACKEND", action='store', default='redis',
+        choices=['redis', 'mmap'])
+    p.add("--lookup-snapshot-dir", help="directory for the mmap lookup table snapshots, reused by later runs while the release and source indices do not change. Default a new temporary one",
+        env_var="LOOKUP_SNAPSHOT_DIR", action='store', default=None)
+
     # elasticsearch
     p.add("--elasticseach-nodes", help="elasticsearch host(s)",
         action='append', default=['localhost:9200'],
         env_var='ELASTICSEARCH_NODES')
-    p.add("--elasticsearch-folder", help="write to files instead of a live elasticsearch server",
-        action='store') #this only applies to --val at the moment
+    p.add("--elasticsearch-folder", help="write gzipped bulk files to this folder instead of a live elasticsearch server, to be loaded later with --bulk-load",
+        action='store')
+    p.add("--bulk-load", help="load the bulk files written with --elasticsearch-folder from this folder into elasticsearch",
+        action='store', metavar='DIR')
+    p.add("--bulk-load-workers", help="# of procs loading bulk files",
+        env_var="BULK_LOAD_WORKERS", action='store', default=4, type=int)
+    p.add("--es-scroll-slices", help="split full index scans into this many slices read in parallel",
+        env_var="ES_SCROLL_SLICES", action='store', default=1, type=int)
+    p.add("--es-bulk-workers", help="# of threads sending bulk requests in the background for each loader, 0 sends them in the foreground",
+        env_var="ES_BULK_WORKERS", action='store', default=0, type=int)
+    p.add("--es-bulk-queue", help="# of bulk requests waiting to be sent before producers block, default twice the workers",
+        env_var="ES_BULK_QUEUE", action='store', default=0, type=int)
+    p.add("--es-bulk-chunk-bytes", help="maximum size in bytes of the documents in a bulk request, 0 to only limit the number of documents",
+        env_var="ES_BULK_CHUNK_BYTES", action='store', default=0, type=int)
+    p.add("--es-bulk-dead-letter", help="append documents elasticsearch refused to index to this file instead of failing",
+        env_var="ES_BULK_DEAD_LETTER", action='store', default=None)
 
     # process handling
     #note this is the number of workers for each parallel operation
@@ -62,6 +99,16 @@ def setup_ops_parser():
         env_var="VAL_WORKERS_WRITER", action='store', default=4, type=int)
     p.add("--val-queue-validator-writer", help="size of validation writer to worker queue",
         env_var="VAL_QUEUE_VALIDATOR_WRITER", action='store', default=1000, type=int)
+    p.add("--val-batch-size", help="# of lines each validation worker fixes and scores at once",
+        env_var="VAL_BATCH_SIZE", action='store', default=100, type=int)
+    p.add("--val-flush-timeout", help="seconds a line waits for its batch to fill before the batch is sent to a validation worker anyway, 0 to always wait",
+        env_var="VAL_FLUSH_TIMEOUT", action='store', default=0, type=float)
+    p.add("--val-send-bytes", help="validation workers send only the json of each document to the writers, when the main process reads all input",
+        env_var="VAL_SEND_BYTES", action='store_true')
+    p.add("--val-partition-size", help="bytes of uncompressed local input each validation worker reads and writes itself, without separate writers and with --val-first-n per file, 0 to not split files and -1 (default) to read all input in the main process",
+        env_var="VAL_PARTITION_SIZE", action='store', default=-1, type=int)
+    p.add("--val-scores-folder", help="also write what association scoring needs of the valid evidence to compact files in this folder, to be read with --as-scores-folder",
+        env_var="VAL_SCORES_FOLDER", action='store')
 
     p.add("--as-workers-production", help="# of procs for assocation pair producers",
         env_var="AS_WORKERS_PRODUCTION", action='store', default=4, type=int)
@@ -69,6 +116,10 @@ def setup_ops_parser():
         env_var="AS_WORKERS_SCORE", action='store', default=4, type=int)
     p.add("--as-queue-production-score", help="size of assocation producer to scorer queue",
         env_var="AS_QUEUE_PRODUCTION_SCORE", action='store', default=1000, type=int)
+    p.add("--as-batch-size", help="# of targets or association pairs sent between processes at once",
+        env_var="AS_BATCH_SIZE", action='store', default=50, type=int)
+    p.add("--as-scores-folder", help="score associations from the evidence score files written by --val-scores-folder in this folder, instead of reading the evidence from elasticsearch",
+        env_var="AS_SCORES_FOLDER", action='store')
 
     p.add("--ddr-workers-production", help="# of procs for relation pair producers",
         env_var="DDR_WORKERS_PRODUCTION", action='store', default=4, type=int)
@@ -78,6 +129,8 @@ def setup_ops_parser():
         env_var="DDR_QUEUE_PRODUCTION_SCORE", action='store', default=1000, type=int)
     p.add("--ddr-queue-score-result", help="size of relation scorer result queue",
         env_var="DDR_QUEUE_SCORE_RESULT", action='store', default=1000, type=int)
+    p.add("--ddr-batch-size", help="# of relation subjects, pairs or relations sent between processes at once",
+        env_var="DDR_BATCH_SIZE", action='store', default=100, type=int)
 
     # for debugging
     p.add("--dry-run", help="do not store data in the backend, useful for dev work. Does not work with all the steps!!",
@@ -0,0 +1,107 @@
+"""
+Helpers to send lists of items between pypeln stages instead of one item at
+a time, so the lock and pickle of each queue transfer is paid once per batch
+"""
+import Queue
+import threading
+import time
+
+import more_itertools
+
+
+_DONE = object()
+
+
+def _read_into_queue(iterable, queue):
+    try:
+        for item in iterable:
+            queue.put((item, None))
+    except Exception as e:
+        queue.put((None, e))
+    queue.put((_DONE, None))
+
+
+def batched(iterable, batch_size, flush_timeout=None):
+    """return an iterator of lists of up to batch_size items of iterable.
+
+    If flush_timeout is given, iterable is read in a thread and a batch is also
+    returned once its first item has been waiting flush_timeout seconds, so
+    items of a slow iterable are not held back until a batch fills up
+    """
+    if not flush_timeout:
+        for batch in more_itertools.chunked(iterable, batch_size):
+            yield batch
+        return
+
+    queue = Queue.Queue(maxsize=batch_size * 2)
+    reader = threading.Thread(target=_read_into_queue, args=(iterable, queue))
+    reader.daemon = True
+    reader.start()
+
+    batch = []
+    deadline = None
+    while True:
+        try:
+            if batch:
+                item, error = queue.get(timeout=max(deadline - time.time(), 0))
+            else:
+                item, error = queue.get()
+        except Queue.Empty:
+            #waited long enough, send what there is
+            yield batch
+            batch = []
+            continue
+
+        if error is not None:
+            raise error
+        if item is _DONE:
+            break
+
+        if not batch:
+            deadline = time.time() + flush_timeout
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+
+def batched_by_weight(iterable, batch_size, max_weight, weight):
+    """return an iterator of lists of up to batch_size items of iterable, where a
+    list also ends once the weight(item) of its items add up to max_weight, so
+    heavy items are sent in small lists or on their own"""
+    batch = []
+    batch_weight = 0
+    for item in iterable:
+        batch.append(item)
+        batch_weight += weight(item)
+        if len(batch) >= batch_size or batch_weight >= max_weight:
+            yield batch
+            batch = []
+            batch_weight = 0
+    if batch:
+        yield batch
+
+
+def map_batch(f, batch, *args):
+    """apply f(item, *args) to every item of a batch and return the list of results.
+
+    To be baked with functools.partial(map_batch, f) as the function of a stage"""
+    return [f(item, *args) for item in batch]
+
+
+def flat_map_batch(f, batch_size, batch, *args):
+    """apply f(item, *args), that returns a list, to every item of a batch and return
+    the results in lists of up to batch_size.
+
+    To be baked with functools.partial(flat_map_batch, f, batch_size) as the function
+    of a pypeln flat_map stage, that then sends batches of results"""
+    results = [result for item in batch for result in f(item, *args)]
+    return list(more_itertools.chunked(results, batch_size))
+
+
+def batch_queue_size(max_queued_items, batch_size):
+    """size of a queue of batches that holds about max_queued_items items"""
+    return max(1, max_queued_items // max(1, batch_size))
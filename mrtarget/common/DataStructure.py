@@ -4,6 +4,7 @@ from UserDict import UserDict
 from datetime import datetime, date
 
 from mrtarget.Settings import Config
+import mrtarget.common.JsonBackend as JsonBackend
 
 
 
@@ -34,7 +35,7 @@ def json_serialize(obj):
 
 class JSONSerializable(object):
     def to_json(self):
-        return json.dumps(self,
+        return JsonBackend.dumps(self,
                           default=json_serialize,
                           sort_keys=True,
                           # indent=4,
@@ -42,7 +43,7 @@ class JSONSerializable(object):
 
     def load_json(self, data):
         if isinstance(data, str) or isinstance(data, unicode):
-            self.__dict__.update(**json.loads(data))
+            self.__dict__.update(**JsonBackend.loads(data))
         elif isinstance(data, dict):#already parsed json obj
             self.__dict__.update(**data)
         else:
@@ -4,9 +4,15 @@ import time
 import logging
 import tempfile
 import json
+import Queue
+import threading
+import os
+import gzip
+import uuid
 from elasticsearch.exceptions import NotFoundError
-from elasticsearch.helpers import bulk
+from elasticsearch.helpers import streaming_bulk, BulkIndexError
 from mrtarget.common.DataStructure import JSONSerializable
+import mrtarget.common.JsonBackend as JsonBackend
 from mrtarget.common.EvidenceJsonUtils import assertJSONEqual
 from mrtarget.Settings import Config
 from mrtarget.ElasticsearchConfig import ElasticSearchConfiguration
@@ -16,13 +22,49 @@ from mrtarget.ElasticsearchConfig import ElasticSearchConfiguration
 class Loader():
     """
     Loads data to elasticsearch
+
+    Documents are sent in chunks of chunk_size documents or, if chunk_bytes
+    is set, of at most that many bytes of serialised documents. With
+    concurrency > 0 chunks are sent by that many background threads while
+    the caller keeps producing; at most max_queued_chunks chunks wait to be
+    sent, then put() blocks until one is taken. Errors in the background
+    are raised by the next put(), flush() or close(). Unset values are
+    taken from Config.ES_BULK_*
+
+    When sized by bytes, chunks shrink when elasticsearch rejects documents
+    or a request takes longer than TARGET_LATENCY and grow back up to
+    chunk_bytes when it keeps up. Only the documents that failed are sent
+    again, with exponential backoff, and the ones that fail for good are
+    appended to dead_letter_file as json lines if it is set or raised
+
+    With an output_folder, documents are written there as gzipped files in
+    the bulk API format instead, and the indexes to create are listed in
+    INDEXES_FILENAME, so they can be loaded later with bulk_load_folder().
+    Unset, the folder is Config.ES_OUTPUT_FOLDER. With write_to_es the
+    documents are always sent to elasticsearch, whatever that setting is
     """
 
+    INDEXES_FILENAME = 'indexes.txt'
+    BULK_FILENAME_PATTERN = 'bulk_*.json.gz'
+
+    TARGET_LATENCY = 5.0
+    MIN_CHUNK_BYTES = 64 * 1024
+    INITIAL_BACKOFF = 1
+    MAX_BACKOFF = 120
+    #statuses worth retrying, anything else will fail again
+    RETRY_STATUSES = (429, 502, 503, 504)
+
     def __init__(self,
                  es,
                  chunk_size=1000,
                  dry_run = False,
-                 max_flush_interval = random.choice(range(60,120))):
+                 max_flush_interval = random.choice(range(60,120)),
+                 concurrency = None,
+                 max_queued_chunks = None,
+                 chunk_bytes = None,
+                 dead_letter_file = None,
+                 output_folder = None,
+                 write_to_es = False):
 
         self.logger = logging.getLogger(__name__)
 
@@ -36,6 +78,34 @@ class Loader():
         self.max_flush_interval = max_flush_interval
         self._last_flush_time = time.time()
 
+        self.concurrency = concurrency if concurrency is not None \
+            else Config.ES_BULK_CONCURRENCY
+        self.max_queued_chunks = max_queued_chunks if max_queued_chunks is not None \
+            else Config.ES_BULK_QUEUE or 2 * self.concurrency
+        self.chunk_bytes = chunk_bytes if chunk_bytes is not None \
+            else Config.ES_BULK_CHUNK_BYTES
+        self._cache_bytes = 0
+        self.max_chunk_bytes = self.chunk_bytes
+        self.dead_letter_file = dead_letter_file if dead_letter_file is not None \
+            else Config.ES_BULK_DEAD_LETTER
+        self._dead_letter_lock = threading.Lock()
+        if write_to_es:
+            if output_folder:
+                raise ValueError("a loader that writes to elasticsearch "
+                                 "cannot write to output_folder %s" % output_folder)
+            self.output_folder = None
+        else:
+            self.output_folder = output_folder or Config.ES_OUTPUT_FOLDER
+        self._output_lock = threading.Lock()
+        self._output_filename = None
+        if self.output_folder and not os.path.isdir(self.output_folder):
+            os.makedirs(self.output_folder)
+        #background sending is started on the first flush, so a loader made
+        #before forking does not leave its threads behind in the parent
+        self._queue = None
+        self._workers = []
+        self._errors = []
+
     @staticmethod
     def get_versioned_index(index_name, check_custom_idxs=False):
         '''get a composed real name of the index
@@ -78,45 +148,189 @@ class Loader():
         versioned_index_name = self.get_versioned_index(index_name)
         if isinstance(body, JSONSerializable):
             body = body.to_json()
+        self.put_versioned(versioned_index_name, doc_type, ID, body)
+
+    def put_versioned(self, versioned_index_name, doc_type, ID, body):
+        if self.chunk_bytes or self.output_folder:
+            #serialise here to know the size, strings are sent as they are
+            if not isinstance(body, basestring):
+                body = JsonBackend.dumps(body)
+            self._cache_bytes += len(body)
         submission_dict = dict(_index=versioned_index_name,
             _type=doc_type, _id=ID, _source=body)
         self.cache.append(submission_dict)
 
-        if self.cache and ((len(self.cache) == self.chunk_size) or
+        if self.cache and ((len(self.cache) >= self.chunk_size) or
+                (self.chunk_bytes and self._cache_bytes >= self.chunk_bytes) or
                 (time.time() - self._last_flush_time >= self.max_flush_interval)):
             self.flush()
 
     def flush(self, max_retry=10):
+        self._raise_background_error()
         if self.cache:
-            retry = 0
-            while 1:
-                try:
-                    self._flush()
+            chunk = self.cache
+            self.cache = []
+            self._cache_bytes = 0
+            self._last_flush_time = time.time()
+            if self.concurrency > 0:
+                self._start_workers()
+                #blocks while the queue is full so producers cannot run ahead
+                self._queue.put((chunk, max_retry))
+            else:
+                self._flush_chunk(chunk, max_retry)
+
+    def _flush_chunk(self, chunk, max_retry):
+        retry = 0
+        while chunk:
+            start_time = time.time()
+            try:
+                failed = self._flush(chunk) or []
+            except Exception as e:
+                self.logger.warning("push to elasticsearch failed for chunk: %s", str(e))
+                failed = [(action, str(e), True) for action in chunk]
+            self._adapt_chunk_bytes(time.time() - start_time,
+                                    any(retryable for _, _, retryable in failed))
+
+            self._dead_letter([(action, error) for action, error, retryable in failed
+                               if not retryable])
+            chunk = [action for action, error, retryable in failed if retryable]
+            if chunk:
+                retry += 1
+                if retry >= max_retry:
+                    self.logger.error("push to elasticsearch failed for %d documents, giving up...",
+                                      len(chunk))
+                    self._dead_letter([(action, error) for action, error, retryable in failed
+                                       if retryable])
                     break
-                except Exception as e:
-                    retry+=1
-                    if retry >= max_retry:
-                        self.logger.exception("push to elasticsearch failed for chunk, giving up...")
-                        raise e
-                    else:
-                        time_to_wait = 5*retry
-                        self.logger.warning("push to elasticsearch failed for chunk: %s.  retrying in %is..."%(str(e),time_to_wait))
-                        time.sleep(time_to_wait)
-
-            del self.cache[:]
-
-    def _flush(self):
-        if not self.dry_run:
-            bulk(self.es,
-                 self.cache,
-                 stats_only=True)
+                time_to_wait = min(self.MAX_BACKOFF, self.INITIAL_BACKOFF * 2 ** (retry - 1))
+                self.logger.warning("push to elasticsearch failed for %d documents. retrying in %is...",
+                                    len(chunk), time_to_wait)
+                time.sleep(time_to_wait)
+
+    def _flush(self, chunk):
+        """send a chunk in a single bulk request and return the documents that
+        failed as (action, error, retryable) tuples"""
+        failed = []
+        if self.dry_run:
+            pass
+        elif self.output_folder:
+            self._write_bulk_file(chunk)
+        else:
+            results = streaming_bulk(self.es, chunk,
+                                     chunk_size=len(chunk),
+                                     max_chunk_bytes=2 ** 31,
+                                     raise_on_error=False)
+            #results come in the same order as the actions
+            for action, (ok, result) in zip(chunk, results):
+                if not ok:
+                    item = result.values()[0]
+                    failed.append((action, item.get('error'),
+                                   item.get('status') in self.RETRY_STATUSES))
+        return failed
+
+    def _write_bulk_file(self, chunk):
+        lines = []
+        for action in chunk:
+            lines.append(JsonBackend.dumps({'index': {'_index': action['_index'],
+                                               '_type': action['_type'],
+                                               '_id': action['_id']}}))
+            source = action['_source']
+            lines.append(source.encode('utf-8') if isinstance(source, unicode) else source)
+        with self._output_lock:
+            #one file per process, as forked processes may share a loader
+            if self._output_filename is None or self._output_filename[0] != os.getpid():
+                self._output_filename = (os.getpid(), os.path.join(self.output_folder,
+                    self.BULK_FILENAME_PATTERN.replace('*', uuid.uuid4().hex)))
+            #each chunk is a complete gzip member so the file is readable even
+            #if the loader is never closed
+            with gzip.open(self._output_filename[1], 'ab') as bulk_file:
+                bulk_file.write('\n'.join(lines) + '\n')
+
+    def _adapt_chunk_bytes(self, latency, rejected):
+        if not self.chunk_bytes:
+            return
+        chunk_bytes = self.chunk_bytes
+        if rejected:
+            chunk_bytes = max(self.MIN_CHUNK_BYTES, chunk_bytes // 2)
+        elif latency > self.TARGET_LATENCY:
+            chunk_bytes = max(self.MIN_CHUNK_BYTES, int(chunk_bytes * 0.8))
+        else:
+            chunk_bytes = min(self.max_chunk_bytes, int(chunk_bytes * 1.1))
+        if chunk_bytes != self.chunk_bytes:
+            self.logger.debug("bulk request took %.1fs%s, chunks are now %d bytes",
+                              latency, " with rejections" if rejected else "", chunk_bytes)
+            self.chunk_bytes = chunk_bytes
+
+    def _dead_letter(self, failed):
+        """keep the documents that could not be indexed in the dead letter file
+        or fail"""
+        if not failed:
+            return
+        if not self.dead_letter_file:
+            raise BulkIndexError('%i document(s) failed to index.' % len(failed),
+                                 [error for action, error in failed])
+        self.logger.error("writing %d documents that failed to index to %s",
+                          len(failed), self.dead_letter_file)
+        with self._dead_letter_lock:
+            with open(self.dead_letter_file, 'a') as dead_letter:
+                for action, error in failed:
+                    dead_letter.write(json.dumps(dict(action=action, error=error)) + '\n')
+
+    def _start_workers(self):
+        if self._queue is None:
+            self._queue = Queue.Queue(max(1, self.max_queued_chunks))
+            for i in range(self.concurrency):
+                worker = threading.Thread(target=self._background_flush,
+                                          name='loader-%d' % i)
+                worker.daemon = True
+                worker.start()
+                self._workers.append(worker)
+
+    def _background_flush(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                chunk, max_retry = item
+                if not self._errors:
+                    self._flush_chunk(chunk, max_retry)
+            except Exception as e:
+                self._errors.append(e)
+            finally:
+                self._queue.task_done()
+
+    def _raise_background_error(self):
+        if self._errors:
+            raise self._errors[0]
+
+    def wait(self):
+        """send all the documents put so far and wait until they are sent"""
+        self.flush()
+        if self._queue is not None:
+            self._queue.join()
+        self._raise_background_error()
+
+    def _stop_workers(self):
+        if self._queue is not None:
+            for worker in self._workers:
+                self._queue.put(None)
+            for worker in self._workers:
+                worker.join()
+            self._queue = None
+            self._workers = []
 
     def close(self):
-        self.flush()
+        try:
+            self.wait()
+        finally:
+            self._stop_workers()
         self.restore_after_bulk_indexing()
 
     def flush_all_and_wait(self, index_name):
-        self.flush()
+        self.wait()
+        if self.output_folder:
+            return
         self.es.indices.flush(self.get_versioned_index(index_name), wait_if_ongoing=True)
 
     def __enter__(self):
@@ -127,7 +341,7 @@ class Loader():
         self.close()
 
     def prepare_for_bulk_indexing(self, index_name):
-        if not self.dry_run:
+        if not self.dry_run and not self.output_folder:
             old_cluster_settings = self.es.cluster.get_settings()
 
             #try to turn off throttling of indexes
@@ -220,6 +434,15 @@ class Loader():
     def create_new_index(self, index_name):
         if not self.dry_run:
             index_name = self.get_versioned_index(index_name)
+            if self.output_folder:
+                #created when the bulk files are loaded
+                with open(os.path.join(self.output_folder, self.INDEXES_FILENAME), 'a') as indexes:
+                    indexes.write(index_name + '\n')
+                return
+            self.create_versioned_index(index_name)
+
+    def create_versioned_index(self, index_name):
+        if not self.dry_run:
             if self.es.indices.exists(index_name):
                 res = self.es.indices.delete(index_name)
                 if not self._check_is_aknowledge(res):
@@ -2,6 +2,8 @@ import base64
 import collections
 import json
 import logging
+import Queue
+import threading
 import time
 from collections import Counter
 
@@ -38,13 +40,83 @@ class AssociationSummary(object):
 
 
 
+def merge_iterators(iterators, max_queued=10000):
+    '''iterate over all the iterators at the same time, each one consumed by
+    its own thread, yielding their items as they arrive. The first exception
+    raised by any of them is raised here'''
+    queue = Queue.Queue(max_queued)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return
+            except Queue.Full:
+                pass
+
+    def consume(iterator):
+        try:
+            for item in iterator:
+                put((None, item))
+                if stop.is_set():
+                    return
+        except Exception as e:
+            logging.getLogger(__name__).exception('failed to iterate')
+            put((e, None))
+        finally:
+            put((done, None))
+
+    threads = [threading.Thread(target=consume, args=(iterator,)) for iterator in iterators]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    try:
+        finished = 0
+        while finished < len(threads):
+            status, item = queue.get()
+            if status is done:
+                finished += 1
+            elif status is not None:
+                raise status
+            else:
+                yield item
+    finally:
+        #let the threads go if the caller stops early
+        stop.set()
+
+
 class ESQuery(object):
 
-    def __init__(self, es, dry_run = False):
+    def __init__(self, es, dry_run = False, slices = None):
         self.handler = es
         self.dry_run = dry_run
+        self.slices = slices
         self.logger = logging.getLogger(__name__)
 
+    def _scan(self, query, slices=None, **kwargs):
+        '''helpers.scan over a single scroll or, if more than one slice is
+        asked for here, in the constructor or in Config.ES_SCROLL_SLICES, over
+        a sliced scroll whose slices are read in parallel and merged in no
+        particular order'''
+        if slices is None:
+            slices = self.slices if self.slices is not None else Config.ES_SCROLL_SLICES
+        if slices <= 1:
+            return helpers.scan(client=self.handler, query=query, **kwargs)
+        return merge_iterators(self.scan_slices(query, slices, **kwargs))
+
+    def scan_slices(self, query, slices, **kwargs):
+        '''one lazy helpers.scan iterator for each slice of a sliced scroll,
+        for callers that consume each slice in a different worker'''
+        iterators = []
+        for i in range(slices):
+            sliced_query = dict(query)
+            sliced_query['slice'] = {'id': i, 'max': slices}
+            iterators.append(helpers.scan(client=self.handler, query=sliced_query, **kwargs))
+        return iterators
+
     @staticmethod
 
     def _get_source_from_fields(fields = None):
@@ -54,7 +126,7 @@ class ESQuery(object):
 
     def get_all_targets(self, fields = None):
         source = self._get_source_from_fields(fields)
-        res = helpers.scan(client=self.handler,
+        res = self._scan(
                             query={"query": {
                                       "match_all": {}
                                     },
@@ -84,7 +156,7 @@ class ESQuery(object):
 
     def get_all_diseases(self, fields = None):
         source = self._get_source_from_fields(fields)
-        res = helpers.scan(client=self.handler,
+        res = self._scan(
                             query={"query": {
                                       "match_all": {}
                                     },
@@ -102,7 +174,7 @@ class ESQuery(object):
     def get_all_eco(self, fields=None):
         source = self._get_source_from_fields(fields)
 
-        res = helpers.scan(client=self.handler,
+        res = self._scan(
                            query={"query": {
                                "match_all": {}
                            },
@@ -120,7 +192,7 @@ class ESQuery(object):
     def get_all_hpa(self, fields=None):
         source = self._get_source_from_fields(fields)
 
-        res = helpers.scan(client=self.handler,
+        res = self._scan(
                            query={"query": {
                                "match_all": {}
                             },
@@ -282,7 +354,7 @@ class ESQuery(object):
         :return: two dictionaries mapping target to disease  and the reverse
         '''
         self.logger.debug('scan es to get all diseases and targets')
-        res = helpers.scan(client=self.handler,
+        res = self._scan(
                            query={"query": {
                                "term": {
                                    "is_direct": True,
@@ -371,23 +443,91 @@ class ESQuery(object):
                                   )
         return res['hits']['total']
 
-    def get_all_target_ids_with_evidence_data(self):
-        #TODO: use an aggregation to get those with just data
-        res = helpers.scan(client=self.handler,
-                           query={"query": {
-                               "match_all": {}
-                           },
-                               '_source': False,
-                               'size': 100,
-                           },
-                           scroll='12h',
-                           doc_type=Const.ELASTICSEARCH_GENE_NAME_DOC_NAME,
-                           index=Loader.get_versioned_index(Const.ELASTICSEARCH_GENE_NAME_INDEX_NAME,True),
-                           timeout="30m",
-                           )
-        for target in res:
-            yield  target['_id']
+    def get_index_metrics(self, index_name, doc_type=None, query=None,
+                          terms=(), histograms=(), size=1000):
+        '''count the documents in an index and, in the same request, how many
+        of them have each value of the fields in terms and how many fall in
+        each bucket of the (field, interval) histograms. Returns the total
+        and a dict of field -> {bucket key: document count}'''
+        if query is None:
+            query = {"match_all": {}}
+        aggs = {}
+        for field in terms:
+            aggs[field] = {"terms": {"field": field, "size": size}}
+        for field, interval in histograms:
+            aggs[field] = {"histogram": {"field": field, "interval": interval}}
+        res = self.handler.search(index=Loader.get_versioned_index(index_name,True),
+                                  doc_type=doc_type,
+                                  body={"query": query,
+                                        '_source': False,
+                                        'size': 0,
+                                        'aggs': aggs,
+                                  }
+                                  )
+        buckets = {}
+        for field, agg in res.get('aggregations', {}).items():
+            buckets[field] = dict((b.get('key_as_string', b['key']), b['doc_count'])
+                                  for b in agg['buckets'])
+        return res['hits']['total'], buckets
+
+    def get_index_fingerprint(self, index_name):
+        '''identify the content of an index by its real name, the uuid of the
+        indices behind it and its number of documents, so anything derived
+        from it can be reused as long as this does not change'''
+        index = Loader.get_versioned_index(index_name,True)
+        settings = self.handler.indices.get_settings(index=index, name='index.uuid')
+        uuids = sorted(s['settings']['index']['uuid'] for s in settings.values())
+        return '%s:%s:%d' % (index, ','.join(uuids),
+                             self.count_elements_in_index(index_name))
 
+    def get_all_target_ids_with_evidence_data(self):
+        for target, count in self.get_target_evidence_counts():
+            yield target
+
+    def get_target_evidence_counts(self, partition_size=10000):
+        '''yield (target id, number of evidence) of each target with evidence, from
+        terms aggregations over target.id of the evidence index.
+
+        There is no composite aggregation in elasticsearch 5, so the terms are read
+        in partitions of about partition_size targets. If any partition turns out
+        to have more targets than that, the partitions are read again in twice as
+        many smaller ones'''
+        index = Loader.get_versioned_index(Const.ELASTICSEARCH_DATA_INDEX_NAME, True)
+        res = self.handler.search(index=index,
+                                  body={'query': {'match_all': {}},
+                                        '_source': False,
+                                        'size': 0,
+                                        'aggs': {'targets': {'cardinality': {'field': 'target.id'}}},
+                                  })
+        #the cardinality is approximate, so leave room in every partition
+        num_partitions = max(1, 2 * res['aggregations']['targets']['value'] // partition_size + 1)
+
+        while True:
+            counts = []
+            for partition in range(num_partitions):
+                res = self.handler.search(index=index,
+                                          body={'query': {'match_all': {}},
+                                                '_source': False,
+                                                'size': 0,
+                                                'aggs': {'targets': {'terms': {
+                                                    'field': 'target.id',
+                                                    'include': {'partition': partition,
+                                                                'num_partitions': num_partitions},
+                                                    'size': partition_size,
+                                                    'order': {'_term': 'asc'},
+                                                }}},
+                                          })
+                agg = res['aggregations']['targets']
+                if agg['sum_other_doc_count']:
+                    break
+                counts.extend((b['key'], b['doc_count']) for b in agg['buckets'])
+            else:
+                for target_count in counts:
+                    yield target_count
+                return
+            num_partitions *= 2
+            self.logger.debug('too many targets in a partition, retrying with %d partitions',
+                              num_partitions)
 
     def get_evidence_for_target_simple(self, target, expected = None):
         query_body = {
@@ -505,7 +645,7 @@ class ESQuery(object):
                     raise KeyError('object with id %s not found' % ids)
 
     def get_all_associations_ids(self,):
-        res = helpers.scan(client=self.handler,
+        res = self._scan(
                            query={"query": {
                                "match_all": {}
                            },
@@ -520,7 +660,7 @@ class ESQuery(object):
             yield hit['_id']
 
     def get_all_associations(self,):
-        res = helpers.scan(client=self.handler,
+        res = self._scan(
                            query={"query": {
                                "match_all": {}
                            },
@@ -536,7 +676,7 @@ class ESQuery(object):
 
     def get_all_target_disease_pair_from_evidence(self, only_direct=False):
 
-        res = helpers.scan(client=self.handler,
+        res = self._scan(
                            query={"query": {
                                     "match_all": {}
                                     },
@@ -636,7 +776,7 @@ class ESQuery(object):
     def get_all_evidence(self, fields = None):
         index_name = Loader.get_versioned_index(Const.ELASTICSEARCH_DATA_INDEX_NAME, True)
         doc_type = None
-        res = helpers.scan(client=self.handler,
+        res = self._scan(
                            query={"query":  {"match_all": {}},
                                '_source': self._get_source_from_fields(fields),
                                'size': 1000,
@@ -655,7 +795,7 @@ class ESQuery(object):
     def get_all_evidence_for_datatype(self, datatype, fields = None, ):
         # https://www.elastic.co/guide/en/elasticsearch/reference/current/docs-multi-get.html
         index_name = Loader.get_versioned_index(Const.ELASTICSEARCH_DATA_INDEX_NAME, True)
-        res = helpers.scan(client=self.handler,
+        res = self._scan(
             query={
                 "query": {
                     "match": {
@@ -76,3 +76,68 @@ class DatatStructureFlattener:
         '''
         ordered_dict = self.get_ordered_dict()
         return hashlib.md5(json.dumps(ordered_dict)).hexdigest()
+
+
+
+_encoder = json.JSONEncoder()
+_encode_string = json.encoder.encode_basestring_ascii
+_CONSTANTS = {None: 'null', True: 'true', False: 'false'}
+
+
+def _flatten(structure, path, flattened):
+    '''same as DatatStructureFlattener.flatten for a dict or a list, called
+    with the path its children are prefixed with'''
+    if type(structure) is dict:
+        items = structure.items()
+    else:
+        structure.sort()
+        items = zip(map(str, xrange(len(structure))), structure)
+
+    path = path + "->"
+    for key, value in items:
+        value_type = type(value)
+        if value_type is dict or value_type is list:
+            _flatten(value, path + key, flattened)
+        else:
+            flattened[path + key] = value
+
+
+def get_canonical_hexdigest(data_structure):
+    '''
+    Return the same hexadigest as DatatStructureFlattener(data_structure).get_hexdigest()
+    but writing the json of the flattened data structure straight away instead of
+    building an ordered dictionary and serialising it.
+
+    As DatatStructureFlattener does, lists in the data structure are sorted in
+    place and only exact dicts and lists are flattened, so e.g. an addict.Dict is
+    hashed as a single value.
+    '''
+    flattened = {}
+    if type(data_structure) in (dict, list):
+        _flatten(data_structure, "->", flattened)
+    else:
+        flattened[""] = data_structure
+
+    sorted_keys = sorted(flattened)
+    parts = []
+    cleaned_keys = set()
+    for key in sorted_keys:
+        cleaned_key = key.strip().replace('->->', '')
+        if cleaned_key in cleaned_keys:
+            #cleaning made some keys equal, let the ordered dictionary merge them
+            return DatatStructureFlattener(data_structure).get_hexdigest()
+        cleaned_keys.add(cleaned_key)
+
+        value = flattened[key]
+        value_type = type(value)
+        if value_type is unicode or value_type is str:
+            value = _encode_string(value)
+        elif value_type is int or value_type is long:
+            value = str(value)
+        elif value_type is bool or value is None:
+            value = _CONSTANTS[value]
+        else:
+            value = _encoder.encode(value)
+        parts.append(_encode_string(cleaned_key) + ': ' + value)
+
+    return hashlib.md5('{' + ', '.join(parts) + '}').hexdigest()
@@ -1,17 +1,18 @@
 import copy
-import json
 import logging
 import math
 
 import csv
 
-from mrtarget.Settings import Config, file_or_resource
+from mrtarget.Settings import Config
 from mrtarget.constants import Const
 from mrtarget.common.DataStructure import JSONSerializable, PipelineEncoder
+import mrtarget.common.JsonBackend as JsonBackend
 from mrtarget.common.IO import check_to_open, URLZSource
+from mrtarget.common.LookupTables import LookUpTableCache
 from mrtarget.modules import GeneData
 from mrtarget.modules.ECO import ECO, load_eco_scores_table
-from mrtarget.modules.EFO import EFO, get_ontology_code_from_url
+from mrtarget.modules.EFO import EFO
 from mrtarget.modules.GeneData import Gene
 
 logger = logging.getLogger(__name__)
@@ -67,10 +68,10 @@ class ExtendedInfo():
         raise NotImplementedError()
 
     def to_json(self):
-        return json.dumps(self.data)
+        return JsonBackend.dumps(self.data)
 
     def load_json(self, data):
-        self.data = json.loads(data)
+        self.data = JsonBackend.loads(data)
 
 
 class ExtendedInfoGene(ExtendedInfo):
@@ -129,14 +130,93 @@ class ExtendedInfoECO(ExtendedInfo):
                          label=eco.label),
 
 
+def make_gene_extension(gene):
+    '''
+    The parts of an extended evidence that only depend on its target, from a Gene:
+    the gene info and the reactome, go, uniprot keywords and target class facets.
+    The fragment is shared by all the evidence of the gene, so it must not be changed
+    '''
+    pathway_data = dict(pathway_type_code=[],
+                        pathway_code=[])
+    GO_terms = dict(biological_process=[],
+                    cellular_component=[],
+                    molecular_function=[],
+                    )
+    target_class = dict(level1=[],
+                        level2=[])
+    uniprot_keywords = []
+
+    if 'reactome' in gene._private['facets']:
+        pathway_data['pathway_type_code'].extend(gene._private['facets']['reactome']['pathway_type_code'])
+        pathway_data['pathway_code'].extend(gene._private['facets']['reactome']['pathway_code'])
+    if gene.go:
+        for go in gene.go:
+            go_code, data = go['id'], go['value']
+            try:
+                category, term = data['term'][0], data['term'][2:]
+                if category == 'P':
+                    GO_terms['biological_process'].append(dict(code=go_code,
+                                                               term=term))
+                elif category == 'F':
+                    GO_terms['molecular_function'].append(dict(code=go_code,
+                                                               term=term))
+                elif category == 'C':
+                    GO_terms['cellular_component'].append(dict(code=go_code,
+                                                               term=term))
+            except:
+                pass
+    if gene.uniprot_keywords:
+        uniprot_keywords = gene.uniprot_keywords
+
+    if pathway_data['pathway_code']:
+        pathway_data['pathway_type_code'] = list(set(pathway_data['pathway_type_code']))
+        pathway_data['pathway_code'] = list(set(pathway_data['pathway_code']))
+    if 'chembl' in gene.protein_classification and gene.protein_classification['chembl']:
+        target_class['level1'].append([i['l1'] for i in gene.protein_classification['chembl'] if 'l1' in i])
+        target_class['level2'].append([i['l2'] for i in gene.protein_classification['chembl'] if 'l2' in i])
+
+    facets = {}
+    if pathway_data['pathway_code']:
+        facets['reactome'] = pathway_data
+    if uniprot_keywords:
+        facets['uniprot_keywords'] = uniprot_keywords
+    if GO_terms['biological_process'] or \
+            GO_terms['molecular_function'] or \
+            GO_terms['cellular_component']:
+        facets['go'] = GO_terms
+    if target_class['level1']:
+        facets['target_class'] = target_class
+
+    return dict(gene_info=ExtendedInfoGene(gene).data,
+                facets=facets)
+
+
+def make_efo_extension(efo):
+    '''
+    The parts of an extended evidence that only depend on its disease, from an EFO:
+    the efo info and the codes of all the terms in its paths. The fragment is shared
+    by all the evidence of the disease, so it must not be changed
+    '''
+    efo_info = ExtendedInfoEFO(efo)
+    all_efo_codes = []
+    for path in efo_info.data['path']:
+        all_efo_codes.extend(path)
+    return dict(efo_info=efo_info.data,
+                efo_codes=list(set(all_efo_codes)))
+
+
 class EvidenceManager():
+    #extension fragments of up to this many genes and diseases are kept by each process
+    MAX_EXTENSIONS = 50000
+
     def __init__(self, lookup_data, eco_scores_uri, excluded_biotypes, datasources_to_datatypes):
         self.logger = logging.getLogger(__name__)
-        self.available_genes = lookup_data.available_genes
-        self.available_efos = lookup_data.available_efos
-        self.available_ecos = lookup_data.available_ecos
-        self.uni2ens = lookup_data.uni2ens
-        self.non_reference_genes = lookup_data.non_reference_genes
+        self._gene_extensions = {}
+        self._efo_extensions = {}
+        self.available_genes = LookUpTableCache(lookup_data.available_genes)
+        self.available_efos = LookUpTableCache(lookup_data.available_efos)
+        self.available_ecos = LookUpTableCache(lookup_data.available_ecos)
+        self.id_resolver = lookup_data.get_id_resolver()
         self._get_eco_scoring_values(self.available_ecos, eco_scores_uri)
         self.uni_header = GeneData.UNI_ID_ORG_PREFIX
         self.ens_header = GeneData.ENS_ID_ORG_PREFIX
@@ -222,19 +302,18 @@ class EvidenceManager():
 
         # Remove identifiers.org from genes and map to ensembl ids
         EvidenceManager.fix_target_id(evidence,
-                                      self.uni2ens,
-                                      self.available_genes,
-                                      self.non_reference_genes
+                                      self.id_resolver,
+                                      self.available_genes
                                       )
 
         # Remove identifiers.org from cttv activity  and target type ids
         if 'target_type' in evidence['target']:
-            evidence['target']['target_type'] = evidence['target']['target_type'].split('/')[-1]
+            evidence['target']['target_type'] = self.id_resolver.get_code(evidence['target']['target_type'])
         if 'activity' in evidence['target']:
-            evidence['target']['activity'] = evidence['target']['activity'].split('/')[-1]
+            evidence['target']['activity'] = self.id_resolver.get_code(evidence['target']['activity'])
 
         # Remove identifiers.org from efos
-        EvidenceManager.fix_disease_id(evidence)
+        EvidenceManager.fix_disease_id(evidence, self.id_resolver)
 
         # Remove identifiers.org from ecos
         new_eco_ids = []
@@ -254,7 +333,7 @@ class EvidenceManager():
             eco_ids = []  # something wrong here...
         eco_ids = list(set(eco_ids))
         for idorg_eco_uri in eco_ids:
-            code = get_ontology_code_from_url(idorg_eco_uri.strip())
+            code = self.id_resolver.get_ontology_code(idorg_eco_uri.strip())
             if code is not None:
                 # if len(code.split('_')) != 2:
                 # self.logger.warning("could not recognize evidence code: %s in id %s | added anyway" %(evidence['id'],
@@ -268,25 +347,22 @@ class EvidenceManager():
         return Evidence(evidence,self.datasources_to_datatypes), fixed
 
     @staticmethod
-    def normalise_target_id(evidence, uni2ens, available_genes,non_reference_genes ):
+    def normalise_target_id(evidence, id_resolver, available_genes):
 
         target_id = evidence['target']['id']
         new_target_id = None
         id_not_in_ensembl = False
         try:
-            if target_id.startswith(GeneData.UNI_ID_ORG_PREFIX):
-                if '-' in target_id:
-                    target_id = target_id.split('-')[0]
-                uniprotid = target_id.split(GeneData.UNI_ID_ORG_PREFIX)[1].strip()
-                ensemblid = uni2ens[uniprotid]
+            id_type, target_code = id_resolver.parse_target_url(target_id)
+            if id_type == 'uniprot':
+                ensemblid = id_resolver.get_ensembl_gene(target_code)
                 new_target_id = EvidenceManager.get_reference_ensembl_id(ensemblid,
                                                                          available_genes=available_genes,
-                                                                         non_reference_genes=non_reference_genes)
-            elif target_id.startswith(GeneData.ENS_ID_ORG_PREFIX):
-                ensemblid = target_id.split(GeneData.ENS_ID_ORG_PREFIX)[1].strip()
-                new_target_id = EvidenceManager.get_reference_ensembl_id(ensemblid,
+                                                                         id_resolver=id_resolver)
+            elif id_type == 'ensembl':
+                new_target_id = EvidenceManager.get_reference_ensembl_id(target_code,
                                                                          available_genes=available_genes,
-                                                                         non_reference_genes=non_reference_genes)
+                                                                         id_resolver=id_resolver)
             else:
                 logger.warning("could not recognize target.id: %s | not added" % target_id)
                 id_not_in_ensembl = True
@@ -306,14 +382,13 @@ class EvidenceManager():
         return is_excluded
 
     @staticmethod
-    def fix_target_id(evidence,uni2ens, available_genes, non_reference_genes, logger=logging.getLogger(__name__)) :
+    def fix_target_id(evidence, id_resolver, available_genes, logger=logging.getLogger(__name__)) :
         target_id = evidence['target']['id']
 
         try:
             new_target_id, id_not_in_ensembl = EvidenceManager.normalise_target_id(evidence,
-                                                                                   uni2ens,
-                                                                                   available_genes,
-                                                                                   non_reference_genes)
+                                                                                   id_resolver,
+                                                                                   available_genes)
         except KeyError:
             logger.error("cannot find an ensembl ID for: %s" % target_id)
             id_not_in_ensembl = True
@@ -326,9 +401,9 @@ class EvidenceManager():
         evidence['target']['id'] = new_target_id
 
     @staticmethod
-    def fix_disease_id(evidence, logger=logging.getLogger(__name__)):
+    def fix_disease_id(evidence, id_resolver, logger=logging.getLogger(__name__)):
         disease_id = evidence['disease']['id']
-        new_disease_id = get_ontology_code_from_url(disease_id)
+        new_disease_id = id_resolver.get_ontology_code(disease_id)
         if len(new_disease_id.split('_')) != 2:
             logger.warning("could not recognize disease.id: %s | added anyway" % disease_id)
         evidence['disease']['id'] = new_disease_id
@@ -393,75 +468,20 @@ class EvidenceManager():
         extended_evidence['private'] = dict()
 
         # Get generic gene info
-        genes_info = []
-        pathway_data = dict(pathway_type_code=[],
-                            pathway_code=[])
-        GO_terms = dict(biological_process=[],
-                        cellular_component=[],
-                        molecular_function=[],
-                        )
-        target_class = dict(level1=[],
-                            level2=[])
-        uniprot_keywords = []
-        # TODO: handle domains
-        geneid = extended_evidence['target']['id']
-        # try:
-        gene = self._get_gene_obj(geneid)
-        genes_info = ExtendedInfoGene(gene)
-        if 'reactome' in gene._private['facets']:
-            pathway_data['pathway_type_code'].extend(gene._private['facets']['reactome']['pathway_type_code'])
-            pathway_data['pathway_code'].extend(gene._private['facets']['reactome']['pathway_code'])
-            # except Exception:
-            #     self.logger.warning("Cannot get generic info for gene: %s" % aboutid)
-        if gene.go:
-            for go in gene.go:
-                go_code, data = go['id'], go['value']
-                try:
-                    category, term = data['term'][0], data['term'][2:]
-                    if category == 'P':
-                        GO_terms['biological_process'].append(dict(code=go_code,
-                                                                   term=term))
-                    elif category == 'F':
-                        GO_terms['molecular_function'].append(dict(code=go_code,
-                                                                   term=term))
-                    elif category == 'C':
-                        GO_terms['cellular_component'].append(dict(code=go_code,
-                                                                   term=term))
-                except:
-                    pass
-        if gene.uniprot_keywords:
-            uniprot_keywords = gene.uniprot_keywords
-
-        if genes_info:
-            extended_evidence["target"][ExtendedInfoGene.root] = genes_info.data
-
-        if pathway_data['pathway_code']:
-            pathway_data['pathway_type_code'] = list(set(pathway_data['pathway_type_code']))
-            pathway_data['pathway_code'] = list(set(pathway_data['pathway_code']))
-        if 'chembl' in gene.protein_classification and gene.protein_classification['chembl']:
-            target_class['level1'].append([i['l1'] for i in gene.protein_classification['chembl'] if 'l1' in i])
-            target_class['level2'].append([i['l2'] for i in gene.protein_classification['chembl'] if 'l2' in i])
+        gene_extension = self._get_gene_extension(extended_evidence['target']['id'])
+        extended_evidence["target"][ExtendedInfoGene.root] = gene_extension['gene_info']
 
         # Get generic efo info
-        # can it happen you get no efo codes but just one disease?
-        all_efo_codes = []
-        diseaseid = extended_evidence['disease']['id']
-        efo = self._get_efo_obj(diseaseid)
-        efo_info = ExtendedInfoEFO(efo)
-
-        if efo_info:
-            for path in efo_info.data['path']:
-                all_efo_codes.extend(path)
-            extended_evidence["disease"][ExtendedInfoEFO.root] = efo_info.data
-
-        all_efo_codes = list(set(all_efo_codes))
+        efo_extension = self._get_efo_extension(extended_evidence['disease']['id'])
+        extended_evidence["disease"][ExtendedInfoEFO.root] = efo_extension['efo_info']
+        all_efo_codes = list(efo_extension['efo_codes'])
 
         # Get generic eco info
         try:
             all_eco_codes = extended_evidence['evidence']['evidence_codes']
             try:
                 all_eco_codes.append(
-                    get_ontology_code_from_url(extended_evidence['evidence']['gene2variant']['functional_consequence']))
+                    self.id_resolver.get_ontology_code(extended_evidence['evidence']['gene2variant']['functional_consequence']))
             except KeyError:
                 pass
             ecos_info = []
@@ -487,21 +507,66 @@ class EvidenceManager():
         extended_evidence['private']['eco_codes'] = all_eco_codes
         extended_evidence['private']['datasource'] = evidence.datasource
         extended_evidence['private']['datatype'] = evidence.datatype
-        extended_evidence['private']['facets'] = {}
-        if pathway_data['pathway_code']:
-            extended_evidence['private']['facets']['reactome'] = pathway_data
-        if uniprot_keywords:
-            extended_evidence['private']['facets']['uniprot_keywords'] = uniprot_keywords
-        if GO_terms['biological_process'] or \
-                GO_terms['molecular_function'] or \
-                GO_terms['cellular_component']:
-            extended_evidence['private']['facets']['go'] = GO_terms
-
-        if target_class['level1']:
-            extended_evidence['private']['facets']['target_class'] = target_class
+        extended_evidence['private']['facets'] = dict(gene_extension['facets'])
 
         return Evidence(extended_evidence, self.datasources_to_datatypes)
 
+    def prefetch_genes(self, evidences):
+        '''get with a single round trip the genes referred by a chunk of
+        evidence objects that have not been fixed yet'''
+        gene_ids = []
+        for evidence in evidences:
+            id_type, target_code = self.id_resolver.parse_target_url(evidence.evidence['target']['id'])
+            if id_type == 'ensembl':
+                gene_ids.append(target_code)
+            elif id_type == 'uniprot':
+                gene_ids.append(self.id_resolver.uni2ens.get(target_code))
+        self.available_genes.prefetch(gene_ids)
+
+    def prefetch_diseases_and_ecos(self, evidences):
+        '''get with a single round trip per lookup table the efos and ecos
+        referred by a chunk of already fixed evidence objects'''
+        efo_ids = []
+        eco_ids = []
+        for evidence in evidences:
+            ev = evidence.evidence
+            efo_ids.append(ev['disease']['id'])
+            eco_ids.extend(ev['evidence'].get('evidence_codes', []))
+            try:
+                eco_ids.append(self.id_resolver.get_ontology_code(
+                    ev['evidence']['gene2variant']['functional_consequence']))
+            except KeyError:
+                pass
+        self.available_efos.prefetch(efo_ids)
+        self.available_ecos.prefetch(eco_ids)
+
+    def clear_prefetched(self):
+        self.available_genes.clear()
+        self.available_efos.clear()
+        self.available_ecos.clear()
+
+    def _get_gene_extension(self, geneid):
+        '''the extension fragment of a gene, built once per process and then
+        shared by all its evidence'''
+        try:
+            return self._gene_extensions[geneid]
+        except KeyError:
+            if len(self._gene_extensions) >= self.MAX_EXTENSIONS:
+                self._gene_extensions.clear()
+            extension = self._gene_extensions[geneid] = make_gene_extension(self._get_gene_obj(geneid))
+            return extension
+
+    def _get_efo_extension(self, efoid):
+        '''the extension fragment of a disease, built once per process and then
+        shared by all its evidence'''
+        try:
+            return self._efo_extensions[efoid]
+        except KeyError:
+            if len(self._efo_extensions) >= self.MAX_EXTENSIONS:
+                self._efo_extensions.clear()
+            extension = self._efo_extensions[efoid] = make_efo_extension(self._get_efo_obj(efoid))
+            return extension
+
     def _get_gene_obj(self, geneid):
         gene = Gene(geneid)
         gene.load_json(self.available_genes[geneid])
@@ -520,32 +585,10 @@ class EvidenceManager():
         except KeyError:
             return None
 
-    def _get_non_reference_gene_mappings(self):
-        self.non_reference_genes = {}
-        skip_header = True
-        for line in file(file_or_resource('genes_with_non_reference_ensembl_ids.tsv')):
-            if skip_header:
-                skip_header = False
-            symbol, ensg, assembly, chr, is_ref = line.split()
-            if symbol not in self.non_reference_genes:
-                self.non_reference_genes[symbol] = dict(reference='',
-                                                        alternative=[])
-            if is_ref == 't':
-                self.non_reference_genes[symbol]['reference'] = ensg
-            else:
-                self.non_reference_genes[symbol]['alternative'].append(ensg)
-
-    @staticmethod
-    def _map_to_reference_ensembl_gene(ensg, non_reference_genes, logger=logging.getLogger(__name__)):
-        for symbol, data in non_reference_genes.items():
-            if ensg in data['alternative']:
-                logger.warning(
-                    "Mapped non reference ensembl gene id %s to %s for gene %s" % (ensg, data['reference'], symbol))
-                return data['reference']
     @staticmethod
-    def get_reference_ensembl_id(ensemblid, available_genes, non_reference_genes):
+    def get_reference_ensembl_id(ensemblid, available_genes, id_resolver):
         if ensemblid not in available_genes:
-            ensemblid = EvidenceManager._map_to_reference_ensembl_gene(ensemblid, non_reference_genes) or ensemblid
+            ensemblid = id_resolver.get_reference_gene(ensemblid) or ensemblid
         return ensemblid
 
     def _get_eco_scoring_values(self, eco_lut_obj, eco_scores_uri):
@@ -578,13 +621,13 @@ class Evidence(JSONSerializable):
         return self.evidence['id']
 
     def to_json(self):
-        return json.dumps(self.evidence,
+        return JsonBackend.dumps(self.evidence,
                           sort_keys=True,
                           # indent=4,
                           cls=PipelineEncoder)
 
     def load_json(self, data):
-        self.evidence = json.loads(data)
+        self.evidence = JsonBackend.loads(data)
 
     def score_evidence(self, modifiers={}):
         self.evidence['scores'] = dict(association_score=0.,
@@ -0,0 +1,95 @@
+import logging
+
+import opentargets_validator.helpers
+
+
+def _get_type_values(schema, resolver):
+    '''
+    Returns the set of values the "type" property of an evidence can take in
+    schema, from its "const" or "enum", or None if the schema does not restrict it
+    '''
+    if '$ref' in schema:
+        with resolver.resolving(schema['$ref']) as resolved:
+            return _get_type_values(resolved, resolver)
+
+    type_schema = schema.get('properties', {}).get('type')
+    while type_schema is not None and '$ref' in type_schema:
+        #resolve here as the property schema may be in another file
+        type_schema = resolver.resolve(type_schema['$ref'])[1]
+    if type_schema is not None:
+        if 'const' in type_schema:
+            return set([type_schema['const']])
+        if 'enum' in type_schema:
+            return set(type_schema['enum'])
+
+    for sub_schema in schema.get('allOf', []):
+        values = _get_type_values(sub_schema, resolver)
+        if values is not None:
+            return values
+    return None
+
+
+class EvidenceValidator(object):
+    '''
+    Validates evidence against the whole schema as its `validator` does, but
+    first against only the branch of the schema for the "type" of the evidence.
+
+    The schema is expected to list one branch per evidence type in a top level
+    oneOf or anyOf. If the branch of the evidence type passes, so would the whole
+    schema, and no other branch is tried. Otherwise the whole schema is run, so
+    errors are the same as with `validator`. Evidence types that are not
+    restricted to a single branch are always validated with the whole schema.
+    '''
+
+    def __init__(self, validator):
+        self.logger = logging.getLogger(__name__)
+        self.validator = validator
+        self.type_validators = self._make_type_validators(validator)
+        self.logger.debug('validators for evidence types %s',
+                          ', '.join(sorted(self.type_validators)))
+
+    @staticmethod
+    def _make_type_validators(validator):
+        schema = validator.schema
+        keyword = 'oneOf' if 'oneOf' in schema else 'anyOf' if 'anyOf' in schema else None
+        if keyword is None:
+            return {}
+
+        branches = {}
+        for branch in schema[keyword]:
+            values = _get_type_values(branch, validator.resolver)
+            if values is None:
+                if keyword == 'oneOf':
+                    #any evidence could match this branch too, so none can skip the others
+                    return {}
+                continue
+            for value in values:
+                branches.setdefault(value, []).append(branch)
+
+        type_validators = {}
+        for value, value_branches in branches.items():
+            if len(value_branches) != 1:
+                continue
+            #the whole schema with only this branch in place of the alternatives
+            type_schema = dict((k, v) for k, v in schema.items() if k != keyword)
+            type_schema['allOf'] = list(schema.get('allOf', [])) + value_branches
+            type_validators[value] = validator.__class__(type_schema,
+                                                         resolver=validator.resolver)
+        return type_validators
+
+    def iter_errors(self, instance):
+        type_validator = None
+        if isinstance(instance, dict):
+            type_validator = self.type_validators.get(instance.get('type'))
+
+        if type_validator is not None and type_validator.is_valid(instance):
+            return iter([])
+        return self.validator.iter_errors(instance)
+
+    def is_valid(self, instance):
+        return next(self.iter_errors(instance), None) is None
+
+
+def generate_validator_from_schema(schema_uri):
+    return EvidenceValidator(
+        opentargets_validator.helpers.generate_validator_from_schema(schema_uri))
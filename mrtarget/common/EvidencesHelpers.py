@@ -1,15 +1,16 @@
-import json
 import os
 import logging
 import functools
 import uuid
-import addict
+import collections
 
-from mrtarget.common.DataStructure import JSONSerializable
+from mrtarget.common.DataStructure import JSONSerializable, PipelineEncoder
 from mrtarget.common.ElasticsearchLoader import Loader
+from mrtarget.common.ScoreSidecar import ScoreSidecarWriter, get_score_row
 from mrtarget.common.connection import new_es_client
 from mrtarget.constants import Const
 import mrtarget.common.IO as IO
+import mrtarget.common.JsonBackend as JsonBackend
 
 def serialise_object_to_json(obj):
     serialised_obj = obj
@@ -17,18 +18,116 @@ def serialise_object_to_json(obj):
         if isinstance(obj, JSONSerializable):
             serialised_obj = obj.to_json()
         else:
-            serialised_obj = json.dumps(obj)
+            serialised_obj = JsonBackend.dumps(obj)
 
     return serialised_obj
 
 
+class ValidatedEvidence(object):
+    """
+    The result of validating one line of evidence, with the parsed evidence in
+    `evidence` while it is valid. Attributes that were never set, like
+    `data_source` of a line that could not be parsed, are left out of its json.
+
+    Pickles as a tuple of its attributes, so it is cheap to send to the writers
+    """
+    __slots__ = ('is_valid', 'explanation_type', 'explanation_str', 'target_id', 'efo_id',
+                 'data_type', 'data_source', 'id', 'line', 'line_n', 'filename', 'hash',
+                 'evidence')
+
+    def __init__(self, filename, hash, line, line_n, is_valid=False, explanation_type='',
+                 explanation_str='', target_id=None, efo_id=None, data_type=None, id=None):
+        self.is_valid = is_valid
+        self.explanation_type = explanation_type
+        self.explanation_str = explanation_str
+        self.target_id = target_id
+        self.efo_id = efo_id
+        self.data_type = data_type
+        self.id = id
+        self.line = line
+        self.line_n = line_n
+        self.filename = filename
+        self.hash = hash
+
+    def __getstate__(self):
+        return tuple(getattr(self, name, _UNSET) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            if value is not _UNSET:
+                setattr(self, name, value)
+
+    def to_dict(self):
+        return dict((name, getattr(self, name)) for name in self.__slots__
+            if name != 'evidence' and hasattr(self, name))
+
+    def to_json(self):
+        return JsonBackend.dumps(self.to_dict())
+
+
+class _Unset(object):
+    """marks the attributes of a pickled ValidatedEvidence that were not set"""
+    def __reduce__(self):
+        return '_UNSET'
+
+_UNSET = _Unset()
+
+
+"""
+What validators can send to writers instead of ValidatedEvidence when only
+the serialised document is needed, `id` being the id of the document and
+`score_row` the EvidenceScoreRow of a valid one
+"""
+SerialisedEvidence = collections.namedtuple('SerialisedEvidence', ['id', 'body', 'score_row'])
+SerialisedEvidence.__new__.__defaults__ = (None,)
+
+
+def serialise_valid_evidence(validated_evs):
+    """json of the fixed, scored and extended evidence of a valid line, as
+    Evidence.to_json writes it"""
+    return JsonBackend.dumps(validated_evs.evidence, sort_keys=True, cls=PipelineEncoder)
+
+
+def get_valid_id_and_body(right):
+    """id and json of the document of a valid evidence"""
+    if isinstance(right, SerialisedEvidence):
+        return right.id, right.body
+    return right.hash, serialise_valid_evidence(right)
+
+
+def get_invalid_id_and_body(left):
+    """id and json of the document of an invalid evidence"""
+    if isinstance(left, SerialisedEvidence):
+        return left.id, left.body
+    return left.id, left.to_json()
+
+
+def serialise_result(result):
+    """replace the ValidatedEvidence of a (left, right) result by their
+    SerialisedEvidence, so validators can send only those to the writers"""
+    (left, right) = result
+    if left is not None:
+        left = SerialisedEvidence(*get_invalid_id_and_body(left))
+    if right is not None:
+        right = SerialisedEvidence(*get_valid_id_and_body(right),
+                                   score_row=get_valid_score_row(right))
+    return left, right
+
+
+def get_valid_score_row(right):
+    """EvidenceScoreRow of a valid evidence"""
+    if isinstance(right, SerialisedEvidence):
+        return right.score_row
+    return get_score_row(right.evidence, right.hash)
+
+
 def reduce_tuple_with_sum(iterable):
     return functools.reduce(lambda x, y: (x[0] + y[0], x[1] + y[1]), iterable, (0, 0))
 
 
 def make_validated_evs_obj(filename, hash, line, line_n, is_valid=False, explanation_type='', explanation_str='',
                            target_id=None, efo_id=None, data_type=None, id=None):
-    return addict.Dict(is_valid=is_valid, explanation_type=explanation_type, explanation_str=explanation_str,
+    return ValidatedEvidence(is_valid=is_valid, explanation_type=explanation_type, explanation_str=explanation_str,
                        target_id=target_id, efo_id=efo_id, data_type=data_type, id=id, line=line, line_n=line_n,
                        filename=filename, hash=hash)
 
@@ -67,13 +166,15 @@ def elasticsearch_main(line, es_loader):
     (left, right) = line
     if right is not None:
         #valid
-        es_loader.put(body=right['line'], ID=right['hash'],
+        (ID, body) = get_valid_id_and_body(right)
+        es_loader.put(body=body, ID=ID,
             index_name=Const.ELASTICSEARCH_DATA_INDEX_NAME,
             doc_type=Const.ELASTICSEARCH_DATA_DOC_NAME)
         return (0,1)
     elif left is not None:
         #invalid
-        es_loader.put(body=serialise_object_to_json(left), ID=left['id'],
+        (ID, body) = get_invalid_id_and_body(left)
+        es_loader.put(body=body, ID=ID,
             index_name=Const.ELASTICSEARCH_VALIDATED_DATA_INDEX_NAME,
             doc_type=Const.ELASTICSEARCH_VALIDATED_DATA_DOC_NAME)
         return (1,0)
@@ -145,10 +246,10 @@ from the local init function as additional arguments.
 def file_main(line, valids_file_handle, invalids_file_handle):
     (left, right) = line
     if right is not None:
-        valids_file_handle.writelines(right['line'] + os.linesep)
+        valids_file_handle.writelines(get_valid_id_and_body(right)[1] + os.linesep)
         return (0,1)
     elif left is not None:
-        invalids_file_handle.writelines(serialise_object_to_json(left) + os.linesep)
+        invalids_file_handle.writelines(get_invalid_id_and_body(left)[1] + os.linesep)
         return (1,0)
 
 
@@ -161,12 +262,42 @@ def file_local_shutdown(status, valids_file_handle, invalids_file_handle):
     valids_file_handle.close()
     invalids_file_handle.close()
 
+"""
+This function is called once in each child process to do local setup for
+writing with local_init and also keeping the scores of the valid evidence
+"""
+def score_sidecar_local_init(local_init, scores_folder):
+    writer_state = local_init() if local_init else ()
+    if not isinstance(writer_state, tuple):
+        writer_state = (writer_state,)
+    return writer_state + (ScoreSidecarWriter(scores_folder),)
+
+"""
+This function is called on every item within the child processess, writing it
+with main and keeping its scores if it is valid
+"""
+def score_sidecar_main(main, line, *writer_state):
+    (left, right) = line
+    if right is not None:
+        writer_state[-1].add(get_valid_score_row(right))
+    return main(line, *writer_state[:-1])
+
+"""
+This function is called once in each child process to write the scores it kept
+and do the local cleanup of local_shutdown
+"""
+def score_sidecar_local_shutdown(local_shutdown, status, *writer_state):
+    writer_state[-1].close()
+    if local_shutdown:
+        local_shutdown(status, *writer_state[:-1])
+
 """
 If dry_run : do a dry run
 If not dry_run and es_hosts : write to ES
 if not dry_run and not_es_hosts and output_folder : write to disk
+If scores_folder : also write the scores of valid evidence there
 """
-def setup_writers(dry_run, es_hosts, output_folder):
+def setup_writers(dry_run, es_hosts, output_folder, scores_folder=None):
     global_init = None
     local_init = None
     main = None
@@ -193,4 +324,10 @@ def setup_writers(dry_run, es_hosts, output_folder):
     else:
         raise ValueError("Must specify one of dry_run, es_hosts, output_folder")
 
+    if scores_folder:
+        #each writer also keeps the scores of the valid evidence for --as
+        local_init = functools.partial(score_sidecar_local_init, local_init, scores_folder)
+        main = functools.partial(score_sidecar_main, main)
+        local_shutdown = functools.partial(score_sidecar_local_shutdown, local_shutdown)
+
     return global_init, local_init, main, local_shutdown, global_shutdown
@@ -1,5 +1,6 @@
 import functools
 import more_itertools
+import io
 import itertools
 import gzip
 import logging
@@ -62,3 +63,68 @@ def make_iter_lines(iterable_of_filenames, first_n=0):
 
     return more_itertools.take(first_n, it_lines) \
         if first_n > 0 else it_lines
+
+
+def make_partitions(iterable_of_filenames, partition_size=0):
+    """return a list of (filename, start, end) byte ranges to read the files in parallel.
+
+    Local uncompressed files bigger than `partition_size` bytes are split in
+    ranges of that size. Compressed or remote files can only be read from the
+    start, so they are a single (filename, 0, None) partition. If `partition_size`
+    is 0 no file is split.
+    """
+    partitions = []
+    for filename in iterable_of_filenames:
+        url_name = urllify(filename)
+        local_name = url_name[len('file://'):] if url_name.startswith('file://') else None
+
+        if partition_size > 0 and local_name is not None and \
+                not local_name.endswith(('.gz', '.zip')):
+            size = os.path.getsize(local_name)
+            if size > partition_size:
+                _l.debug('split %s of %d bytes in partitions of %d bytes',
+                    filename, size, partition_size)
+                partitions.extend((filename, start, min(start + partition_size, size))
+                    for start in xrange(0, size, partition_size))
+                continue
+
+        partitions.append((filename, 0, None))
+
+    return partitions
+
+
+def iter_partition_lines(partition, first_n=0):
+    """return an iterator of lines for a partition made by `make_partitions`, in the
+    same shape as `make_iter_lines`. A partition holds the lines that start inside
+    its byte range.
+
+    Line numbers of a partition that does not begin at the start of its file are
+    counted from the partition, and its filename is suffixed with @start so the line
+    can still be found.
+    """
+    (filename, start, end) = partition
+    if end is None:
+        it = open_to_read(filename)
+        return itertools.islice(it, first_n) if first_n > 0 else it
+
+    return _iter_range_lines(filename, start, end, first_n)
+
+
+def _iter_range_lines(filename, start, end, first_n=0):
+    url_name = urllify(filename)
+    with io.open(url_name[len('file://'):], 'rb',
+            buffering=URLZSource.BUFFER_SIZE) as fd:
+        position = start
+        if start > 0:
+            #skip the line that started in the previous partition, if any
+            fd.seek(start - 1)
+            position = start - 1 + len(fd.readline())
+            filename = '%s@%d' % (filename, start)
+
+        line_n = 0
+        for line in fd:
+            if position >= end or (first_n > 0 and line_n >= first_n):
+                break
+            line_n += 1
+            position += len(line)
+            yield filename, (line_n, line)
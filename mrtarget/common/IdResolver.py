@@ -0,0 +1,117 @@
+import logging
+
+from mrtarget.Settings import file_or_resource
+from mrtarget.modules import GeneData
+from mrtarget.modules.EFO import get_ontology_code_from_url
+
+
+NON_REFERENCE_GENES_FILENAME = 'genes_with_non_reference_ensembl_ids.tsv'
+
+
+def load_non_reference_genes(filename=NON_REFERENCE_GENES_FILENAME):
+    '''
+    Parse the table of genes with non reference ensembl ids into a dict of
+    {symbol: {'reference': ensg, 'alternative': [ensg, ...]}}
+    '''
+    non_reference_genes = {}
+    with open(file_or_resource(filename)) as non_reference_file:
+        next(non_reference_file)
+        for line in non_reference_file:
+            if not line.strip():
+                continue
+            symbol, ensg, assembly, chr, is_ref = line.split()
+            if symbol not in non_reference_genes:
+                non_reference_genes[symbol] = dict(reference='', alternative=[])
+            if is_ref == 't':
+                non_reference_genes[symbol]['reference'] = ensg
+            else:
+                non_reference_genes[symbol]['alternative'].append(ensg)
+    return non_reference_genes
+
+
+class IdResolver(object):
+    '''
+    Resolves the target and disease identifiers of evidence with hash maps built
+    once from the lookup data:
+
+    - alternative (non reference) ensembl gene id to its reference gene id
+    - uniprot accession to ensembl gene id
+    - identifiers.org and ontology urls to their short codes, memoised as the
+      same few thousand urls are repeated over millions of evidence
+    '''
+
+    #the memoised urls are forgotten once there are this many of one kind
+    MAX_MEMO_SIZE = 100000
+
+    def __init__(self, uni2ens, non_reference_genes):
+        self.logger = logging.getLogger(__name__)
+        self.uni2ens = uni2ens if uni2ens is not None else {}
+
+        self.alternative_to_reference = {}
+        self.alternative_to_symbol = {}
+        for symbol, data in (non_reference_genes or {}).items():
+            for ensg in data['alternative']:
+                self.alternative_to_reference[ensg] = data['reference']
+                self.alternative_to_symbol[ensg] = symbol
+
+        self._codes = {}
+        self._ontology_codes = {}
+        self._target_urls = {}
+
+    @classmethod
+    def from_lookup_data(cls, lookup_data):
+        return cls(lookup_data.uni2ens, lookup_data.non_reference_genes)
+
+    def _memoised(self, memo, f, key):
+        try:
+            return memo[key]
+        except KeyError:
+            if len(memo) >= self.MAX_MEMO_SIZE:
+                memo.clear()
+            value = memo[key] = f(key)
+            return value
+
+    def is_non_reference_gene(self, ensg):
+        return ensg in self.alternative_to_reference
+
+    def get_reference_gene(self, ensg):
+        '''the reference gene id of a non reference ensembl gene id, or None'''
+        reference = self.alternative_to_reference.get(ensg)
+        if reference is not None:
+            self.logger.warning("Mapped non reference ensembl gene id %s to %s for gene %s",
+                                ensg, reference, self.alternative_to_symbol[ensg])
+        return reference
+
+    def has_uniprot(self, uniprot_id):
+        return uniprot_id in self.uni2ens
+
+    def get_ensembl_gene(self, uniprot_id):
+        '''the ensembl gene id of a uniprot accession, raises KeyError if unknown'''
+        return self.uni2ens[uniprot_id]
+
+    def get_code(self, url):
+        '''the last part of the path of an url, e.g. the id of an identifiers.org url'''
+        return self._memoised(self._codes, _get_last_path_part, url)
+
+    def get_ontology_code(self, url):
+        '''the short ontology code of an ontology term url, e.g. EFO_0000270'''
+        return self._memoised(self._ontology_codes, get_ontology_code_from_url, url)
+
+    def parse_target_url(self, target_id):
+        '''
+        Returns ('uniprot', accession) or ('ensembl', gene id) for an identifiers.org
+        target url, dropping any uniprot isoform, or (None, None) for any other target id
+        '''
+        return self._memoised(self._target_urls, _parse_target_url, target_id)
+
+
+def _get_last_path_part(url):
+    return url.split('/')[-1]
+
+
+def _parse_target_url(target_id):
+    if target_id.startswith(GeneData.UNI_ID_ORG_PREFIX):
+        return 'uniprot', target_id.split('-')[0][len(GeneData.UNI_ID_ORG_PREFIX):].strip()
+    if target_id.startswith(GeneData.ENS_ID_ORG_PREFIX):
+        return 'ensembl', target_id[len(GeneData.ENS_ID_ORG_PREFIX):].strip()
+    return None, None
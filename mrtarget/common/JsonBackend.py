@@ -0,0 +1,92 @@
+'''
+Parsing and writing of the json documents that go through the pipeline, with
+a selectable library doing the work:
+
+- "stdlib": the json module of the standard library
+- "simplejson": simplejson, with its C speedups if they are compiled
+- "ujson": ujson to parse, the fastest, and simplejson to write, as ujson can
+  not use a custom encoder and writes floats with at most 15 digits (e.g.
+  1e-120 as 0.0)
+
+All of them read and write the same documents, so hashes of documents (e.g.
+evidence ids) do not depend on the backend.
+'''
+import json as _stdlib_json
+import logging
+
+import simplejson as _simplejson
+
+from mrtarget.Settings import Config
+
+try:
+    import ujson as _ujson
+except ImportError:
+    _ujson = None
+
+logger = logging.getLogger(__name__)
+
+JSON_BACKENDS = ['stdlib', 'simplejson', 'ujson']
+
+
+class JsonBackend(object):
+    '''
+    A json library exposed as `loads(data)` and
+    `dumps(obj, sort_keys=False, cls=None, default=None)`
+    '''
+
+    def __init__(self, name, loads, dumps):
+        self.name = name
+        self.loads = loads
+        self.dumps = dumps
+
+
+def _stdlib_dumps(obj, sort_keys=False, cls=None, default=None):
+    return _stdlib_json.dumps(obj, sort_keys=sort_keys, cls=cls, default=default)
+
+def _simplejson_dumps(obj, sort_keys=False, cls=None, default=None):
+    return _simplejson.dumps(obj, sort_keys=sort_keys, cls=cls, default=default)
+
+def _ujson_loads(data):
+    try:
+        #precise_float so numbers, and so hashes, are the same as the others
+        return _ujson.loads(data, precise_float=True)
+    except ValueError:
+        #bad json or numbers too big for ujson, let simplejson decide
+        return _simplejson.loads(data)
+
+
+def get_json_backend(name):
+    '''
+    Returns the JsonBackend for one of the JSON_BACKENDS names
+
+    Raises ValueError if the backend is unknown or needs a module not installed
+    '''
+    if name not in JSON_BACKENDS:
+        raise ValueError('unknown json backend %s, use one of %s'
+                         % (name, ', '.join(JSON_BACKENDS)))
+    if name == 'stdlib':
+        return JsonBackend(name, _stdlib_json.loads, _stdlib_dumps)
+    if name == 'simplejson':
+        return JsonBackend(name, _simplejson.loads, _simplejson_dumps)
+    if _ujson is None:
+        raise ValueError('json backend %s needs ujson installed' % name)
+    return JsonBackend(name, _ujson_loads, _simplejson_dumps)
+
+
+_backend = get_json_backend(Config.JSON_BACKEND)
+
+
+def set_json_backend(name):
+    '''select the backend used by loads and dumps in this process and the
+    processes forked from it'''
+    global _backend
+    _backend = get_json_backend(name)
+    logger.debug('using json backend %s', name)
+
+
+def loads(data):
+    return _backend.loads(data)
+
+
+def dumps(obj, sort_keys=False, cls=None, default=None):
+    return _backend.dumps(obj, sort_keys=sort_keys, cls=cls, default=default)
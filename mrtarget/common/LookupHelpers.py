@@ -1,14 +1,21 @@
 import logging
 import os
+import shutil
+import tempfile
 import time
+from multiprocessing.pool import ThreadPool
 
 from mrtarget.common.LookupTables import ECOLookUpTable
 from mrtarget.common.LookupTables import EFOLookUpTable
 from mrtarget.common.LookupTables import HPALookUpTable
 from mrtarget.common.LookupTables import GeneLookUpTable
+from mrtarget.common.LookupSnapshot import MmapLookupTable
+from mrtarget.common.ElasticsearchQuery import ESQuery
+from mrtarget.common.IdResolver import IdResolver, load_non_reference_genes
 
-from mrtarget.Settings import Config, file_or_resource
+from mrtarget.Settings import Config
 from mrtarget.common import require_all
+from mrtarget.constants import Const
 
 
 class LookUpData():
@@ -21,9 +28,17 @@ class LookUpData():
         self.available_hpa = None
         self.uni2ens = None
         self.non_reference_genes = None
+        self.id_resolver = None
 
         self.mp_ontology = None
 
+    def get_id_resolver(self):
+        '''the IdResolver of the genes loaded, built the first time it is
+        needed in each process'''
+        if self.id_resolver is None:
+            self.id_resolver = IdResolver.from_lookup_data(self)
+        return self.id_resolver
+
     def set_r_server(self, r_server):
         self.logger.debug('setting r_server to all lookup tables from external r_server')
         if self.available_ecos:
@@ -39,6 +54,15 @@ class LookUpData():
             self.available_genes.r_server = r_server
             self.available_genes._table.set_r_server(r_server)
 
+    def cache_info(self):
+        '''return the in-process cache counters of each loaded lookup table'''
+        info = {}
+        for name in ('available_genes', 'available_efos', 'available_ecos', 'available_hpa'):
+            table = getattr(self, name)
+            if table:
+                info[name] = table._table.cache_info()
+        return info
+
 
 class LookUpDataType(object):
     TARGET = 'target'
@@ -47,6 +71,11 @@ class LookUpDataType(object):
     HPA = 'hpa'
 
 
+class LookUpBackend(object):
+    REDIS = 'redis'
+    MMAP = 'mmap'
+
+
 class LookUpDataRetriever(object):
     def __init__(self,
                  es,
@@ -54,61 +83,130 @@ class LookUpDataRetriever(object):
                  targets,
                  data_types,
                  hpo_uri = None,
-                 mp_uri = None
+                 mp_uri = None,
+                 batch_size = 1000,
+                 cache_size = 0,
+                 cache_ttl = None,
+                 codec = 'pickle',
+                 backend = LookUpBackend.REDIS,
+                 snapshot_dir = None
                  ):
         self.es = es
         self.r_server = r_server
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.codec = codec
+        self.backend = backend
+        self.snapshot_dir = snapshot_dir
+        #a snapshot directory made here is removed by close
+        self.temporary_snapshot_dir = False
+        if self.backend == LookUpBackend.MMAP and not self.snapshot_dir:
+            self.snapshot_dir = tempfile.mkdtemp(prefix='mrtarget_lookup_')
+            self.temporary_snapshot_dir = True
 
         self.lookup = LookUpData()
 
         self._logger = logging.getLogger(__name__)
 
-        # TODO: run the steps in parallel to speedup loading times
-        for dt in data_types:
-            self._logger.info("get %s info"%dt)
-            start_time = time.time()
+        #each table is an independent scroll from elasticsearch so they are
+        #loaded at the same time, failures are raised once all have finished
+        start_time = time.time()
+        pool = ThreadPool(max(1, len(data_types)))
+        try:
+            results = [pool.apply_async(self._load_data_type, (dt, targets))
+                       for dt in data_types]
+            for result in results:
+                result.wait()
+            for result in results:
+                result.get()
+        except Exception:
+            self.close()
+            raise
+        finally:
+            pool.terminate()
+        self._logger.info("loaded %s in %ss" % (", ".join(data_types),
+                                                str(int(time.time() - start_time))))
+
+    def close(self):
+        '''remove the snapshot directory if it was made by this retriever,
+        once nothing reads the lookup tables any more'''
+        if self.temporary_snapshot_dir:
+            self._logger.debug('removing lookup snapshot directory %s', self.snapshot_dir)
+            shutil.rmtree(self.snapshot_dir, ignore_errors=True)
+            self.temporary_snapshot_dir = False
+
+    def _load_data_type(self, dt, targets):
+        self._logger.info("get %s info"%dt)
+        start_time = time.time()
+        try:
             if dt == LookUpDataType.TARGET:
                 self._get_gene_info(targets, True)
             elif dt == LookUpDataType.DISEASE:
-                self.lookup.available_efos = EFOLookUpTable(self.es, 'EFO_LOOKUP', self.r_server)
+                table = self._new_table('EFO_LOOKUP', Const.ELASTICSEARCH_EFO_LABEL_INDEX_NAME)
+                self.lookup.available_efos = EFOLookUpTable(self.es, 'EFO_LOOKUP', self.r_server,
+                    batch_size=self.batch_size, cache_size=self.cache_size,
+                    cache_ttl=self.cache_ttl, codec=self.codec,
+                    table=table, autoload=self._needs_loading(table))
             elif dt == LookUpDataType.ECO:
-                self.lookup.available_ecos = ECOLookUpTable(self.es, 'ECO_LOOKUP', self.r_server)
+                table = self._new_table('ECO_LOOKUP', Const.ELASTICSEARCH_ECO_INDEX_NAME)
+                self.lookup.available_ecos = ECOLookUpTable(self.es, 'ECO_LOOKUP', self.r_server,
+                    batch_size=self.batch_size, cache_size=self.cache_size,
+                    cache_ttl=self.cache_ttl, codec=self.codec,
+                    table=table, autoload=self._needs_loading(table))
             elif dt == LookUpDataType.HPA:
-                self.lookup.available_hpa = HPALookUpTable(self.es, 'HPA_LOOKUP', self.r_server)
-
-            self._logger.info("loaded %s in %ss" % (dt, str(int(time.time() - start_time))))
+                table = self._new_table('HPA_LOOKUP', Const.ELASTICSEARCH_EXPRESSION_INDEX_NAME)
+                self.lookup.available_hpa = HPALookUpTable(self.es, 'HPA_LOOKUP', self.r_server,
+                    batch_size=self.batch_size, cache_size=self.cache_size,
+                    cache_ttl=self.cache_ttl, codec=self.codec,
+                    table=table, autoload=self._needs_loading(table))
+        except Exception:
+            #the traceback is lost when the pool re-raises in the calling thread
+            self._logger.exception("failed to load %s info", dt)
+            raise
+
+        self._logger.info("loaded %s in %ss" % (dt, str(int(time.time() - start_time))))
 
     def set_r_server(self, r_server):
         self.r_server = r_server
         self.lookup.set_r_server(r_server)
 
+    def _new_table(self, namespace, index_name, reusable=True):
+        '''the key value store behind a lookup table, None for the default
+        redis one. A snapshot left in snapshot_dir by a previous run is reused
+        if the release and the index it was loaded from have not changed'''
+        if self.backend == LookUpBackend.MMAP:
+            filename = os.path.join(self.snapshot_dir, namespace.lower() + '.lut')
+            fingerprint = None
+            if reusable:
+                fingerprint = '%s:%s' % (Config.RELEASE_VERSION,
+                                         ESQuery(self.es).get_index_fingerprint(index_name))
+            return MmapLookupTable(filename, codec=self.codec, fingerprint=fingerprint)
+        return None
+
+    @staticmethod
+    def _needs_loading(table):
+        return table is None or not table.reused
+
     def _get_gene_info(self, targets=[], autoload = True):
         self._logger.info('getting gene info')
+        #only the complete list of genes can be reused
+        table = self._new_table('GENE_LOOKUP', Const.ELASTICSEARCH_GENE_NAME_INDEX_NAME,
+                                reusable=not targets)
         self.lookup.available_genes = GeneLookUpTable(self.es,
                                                       'GENE_LOOKUP',
                                                       self.r_server,
                                                       targets = targets,
-                                                      autoload = autoload)
+                                                      autoload = autoload and self._needs_loading(table),
+                                                      batch_size = self.batch_size,
+                                                      cache_size = self.cache_size,
+                                                      cache_ttl = self.cache_ttl,
+                                                      codec = self.codec,
+                                                      table = table)
+        if autoload and not self._needs_loading(table):
+            self.lookup.available_genes.load_uniprot2ensembl()
         self.lookup.uni2ens = self.lookup.available_genes.uniprot2ensembl
         self._get_non_reference_gene_mappings()
 
     def _get_non_reference_gene_mappings(self):
-        self.lookup.non_reference_genes = {}
-        skip_header=True
-        for line in file(file_or_resource('genes_with_non_reference_ensembl_ids.tsv')):
-            if skip_header:
-                skip_header=False
-            symbol, ensg, assembly, chr, is_ref = line.split()
-            if symbol not in self.lookup.non_reference_genes:
-                self.lookup.non_reference_genes[symbol]=dict(reference='',
-                                                      alternative=[])
-            if is_ref == 't':
-                self.lookup.non_reference_genes[symbol]['reference']=ensg
-            else:
-                self.lookup.non_reference_genes[symbol]['alternative'].append(ensg)
-
-        
-
-
-
-
+        self.lookup.non_reference_genes = load_non_reference_genes()
@@ -0,0 +1,150 @@
+import logging
+import mmap
+import os
+import struct
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from mrtarget.common.Redis import get_lookup_table_codec
+
+
+class MmapLookupTable(object):
+    '''
+    Immutable key value store kept in a single file that is memory mapped
+    read-only, so forked worker processes share its pages instead of asking a
+    redis server. It has the same interface as RedisLookupTable.
+
+    set_many() writes the snapshot: a header, the values encoded with one of
+    the lookup table codecs one after the other, a pickled index of
+    key -> (offset, length) and the offset of that index as the last 8 bytes.
+    Values set afterwards with set() are only visible to the current process.
+
+    If a fingerprint of the source data is given and an existing snapshot file
+    was written with the same one and codec, it is mapped straight away and
+    reused is True, so the caller can skip loading the data again.
+    '''
+
+    MAGIC = 'MRTLUT1\n'
+    FOOTER = struct.Struct('<Q')
+
+    def __init__(self,
+                 filename,
+                 codec='pickle',
+                 fingerprint=None,
+                 **kwargs):
+        self._logger = logging.getLogger(__name__)
+        self.filename = filename
+        self.codec_name = codec
+        self.codec = get_lookup_table_codec(codec)
+        self.fingerprint = fingerprint
+        self.reused = False
+        self._mmap = None
+        self._index = {}
+        self._extra = {}
+
+        if fingerprint is not None and os.path.isfile(filename):
+            self.reused = self._reuse_snapshot()
+
+    def _reuse_snapshot(self):
+        try:
+            snapshot = self.open_snapshot()
+        except Exception:
+            self._logger.warning('cannot read snapshot %s, it will be written again',
+                                 self.filename, exc_info=True)
+            snapshot = {}
+        if snapshot.get('fingerprint') == self.fingerprint and \
+                snapshot.get('codec') == self.codec_name:
+            self._logger.info('reusing snapshot %s of %s', self.filename, self.fingerprint)
+            return True
+
+        self._mmap = None
+        self._index = {}
+        return False
+
+    def open_snapshot(self):
+        '''map the snapshot file and read its index. Returns the metadata
+        stored with it'''
+        with open(self.filename, 'rb') as fd:
+            self._mmap = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(self.MAGIC)] != self.MAGIC:
+            raise ValueError('%s is not a lookup table snapshot' % self.filename)
+        (index_offset,) = self.FOOTER.unpack(self._mmap[-self.FOOTER.size:])
+        snapshot = pickle.loads(self._mmap[index_offset:-self.FOOTER.size])
+        self._index = snapshot.pop('index')
+        self._extra = {}
+        return snapshot
+
+    def set_many(self, items, r_server=None, ttl=None, batch_size=None):
+        '''write a new snapshot with the (key, obj) tuples in items replacing
+        any previous one, and map it. Returns the number of keys stored'''
+        index = {}
+        tmp_filename = self.filename + '.tmp'
+        with open(tmp_filename, 'wb') as fd:
+            fd.write(self.MAGIC)
+            for key, obj in items:
+                data = self.codec.encode(obj)
+                index[key] = (fd.tell(), len(data))
+                fd.write(data)
+            index_offset = fd.tell()
+            pickle.dump(dict(index=index, fingerprint=self.fingerprint,
+                             codec=self.codec_name), fd, 2)
+            fd.write(self.FOOTER.pack(index_offset))
+        os.rename(tmp_filename, self.filename)
+
+        self._logger.debug('written snapshot %s with %d keys', self.filename, len(index))
+        self.open_snapshot()
+        return len(index)
+
+    def set(self, key, obj, r_server=None, ttl=None):
+        self._extra[key] = obj
+
+    def get(self, key, r_server=None):
+        if key in self._extra:
+            return self._extra[key]
+        offset, length = self._index[key]
+        return self.codec.decode(self._mmap[offset:offset + length])
+
+    def get_many(self, keys, r_server=None):
+        found = {}
+        for key in keys:
+            try:
+                found[key] = self.get(key)
+            except KeyError:
+                pass
+        return found
+
+    def keys(self, r_server=None):
+        return list(set(self._index) | set(self._extra))
+
+    def cache_info(self):
+        '''no in-process cache, values are decoded from the shared pages'''
+        return dict(hits=0, misses=0, size=0, max_size=0)
+
+    def set_r_server(self, r_server):
+        pass
+
+    def __contains__(self, key, r_server=None):
+        return key in self._index or key in self._extra
+
+    def __getitem__(self, key, r_server=None):
+        return self.get(key)
+
+    def __setitem__(self, key, value, r_server=None):
+        self.set(key, value)
+
+    def __getstate__(self):
+        #mmap objects cannot be pickled, the file is mapped again on unpickle
+        state = self.__dict__.copy()
+        state['_mmap'] = None
+        state['_index'] = {}
+        del state['_logger']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._logger = logging.getLogger(__name__)
+        if os.path.isfile(self.filename):
+            self.open_snapshot()
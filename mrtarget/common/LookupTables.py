@@ -1,6 +1,7 @@
 import logging
 from mrtarget.common.ElasticsearchQuery import ESQuery
-from mrtarget.common.Redis import RedisLookupTablePickle
+from mrtarget.common.Redis import RedisLookupTableCodec
+from mrtarget.common.LookupSnapshot import MmapLookupTable
 from mrtarget.constants import Const
 
 class HPALookUpTable(object):
@@ -13,25 +14,41 @@ class HPALookUpTable(object):
                  es=None,
                  namespace=None,
                  r_server=None,
-                 ttl=(60 * 60 * 24 + 7)):
+                 ttl=(60 * 60 * 24 + 7),
+                 batch_size=1000,
+                 cache_size=0,
+                 cache_ttl=None,
+                 codec='pickle',
+                 table=None,
+                 autoload=True):
         self._es = es
         self.r_server = r_server
         self._es_query = ESQuery(self._es)
-        self._table = RedisLookupTablePickle(namespace=namespace,
-                                             r_server=self.r_server,
-                                             ttl=ttl)
+        if table is None:
+            table = RedisLookupTableCodec(namespace=namespace,
+                                          r_server=self.r_server,
+                                          ttl=ttl,
+                                          batch_size=batch_size,
+                                          cache_size=cache_size,
+                                          cache_ttl=cache_ttl,
+                                          codec=codec)
+        self._table = table
         self._logger = logging.getLogger(__name__)
 
-        if self.r_server:
+        #a snapshot is loaded without any redis server
+        if autoload and (self.r_server or isinstance(self._table, MmapLookupTable)):
             self._load_hpa_data(self.r_server)
 
     def _load_hpa_data(self, r_server=None):
-        for el in self._es_query.get_all_hpa():
-            self.set_hpa(el, r_server=self._get_r_server(r_server))
+        hpa_items = ((el['gene'], el) for el in self._es_query.get_all_hpa())
+        self._table.set_many(hpa_items, r_server=self._get_r_server(r_server))
 
     def get_hpa(self, idx, r_server=None):
         return self._table.get(idx, r_server=self._get_r_server(r_server))
 
+    def get_many(self, keys, r_server=None):
+        return self._table.get_many(keys, r_server=self._get_r_server(r_server))
+
     def set_hpa(self, hpa, r_server=None):
         self._table.set(hpa['gene'], hpa,
                         r_server=self._get_r_server(r_server))
@@ -66,17 +83,28 @@ class GeneLookUpTable(object):
                  r_server = None,
                  ttl = 60*60*24+7,
                  targets = [],
-                 autoload=True):
+                 autoload=True,
+                 batch_size=1000,
+                 cache_size=0,
+                 cache_ttl=None,
+                 codec='pickle',
+                 table=None):
         self._logger = logging.getLogger(__name__)
         self._es = es
         self.r_server = r_server
         self._es_query = ESQuery(self._es)
-        self._table = RedisLookupTablePickle(namespace = namespace,
-                                            r_server = self.r_server,
-                                            ttl = ttl)
+        if table is None:
+            table = RedisLookupTableCodec(namespace = namespace,
+                                          r_server = self.r_server,
+                                          ttl = ttl,
+                                          batch_size = batch_size,
+                                          cache_size = cache_size,
+                                          cache_ttl = cache_ttl,
+                                          codec = codec)
+        self._table = table
         self._logger = logging.getLogger(__name__)
         self.uniprot2ensembl = {}
-        if self.r_server and autoload:
+        if autoload and (self.r_server or isinstance(self._table, MmapLookupTable)):
             self.load_gene_data(self.r_server, targets)
 
     def load_gene_data(self, r_server = None, targets = []):
@@ -87,12 +115,31 @@ class GeneLookUpTable(object):
         if data is None:
             data = self._es_query.get_all_targets()
             total = self._es_query.count_all_targets()
+        self._table.set_many(self._gene_items(data),
+                             r_server=self._get_r_server(r_server))
+
+    def load_uniprot2ensembl(self, r_server = None):
+        '''build the uniprot to ensembl mapping from the genes already stored,
+        for when they were not loaded by this instance'''
+        keys = self._table.keys(self._get_r_server(r_server))
+        for i in range(0, len(keys), 1000):
+            targets = self._table.get_many(keys[i:i + 1000],
+                                           r_server=self._get_r_server(r_server))
+            for target in targets.itervalues():
+                self._add_uniprot2ensembl(target)
+
+    def _gene_items(self, data):
+        '''yield (id, target) tuples to be stored while keeping the uniprot
+        to ensembl mapping up to date'''
         for target in data:
-            self._table.set(target['id'],target, r_server=self._get_r_server(r_server))#TODO can be improved by sending elements in batches
-            if target['uniprot_id']:
-                self.uniprot2ensembl[target['uniprot_id']] = target['id']
-            for accession in target['uniprot_accessions']:
-                self.uniprot2ensembl[accession] = target['id']
+            self._add_uniprot2ensembl(target)
+            yield target['id'], target
+
+    def _add_uniprot2ensembl(self, target):
+        if target['uniprot_id']:
+            self.uniprot2ensembl[target['uniprot_id']] = target['id']
+        for accession in target['uniprot_accessions']:
+            self.uniprot2ensembl[accession] = target['id']
 
 
     def get_gene(self, target_id, r_server = None):
@@ -111,6 +158,11 @@ class GeneLookUpTable(object):
             self.set_gene(target, r_server)
             return target
 
+    def get_many(self, keys, r_server = None):
+        '''get several genes in a single round trip. Unlike get_gene, genes
+        missing from redis are not looked up in elasticsearch but left out'''
+        return self._table.get_many(keys, r_server=self._get_r_server(r_server))
+
     def set_gene(self, target, r_server = None):
         self._table.set(target['id'],target, r_server=self._get_r_server(r_server))
 
@@ -153,15 +205,27 @@ class ECOLookUpTable(object):
                  es,
                  namespace=None,
                  r_server=None,
-                 ttl=60 * 60 * 24 + 7):
-        self._table = RedisLookupTablePickle(namespace=namespace,
-                                             r_server=r_server,
-                                             ttl=ttl)
+                 ttl=60 * 60 * 24 + 7,
+                 batch_size=1000,
+                 cache_size=0,
+                 cache_ttl=None,
+                 codec='pickle',
+                 table=None,
+                 autoload=True):
+        if table is None:
+            table = RedisLookupTableCodec(namespace=namespace,
+                                          r_server=r_server,
+                                          ttl=ttl,
+                                          batch_size=batch_size,
+                                          cache_size=cache_size,
+                                          cache_ttl=cache_ttl,
+                                          codec=codec)
+        self._table = table
         self._es = es
         self._es_query = ESQuery(es)
         self.r_server = r_server
         self._logger = logging.getLogger(__name__)
-        if r_server is not None:
+        if autoload and (r_server is not None or isinstance(self._table, MmapLookupTable)):
             self._load_eco_data(r_server)
 
     @staticmethod
@@ -177,15 +241,19 @@ class ECOLookUpTable(object):
 
     def _load_eco_data(self, r_server=None):
         self._logger = logging.getLogger(__name__)
-        for eco in self._es_query.get_all_eco():
-            self._table.set(self.get_ontology_code_from_url(eco['code']), eco,
-                            r_server=self._get_r_server(r_server))  # TODO can be improved by sending elements in batches
+        eco_items = ((self.get_ontology_code_from_url(eco['code']), eco)
+                     for eco in self._es_query.get_all_eco())
+        self._table.set_many(eco_items, r_server=self._get_r_server(r_server))
 
 
     def get_eco(self, efo_id, r_server=None):
         return self._table.get(efo_id, r_server=self._get_r_server(r_server))
 
 
+    def get_many(self, keys, r_server=None):
+        return self._table.get_many(keys, r_server=self._get_r_server(r_server))
+
+
     def set_eco(self, eco, r_server=None):
         self._table.set(self.get_ontology_code_from_url(eco['code']), eco, r_server=self._get_r_server(r_server))
 
@@ -223,15 +291,27 @@ class EFOLookUpTable(object):
                  es=None,
                  namespace=None,
                  r_server=None,
-                 ttl = 60*60*24+7):
+                 ttl = 60*60*24+7,
+                 batch_size=1000,
+                 cache_size=0,
+                 cache_ttl=None,
+                 codec='pickle',
+                 table=None,
+                 autoload=True):
         self._es = es
         self.r_server = r_server
         self._es_query = ESQuery(self._es)
-        self._table = RedisLookupTablePickle(namespace = namespace,
-                                            r_server = self.r_server,
-                                            ttl = ttl)
+        if table is None:
+            table = RedisLookupTableCodec(namespace = namespace,
+                                          r_server = self.r_server,
+                                          ttl = ttl,
+                                          batch_size = batch_size,
+                                          cache_size = cache_size,
+                                          cache_ttl = cache_ttl,
+                                          codec = codec)
+        self._table = table
         self._logger = logging.getLogger(__name__)
-        if self.r_server is not None:
+        if autoload and (self.r_server is not None or isinstance(self._table, MmapLookupTable)):
             self._load_efo_data(r_server)
 
     @staticmethod
@@ -247,15 +327,21 @@ class EFOLookUpTable(object):
 
     def _load_efo_data(self, r_server = None):
         self._logger = logging.getLogger(__name__)
-        for i,efo in enumerate(self._es_query.get_all_diseases()):
-            #TODO can be improved by sending elements in batches
-            self.set_efo(efo, r_server=self._get_r_server(r_server))
+        self._table.set_many(self._efo_items(self._es_query.get_all_diseases()),
+                             r_server=self._get_r_server(r_server))
+
+    def _efo_items(self, data):
+        for i, efo in enumerate(data):
             if i % 1000 == 0:
-                self._logger.debug("Loaded %s efo", i)                
+                self._logger.debug("Loaded %s efo", i)
+            yield efo['path_codes'][0][-1], efo
 
     def get_efo(self, efo_id, r_server=None):
         return self._table.get(efo_id, r_server=self._get_r_server(r_server))
 
+    def get_many(self, keys, r_server=None):
+        return self._table.get_many(keys, r_server=self._get_r_server(r_server))
+
     def set_efo(self, efo, r_server=None):
         efo_key = efo['path_codes'][0][-1]
         self._table.set(efo_key,efo, r_server=self._get_r_server(r_server))
@@ -277,3 +363,32 @@ class EFOLookUpTable(object):
 
     def _get_r_server(self, r_server = None):
         return r_server if r_server else self.r_server
+
+
+class LookUpTableCache(object):
+    """
+    A read-through dict in front of any of the look up tables. prefetch()
+    fills it with a single get_many call so that a chunk of lookups costs one
+    round trip, anything not prefetched is resolved by the wrapped table
+    """
+
+    def __init__(self, table):
+        self._table = table
+        self._data = {}
+
+    def prefetch(self, keys):
+        missing = set(key for key in keys if key is not None) - set(self._data)
+        if missing:
+            self._data.update(self._table.get_many(missing))
+
+    def clear(self):
+        self._data.clear()
+
+    def __contains__(self, key):
+        return key in self._data or key in self._table
+
+    def __getitem__(self, key):
+        try:
+            return self._data[key]
+        except KeyError:
+            return self._table[key]
@@ -2,12 +2,12 @@
 # -*- coding: utf-8 -*-
 
 import base64
-import simplejson as json
-from collections import Counter
+from collections import Counter, OrderedDict
 
 import jsonpickle
 from mrtarget.common import require_all
 from mrtarget.common.connection import new_redis_client
+import mrtarget.common.JsonBackend as JsonBackend
 jsonpickle.set_preferred_backend('simplejson')
 import logging
 import uuid
@@ -24,8 +24,19 @@ try:
 except ImportError:
     import pickle
 import time
+import zlib
 from multiprocessing import Process, current_process
 
+#optional codecs for the lookup tables
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import lz4.frame as lz4
+except ImportError:
+    lz4 = None
+
 logger = logging.getLogger(__name__)
 
 import signal
@@ -49,6 +60,85 @@ def millify(n):
         return str(n)
 
 
+class LookupTableCodec(object):
+    '''
+    Turns objects into strings to store in redis and back, serialising them
+    with `dumps`/`loads` and then optionally compressing them with
+    `compress`/`decompress`
+    '''
+
+    def __init__(self, dumps, loads, compress=None, decompress=None):
+        self.dumps = dumps
+        self.loads = loads
+        self.compress = compress
+        self.decompress = decompress
+
+    def encode(self, obj):
+        data = self.dumps(obj)
+        return self.compress(data) if self.compress else data
+
+    def decode(self, data):
+        if self.decompress:
+            data = self.decompress(data)
+        return self.loads(data)
+
+
+def _pickle_dumps(obj):
+    return pickle.dumps(obj, 2)
+
+def _pickle_base64_dumps(obj):
+    return base64.encodestring(pickle.dumps(obj, pickle.HIGHEST_PROTOCOL))
+
+def _pickle_base64_loads(data):
+    return pickle.loads(base64.decodestring(data))
+
+def _msgpack_dumps(obj):
+    return msgpack.packb(obj, use_bin_type=True)
+
+def _msgpack_loads(data):
+    return msgpack.unpackb(data, raw=False)
+
+LOOKUP_TABLE_SERIALISERS = {
+    'pickle': (_pickle_dumps, pickle.loads),
+    'msgpack': (_msgpack_dumps, _msgpack_loads),
+}
+
+LOOKUP_TABLE_COMPRESSORS = {
+    'zlib': (zlib.compress, zlib.decompress),
+    'lz4': (lz4.compress, lz4.decompress) if lz4 else None,
+}
+
+LOOKUP_TABLE_CODECS = ['pickle-base64', 'pickle', 'pickle-zlib', 'pickle-lz4',
+                       'msgpack', 'msgpack-zlib', 'msgpack-lz4']
+
+
+def get_lookup_table_codec(name):
+    '''
+    Returns the LookupTableCodec for one of the LOOKUP_TABLE_CODECS names, that
+    are a serialiser optionally followed by a compressor e.g. "msgpack-lz4".
+    "pickle-base64" is the original encoding of RedisLookupTablePickle.
+
+    Raises ValueError if the codec is unknown or needs a module not installed
+    '''
+    if name not in LOOKUP_TABLE_CODECS:
+        raise ValueError('unknown lookup table codec %s, use one of %s'
+                         % (name, ', '.join(LOOKUP_TABLE_CODECS)))
+    if name == 'pickle-base64':
+        return LookupTableCodec(_pickle_base64_dumps, _pickle_base64_loads)
+
+    serialiser, _, compressor = name.partition('-')
+    if serialiser == 'msgpack' and msgpack is None:
+        raise ValueError('lookup table codec %s needs msgpack installed' % name)
+    dumps, loads = LOOKUP_TABLE_SERIALISERS[serialiser]
+    if not compressor:
+        return LookupTableCodec(dumps, loads)
+
+    if LOOKUP_TABLE_COMPRESSORS[compressor] is None:
+        raise ValueError('lookup table codec %s needs %s installed' % (name, compressor))
+    compress, decompress = LOOKUP_TABLE_COMPRESSORS[compressor]
+    return LookupTableCodec(dumps, loads, compress, decompress)
+
+
 class RedisLookupTable(object):
     '''
     Simple Redis-based key value store for string-based objects. Faster than
@@ -58,6 +148,11 @@ class RedisLookupTable(object):
     Allows to store a lookup table (key/value store) in memory/redis so that it
     can be accessed quickly from multiple processes, reducing memory usage by
     sharing.
+
+    If cache_size is set, up to that many decoded objects are also kept in a
+    per-process LRU cache, optionally expiring after cache_ttl seconds, so hot
+    keys do not go to redis and get decoded again. Objects returned from the
+    cache are shared, so callers must not modify them.
     '''
 
     LOOK_UPTABLE_NAMESPACE = 'lookuptable:%(namespace)s'
@@ -66,28 +161,121 @@ class RedisLookupTable(object):
     def __init__(self,
                  namespace = None,
                  r_server = None,
-                 ttl = 60*60*24+2):
+                 ttl = 60*60*24+2,
+                 batch_size = 1000,
+                 cache_size = 0,
+                 cache_ttl = None):
         if namespace is None:
             namespace = uuid.uuid4()
 
         self.namespace = self.LOOK_UPTABLE_NAMESPACE % {'namespace': namespace}
         self.r_server = new_redis_client() if not r_server else r_server
         self.default_ttl = ttl
+        self.batch_size = batch_size
+
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._cache = OrderedDict()
 
         require_all(self.r_server is not None)
 
     def set(self, key, obj, r_server = None, ttl = None):
+        self._cache.pop(key, None)
         self._get_r_server(r_server).setex(self._get_key_namespace(key),
                                 self._encode(obj),
                                 ttl or self.default_ttl)
 
+    def set_many(self, items, r_server = None, ttl = None, batch_size = None):
+        '''store an iterable of (key, obj) tuples using redis pipelines so
+        only one round trip is done every `batch_size` elements instead of
+        one per element. Returns the number of elements stored
+        '''
+        batch_size = batch_size or self.batch_size
+        pipe = self._get_r_server(r_server).pipeline(transaction=False)
+        count = 0
+        for key, obj in items:
+            self._cache.pop(key, None)
+            pipe.setex(self._get_key_namespace(key),
+                       self._encode(obj),
+                       ttl or self.default_ttl)
+            count += 1
+            if count % batch_size == 0:
+                pipe.execute()
+        pipe.execute()
+        return count
+
     def get(self, key, r_server = None):
+        if self.cache_size:
+            try:
+                return self._cache_get(key)
+            except KeyError:
+                pass
         server = self._get_r_server(r_server)
         value = server.get(self._get_key_namespace(key))
         if value is not None:
-            return self._decode(value)
+            obj = self._decode(value)
+            self._cache_set(key, obj)
+            return obj
         raise KeyError(key)
 
+    def get_many(self, keys, r_server = None):
+        '''fetch several keys using one MGET round trip every `batch_size`
+        keys. Returns a dict with the decoded objects for the keys found,
+        missing keys are not included
+        '''
+        server = self._get_r_server(r_server)
+        keys = list(keys)
+        found = {}
+        if self.cache_size:
+            for key in keys:
+                try:
+                    found[key] = self._cache_get(key)
+                except KeyError:
+                    pass
+            keys = [key for key in keys if key not in found]
+        for i in range(0, len(keys), self.batch_size):
+            chunk = keys[i:i + self.batch_size]
+            values = server.mget([self._get_key_namespace(key) for key in chunk])
+            for key, value in zip(chunk, values):
+                if value is not None:
+                    found[key] = self._decode(value)
+                    self._cache_set(key, found[key])
+        return found
+
+    def cache_info(self):
+        '''return the hit/miss counters and current size of the LRU cache'''
+        return dict(hits=self.cache_hits,
+                    misses=self.cache_misses,
+                    size=len(self._cache),
+                    max_size=self.cache_size)
+
+    def _cache_get(self, key):
+        '''return the cached object for key marking it as the most recently
+        used one, raise KeyError if not cached or expired'''
+        try:
+            obj, cached_at = self._cache.pop(key)
+        except KeyError:
+            self.cache_misses += 1
+            raise
+        if self._cache_expired(cached_at):
+            self.cache_misses += 1
+            raise KeyError(key)
+        self._cache[key] = (obj, cached_at)
+        self.cache_hits += 1
+        return obj
+
+    def _cache_expired(self, cached_at):
+        return self.cache_ttl and time.time() - cached_at > self.cache_ttl
+
+    def _cache_set(self, key, obj):
+        if self.cache_size:
+            self._cache.pop(key, None)
+            self._cache[key] = (obj, time.time())
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
 
     def keys(self, r_server = None):
         return [key.replace(self.namespace+':','') \
@@ -109,6 +297,10 @@ class RedisLookupTable(object):
         return obj
 
     def __contains__(self, key, r_server=None):
+        #an expired cached entry is checked in redis, as get() would
+        cached = self._cache.get(key)
+        if cached is not None and not self._cache_expired(cached[1]):
+            return True
         server = self._get_r_server(r_server)
         return server.exists(self._get_key_namespace(key))
 
@@ -129,10 +321,10 @@ class RedisLookupTableJson(RedisLookupTable):
     '''
 
     def _encode(self, obj):
-        return json.dumps(obj)
+        return JsonBackend.dumps(obj)
 
     def _decode(self, obj):
-        return json.loads(obj)
+        return JsonBackend.loads(obj)
 
 
 
@@ -147,3 +339,22 @@ class RedisLookupTablePickle(RedisLookupTable):
 
     def _decode(self, obj):
         return pickle.loads(base64.decodestring(obj))
+
+
+class RedisLookupTableCodec(RedisLookupTable):
+    '''
+    Simple Redis-based key value store for objects encoded with one of the
+    LOOKUP_TABLE_CODECS, chosen by name. Defaults to plain pickle protocol 2
+    By default keys will expire in 2 days
+    '''
+
+    def __init__(self, codec='pickle', **kwargs):
+        super(RedisLookupTableCodec, self).__init__(**kwargs)
+        self.codec_name = codec
+        self.codec = get_lookup_table_codec(codec)
+
+    def _encode(self, obj):
+        return self.codec.encode(obj)
+
+    def _decode(self, obj):
+        return self.codec.decode(obj)
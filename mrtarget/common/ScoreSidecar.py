@@ -0,0 +1,207 @@
+"""
+Compact columnar files with only what association scoring needs of each valid
+evidence: target.id, disease.id, private.efo_codes, sourceID and
+scores.association_score, with the hash elasticsearch uses as its id. Each
+--val writer process writes its own file and --as can score from all the files
+of a folder instead of reading the evidence back from elasticsearch
+"""
+import array
+import collections
+import glob
+import logging
+import os
+import uuid
+
+import numpy as np
+
+
+SCORES_FILENAME_PATTERN = 'evidence-scores_*.npz'
+
+"""
+What association scoring needs of an evidence, and its hash
+"""
+EvidenceScoreRow = collections.namedtuple('EvidenceScoreRow',
+    ['target', 'disease', 'efo_codes', 'source', 'score', 'hash'])
+EvidenceScoreRow.__new__.__defaults__ = (None,)
+
+"""
+The rows of the evidence of a single target, as numpy arrays of indexes into
+the ids of the ScoreSidecar they come from. The efo codes of row i are
+efo_codes[efo_offsets[i]:efo_offsets[i+1]]
+"""
+TargetScores = collections.namedtuple('TargetScores',
+    ['target', 'disease', 'source', 'score', 'efo_offsets', 'efo_codes', 'hash'])
+
+
+def get_score_row(evidence, hash=None):
+    """the EvidenceScoreRow of an extended evidence dict, by default with its id as hash"""
+    return EvidenceScoreRow(evidence['target']['id'],
+                            evidence['disease']['id'],
+                            evidence.get('private', {}).get('efo_codes', []),
+                            evidence['sourceID'],
+                            evidence['scores']['association_score'],
+                            hash if hash is not None else evidence.get('id'))
+
+
+def prepare_scores_folder(folder):
+    """create folder if needed and remove the score files of any previous run,
+    that would otherwise be read together with the new ones"""
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    for filename in glob.glob(os.path.join(folder, SCORES_FILENAME_PATTERN)):
+        logging.getLogger(__name__).info('removing previous evidence scores %s', filename)
+        os.remove(filename)
+
+
+class ScoreSidecarWriter(object):
+    """
+    Collects EvidenceScoreRow in memory, with every id stored once, and writes
+    them as a single .npz file of numpy arrays to folder when closed
+    """
+
+    def __init__(self, folder):
+        self.filename = os.path.join(folder, 'evidence-scores_%s.npz' % uuid.uuid4().hex)
+        self.ids = {}
+        self.target = array.array('i')
+        self.disease = array.array('i')
+        self.source = array.array('i')
+        self.score = array.array('d')
+        self.efo_offsets = array.array('l', [0])
+        self.efo_codes = array.array('i')
+        self.hashes = []
+
+    def _intern(self, id):
+        try:
+            return self.ids[id]
+        except KeyError:
+            index = self.ids[id] = len(self.ids)
+            return index
+
+    def add(self, row):
+        if not row.hash:
+            raise ValueError("evidence score of %s-%s without a hash" % (row.target, row.disease))
+        self.target.append(self._intern(row.target))
+        self.disease.append(self._intern(row.disease))
+        self.source.append(self._intern(row.source))
+        self.score.append(row.score)
+        self.efo_codes.extend(self._intern(code) for code in row.efo_codes)
+        self.efo_offsets.append(len(self.efo_codes))
+        self.hashes.append(row.hash)
+
+    def __len__(self):
+        return len(self.target)
+
+    def close(self):
+        if not len(self):
+            return
+        ids = [None] * len(self.ids)
+        for id, index in self.ids.iteritems():
+            ids[index] = id
+
+        #write under another name first so readers never see a partial file
+        tmp_filename = self.filename + '.tmp'
+        with open(tmp_filename, 'wb') as f:
+            np.savez(f,
+                     ids=np.array(ids, dtype=np.unicode_),
+                     target=np.frombuffer(self.target, dtype=np.int32),
+                     disease=np.frombuffer(self.disease, dtype=np.int32),
+                     source=np.frombuffer(self.source, dtype=np.int32),
+                     score=np.frombuffer(self.score, dtype=np.float64),
+                     efo_offsets=np.frombuffer(self.efo_offsets, dtype=np.int_).astype(np.int64),
+                     efo_codes=np.frombuffer(self.efo_codes, dtype=np.int32),
+                     hash=np.array(self.hashes, dtype=np.string_))
+        os.rename(tmp_filename, self.filename)
+        logging.getLogger(__name__).debug('wrote %d evidence scores to %s',
+                                          len(self), self.filename)
+
+
+class ScoreSidecar(object):
+    """
+    All the evidence scores in the files of a folder, with their ids merged and
+    the rows of each target next to each other. Evidence with the same hash is
+    a single document in elasticsearch, so only one row of each hash is kept
+    """
+
+    def __init__(self, folder):
+        self.logger = logging.getLogger(__name__)
+        filenames = sorted(glob.glob(os.path.join(folder, SCORES_FILENAME_PATTERN)))
+        if not filenames:
+            raise RuntimeError("No evidence score files found in %s" % folder)
+
+        ids = {}
+        columns = collections.defaultdict(list)
+        efo_lengths = []
+        for filename in filenames:
+            with np.load(filename) as data:
+                #from the indexes of this file to the merged ones
+                remap = np.array([ids.setdefault(id, len(ids)) for id in data['ids'].tolist()],
+                                 dtype=np.int32)
+                for name in ('target', 'disease', 'source', 'efo_codes'):
+                    columns[name].append(remap[data[name]])
+                columns['score'].append(data['score'])
+                columns['hash'].append(data['hash'])
+                efo_lengths.append(np.diff(data['efo_offsets']))
+
+        self.ids = [None] * len(ids)
+        for id, index in ids.iteritems():
+            self.ids[index] = id
+
+        #the first row of each hash, in the order of the files
+        hashes = np.concatenate(columns['hash'])
+        unique_rows = np.sort(np.unique(hashes, return_index=True)[1])
+        if len(unique_rows) < len(hashes):
+            self.logger.info('skipped %d evidence scores with the same hash as another one',
+                             len(hashes) - len(unique_rows))
+
+        target = np.concatenate(columns['target'])
+        order = unique_rows[np.argsort(target[unique_rows], kind='mergesort')]
+        self.target = target[order]
+        self.disease = np.concatenate(columns['disease'])[order]
+        self.source = np.concatenate(columns['source'])[order]
+        self.score = np.concatenate(columns['score'])[order]
+        self.hash = hashes[order]
+
+        #the efo codes of each row follow the new order of the rows too
+        efo_lengths = np.concatenate(efo_lengths)
+        efo_starts = np.concatenate(([0], np.cumsum(efo_lengths)[:-1]))
+        efo_lengths = efo_lengths[order]
+        self.efo_offsets = np.concatenate(([0], np.cumsum(efo_lengths))).astype(np.int64)
+        efo_codes = np.concatenate(columns['efo_codes'])
+        self.efo_codes = efo_codes[np.repeat(efo_starts[order] - self.efo_offsets[:-1], efo_lengths) +
+                                   np.arange(self.efo_offsets[-1], dtype=np.int64)]
+
+        targets, starts, counts = np.unique(self.target, return_index=True, return_counts=True)
+        self.target_rows = dict((self.ids[t], (s, s + c))
+                                for t, s, c in zip(targets.tolist(), starts.tolist(), counts.tolist()))
+        self.logger.info('read %d evidence scores of %d targets from %d files',
+                         len(self.target), len(self.target_rows), len(filenames))
+
+    def get_target_counts(self):
+        """(target id, number of evidence) of each target"""
+        return [(target, end - start) for target, (start, end) in self.target_rows.iteritems()]
+
+    def get_target_scores(self, target):
+        """the TargetScores of a target"""
+        start, end = self.target_rows[target]
+        efo_start, efo_end = self.efo_offsets[start], self.efo_offsets[end]
+        return TargetScores(int(self.target[start]),
+                            self.disease[start:end],
+                            self.source[start:end],
+                            self.score[start:end],
+                            self.efo_offsets[start:end + 1] - efo_start,
+                            self.efo_codes[efo_start:efo_end],
+                            self.hash[start:end])
+
+
+def iter_score_rows(target_scores, ids):
+    """the EvidenceScoreRow of TargetScores, with their ids looked up in ids"""
+    target = ids[target_scores.target]
+    efo_offsets = target_scores.efo_offsets.tolist()
+    efo_codes = target_scores.efo_codes.tolist()
+    for i, (disease, source, score, hash) in enumerate(zip(target_scores.disease.tolist(),
+                                                           target_scores.source.tolist(),
+                                                           target_scores.score.tolist(),
+                                                           target_scores.hash.tolist())):
+        yield EvidenceScoreRow(target, ids[disease],
+                               [ids[code] for code in efo_codes[efo_offsets[i]:efo_offsets[i + 1]]],
+                               ids[source], score, hash)
@@ -1,3 +1,6 @@
+import collections
+import heapq
+
 import numpy as np
 
 
@@ -28,12 +31,13 @@ class HarmonicSumScorer():
 
         """
         score = float(score)
+        #data is a min heap, so the smallest value is always data[0]
         if len(self.data)>= self.buffer:
             if score >self.min:
-                self.data[self.data.index(self.min)] = score
+                heapq.heapreplace(self.data, score)
                 self.refresh()
         else:
-            self.data.append(score)
+            heapq.heappush(self.data, score)
             self.refresh()
 
 
@@ -43,7 +47,7 @@ class HarmonicSumScorer():
 
         """
         if self.data:
-            self.min = min(self.data)
+            self.min = self.data[0]
         else:
             self.min = 0.
 
@@ -57,7 +61,8 @@ class HarmonicSumScorer():
         Returns:
             harmonic_sum (float): the harmonic sum of the pool of values
         """
-        return self.harmonic_sum(self.data, *args, **kwargs)
+        #harmonic_sum sorts in place, which would break the heap
+        return self.harmonic_sum(list(self.data), *args, **kwargs)
 
     @staticmethod
     def harmonic_sum(data,
@@ -84,4 +89,102 @@ class HarmonicSumScorer():
     def sigmoid_scaling(value,mid_value=100, precision=3):
         center = 1
         s = 2. / (1 + np.exp(1./mid_value * (value - center)))
-        return round(s, precision)
\ No newline at end of file
+        return round(s, precision)
+
+
+def grouped_harmonic_sum(groups, scores, n_groups, max_entries=100, scale_factor=1, cap=None):
+    """
+    The harmonic sums of many groups of scores at once, each the same as a
+    HarmonicSumScorer(buffer=max_entries) with the scores of the group would
+    give
+    Args:
+        groups (array): the group index of each score, from 0 to n_groups - 1
+        scores (array): the scores
+        n_groups (int): the number of groups
+        max_entries (int): only the top max_entries scores of a group count
+        scale_factor (float): the scaling factor of HarmonicSumScorer.harmonic_sum
+        cap (float): if not None, no harmonic sum is higher than the cap value
+
+    Returns:
+        harmonic_sums (array): the harmonic sum of each group, 0 for the groups without scores
+    """
+    groups = np.asarray(groups, dtype=np.int64)
+    scores = np.asarray(scores, dtype=np.float64)
+
+    #a single sort ranks the scores of every group from the highest down
+    order = np.lexsort((-scores, groups))
+    groups = groups[order]
+    scores = scores[order]
+    ranks = np.arange(len(groups)) - np.searchsorted(groups, groups, side='left')
+
+    top = ranks < max_entries
+    #bincount adds up in the order of the scores, as harmonic_sum does
+    harmonic_sums = np.bincount(groups[top],
+                                weights=scores[top] / (ranks[top] + 1.) ** scale_factor,
+                                minlength=n_groups)
+    if cap is not None:
+        np.minimum(harmonic_sums, cap, out=harmonic_sums)
+    return harmonic_sums
+
+
+"""
+The harmonic sum scores of n target/disease pairs, as arrays of shape
+(n, number of datasources), (n, number of datatypes) and (n,)
+"""
+HarmonicSums = collections.namedtuple('HarmonicSums', ['datasources', 'datatypes', 'overall'])
+
+
+class HarmonicSumBatchScorer(object):
+    """
+    Computes the datasource, datatype and overall harmonic sums of all the
+    target/disease pairs of a target at once from numpy arrays of their
+    evidence scores, instead of one HarmonicSumScorer per datasource, datatype
+    and pair. The datasources and datatypes are the columns of the results, in
+    the order of self.datasources and self.datatypes
+    """
+
+    def __init__(self, datasources_to_datatypes, max_entries=100, scale_factor=2):
+        self.max_entries = max_entries
+        self.scale_factor = scale_factor
+        self.datasources = sorted(datasources_to_datatypes)
+        self.datatypes = sorted(set(datasources_to_datatypes.values()))
+        self.datasource_index = dict((ds, i) for i, ds in enumerate(self.datasources))
+        datatype_index = dict((dt, i) for i, dt in enumerate(self.datatypes))
+        self.datasource_datatype = np.array([datatype_index[datasources_to_datatypes[ds]]
+                                             for ds in self.datasources], dtype=np.int64)
+
+    def score(self, pairs, datasources, scores, n_pairs):
+        """
+        Args:
+            pairs (array): the pair index of each evidence score, from 0 to n_pairs - 1
+            datasources (array): the datasource index of each evidence score, see datasource_index
+            scores (array): the evidence scores
+            n_pairs (int): the number of pairs
+
+        Returns:
+            HarmonicSums of the pairs
+        """
+        n_datasources = len(self.datasources)
+        n_datatypes = len(self.datatypes)
+        pairs = np.asarray(pairs, dtype=np.int64)
+        datasources = np.asarray(datasources, dtype=np.int64)
+
+        #datasource scores are capped so very big scores do not take over
+        #smaller scores around the range of 1
+        datasource_scores = grouped_harmonic_sum(pairs * n_datasources + datasources, scores,
+                                                 n_pairs * n_datasources, self.max_entries,
+                                                 self.scale_factor, cap=1)
+
+        #the datasources without evidence of a pair score 0, which adds
+        #nothing to the harmonic sums
+        datasource_pairs = np.repeat(np.arange(n_pairs, dtype=np.int64), n_datasources)
+        datatypes = np.tile(self.datasource_datatype, n_pairs)
+        datatype_scores = grouped_harmonic_sum(datasource_pairs * n_datatypes + datatypes,
+                                               datasource_scores, n_pairs * n_datatypes,
+                                               self.max_entries, self.scale_factor)
+        overall = grouped_harmonic_sum(datasource_pairs, datasource_scores, n_pairs,
+                                       self.max_entries, self.scale_factor)
+
+        return HarmonicSums(datasource_scores.reshape(n_pairs, n_datasources),
+                            datatype_scores.reshape(n_pairs, n_datatypes),
+                            overall)
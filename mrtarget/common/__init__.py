@@ -1,8 +1,10 @@
 from __future__ import absolute_import, print_function
 
+import contextlib
 import functools
 from contextlib import contextmanager
-import gzip
+import io
+import zlib
 import zipfile
 import logging
 import tempfile as tmp
@@ -21,7 +23,52 @@ def urllify(string_name):
         return 'file://'+os.path.abspath(string_name)
 
 
+class GzipStreamReader(io.RawIOBase):
+    """Decompress a gzip stream from any file-like object as it is read,
+    so a remote file does not need to be stored before it can be read.
+
+    Concatenated gzip members are read one after the other as gzip does.
+    """
+    def __init__(self, fileobj, buffer_size=io.DEFAULT_BUFFER_SIZE):
+        io.RawIOBase.__init__(self)
+        self.fileobj = fileobj
+        self.buffer_size = buffer_size
+        self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self._pending = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._pending:
+            compressed = self._decompressor.unused_data
+            if compressed:
+                #next gzip member
+                self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            else:
+                compressed = self.fileobj.read(self.buffer_size)
+                if not compressed:
+                    self._pending = self._decompressor.flush()
+                    if not self._pending:
+                        return 0
+                    break
+            self._pending = self._decompressor.decompress(compressed)
+
+        size = min(len(b), len(self._pending))
+        b[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            self.fileobj.close()
+        io.RawIOBase.close(self)
+
+
 class URLZSource(object):
+    #size of the reads from the network or disk and of the line buffers
+    BUFFER_SIZE = 1024 * 1024
+
     def __init__(self, filename, *args, **kwargs):
         """Easy way to open multiple types of URL protocol (e.g. http:// and file://)
         as well as handling compressed content (e.g. .gz or .zip) if appropriate.
@@ -29,6 +76,11 @@ class URLZSource(object):
         Just in case you need to use proxies for url use it as normal
         named arguments to requests.
 
+        Content is streamed and decompressed as it is read. Only .zip files
+        from a remote url need random access, so those are spooled to a
+        temporary file that is removed when the source is closed. Pass
+        spool=True to always download to a temporary file first.
+
         >>> # proxies = {}
         >>> # if Config.HAS_PROXY:
         ...    # self.proxies = {"http": Config.PROXY,
@@ -38,6 +90,7 @@ class URLZSource(object):
         """
         self._log = logging.getLogger(__name__)
         self.filename = urllify(filename)
+        self.spool = kwargs.pop('spool', False)
         self.args = args
         self.kwargs = kwargs
         self.proxies = None
@@ -47,14 +100,15 @@ class URLZSource(object):
     @contextmanager
     def _open_local(self, filename, mode):
         """
-        This is an internal function to handle opening the temporary file 
-        that the URL has been downloaded to, including handling compression
-        if appropriate
+        This is an internal function to handle opening a local file,
+        including the temporary file a URL has been spooled to, handling
+        compression if appropriate
         """
         open_f = None
 
         if filename.endswith('.gz'):
-            open_f = functools.partial(gzip.open, mode='rb')
+            open_f = lambda f: io.BufferedReader(
+                GzipStreamReader(open(f, 'rb'), self.BUFFER_SIZE), self.BUFFER_SIZE)
 
         elif filename.endswith('.zip'):
             zipped_data = zipfile.ZipFile(filename)
@@ -63,37 +117,98 @@ class URLZSource(object):
             filename = info
             open_f = functools.partial(zipped_data.open)
         else:
-            open_f = functools.partial(open, mode='r')
+            open_f = functools.partial(open, mode='r', buffering=self.BUFFER_SIZE)
 
-        with open_f(filename) as fd:
+        with contextlib.closing(open_f(filename)) as fd:
             yield fd
 
     @contextmanager
-    def open(self, mode='r'):
+    def _open_response(self, response, local_filename):
         """
-        This downloads the URL to a temporary file, naming the file
-        based on the URL. 
+        This is an internal function to read a url response as it arrives,
+        decompressing gzip content on the fly
         """
+        #let urllib3 undo any content-encoding of the transfer
+        response.raw.decode_content = True
+        if local_filename.endswith('.gz'):
+            fd = io.BufferedReader(GzipStreamReader(response.raw, self.BUFFER_SIZE),
+                                   self.BUFFER_SIZE)
+        else:
+            fd = io.BufferedReader(_ResponseReader(response.raw), self.BUFFER_SIZE)
 
-        if self.filename.startswith('ftp://'):
-            self._log.error('Not implemented ftp protocol')
-            NotImplementedError('finish ftp')
+        with contextlib.closing(fd):
+            yield fd
 
-        else:
-            local_filename = self.filename.split('://')[-1].split('/')[-1]
-            f = self.r_session.get(url=self.filename, stream=True, **self.kwargs)
-            f.raise_for_status()
-            file_to_open = None
-            #this has to be "delete=false" so that it can be re-opened with the same filename
-            #to be read out again
-            with tmp.NamedTemporaryFile(mode='wb', suffix=local_filename, delete=False) as fd:
+    @contextmanager
+    def _open_spooled(self, response, local_filename, mode):
+        """
+        This downloads the url response to a temporary file, naming the file
+        based on the URL, and removes it once it has been read
+        """
+        #this has to be "delete=false" so that it can be re-opened with the same filename
+        #to be read out again
+        with tmp.NamedTemporaryFile(mode='wb', suffix=local_filename, delete=False) as fd:
+            file_to_open = fd.name
+            try:
                 # write data into file in streaming fashion
-                file_to_open = fd.name
-                for block in f.iter_content(1024):
+                for block in response.iter_content(self.BUFFER_SIZE):
                     fd.write(block)
+            except:
+                os.remove(file_to_open)
+                raise
 
+        try:
             with self._open_local(file_to_open, mode) as fd:
                 yield fd
+        finally:
+            os.remove(file_to_open)
+
+    @contextmanager
+    def open(self, mode='r'):
+        """
+        This opens the URL for reading, streaming its content unless it
+        has to be spooled to a temporary file first
+        """
+
+        if self.filename.startswith('ftp://'):
+            self._log.error('Not implemented ftp protocol')
+            raise NotImplementedError('finish ftp')
+
+        local_filename = self.filename.split('://')[-1].split('/')[-1]
+
+        if self.filename.startswith('file://') and not self.spool:
+            #no need to go through requests for a local file
+            with self._open_local(self.filename[len('file://'):], mode) as fd:
+                yield fd
+            return
+
+        f = self.r_session.get(url=self.filename, stream=True, **self.kwargs)
+        try:
+            f.raise_for_status()
+            if self.spool or local_filename.endswith('.zip'):
+                with self._open_spooled(f, local_filename, mode) as fd:
+                    yield fd
+            else:
+                with self._open_response(f, local_filename) as fd:
+                    yield fd
+        finally:
+            f.close()
+
+
+class _ResponseReader(io.RawIOBase):
+    """Raw reader over a urllib3 response so it can be wrapped in a
+    large io.BufferedReader"""
+    def __init__(self, fileobj):
+        io.RawIOBase.__init__(self)
+        self.fileobj = fileobj
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        data = self.fileobj.read(len(b))
+        b[:len(data)] = data
+        return len(data)
 
 
 def require_all(*predicates):
@@ -12,8 +12,10 @@ from mrtarget.common.DataStructure import JSONSerializable
 from mrtarget.common.ElasticsearchLoader import Loader
 from mrtarget.common.ElasticsearchQuery import ESQuery
 from mrtarget.common.connection import new_es_client, new_redis_client
+from mrtarget.common.Batching import batched_by_weight, batch_queue_size, flat_map_batch, map_batch
 from mrtarget.common.LookupHelpers import LookUpDataRetriever, LookUpDataType
-from mrtarget.common.Scoring import ScoringMethods, HarmonicSumScorer
+from mrtarget.common.Scoring import ScoringMethods, HarmonicSumScorer, HarmonicSumBatchScorer
+from mrtarget.common.ScoreSidecar import ScoreSidecar, get_score_row, iter_score_rows
 from mrtarget.modules.EFO import EFO
 from mrtarget.common.EvidenceString import Evidence, ExtendedInfoGene, ExtendedInfoEFO
 from mrtarget.modules.GeneData import Gene
@@ -289,56 +291,125 @@ class Scorer():
 
         return association
 
+    def score_pairs(self, pairs, datasources_to_datatypes):
+        '''
+        Same as score for each of the (target, disease, evidence scores, is_direct)
+        pairs, with the harmonic sums of all of them computed at once by a
+        HarmonicSumBatchScorer. Returns the Association of each pair
+        '''
+        batch_scorer = HarmonicSumBatchScorer(datasources_to_datatypes, 100, 2)
+        datasource_index = batch_scorer.datasource_index
+
+        pair_indexes = []
+        datasource_indexes = []
+        scores = []
+        for i, (target, disease, evidence_scores, is_direct) in enumerate(pairs):
+            for e in evidence_scores:
+                pair_indexes.append(i)
+                datasource_indexes.append(datasource_index[e.datasource])
+                scores.append(e.score)
+        harmonic_sums = batch_scorer.score(pair_indexes, datasource_indexes, scores, len(pairs))
+        datasource_scores = harmonic_sums.datasources.tolist()
+        datatype_scores = harmonic_sums.datatypes.tolist()
+        overall_scores = harmonic_sums.overall.tolist()
+
+        associations = []
+        for i, (target, disease, evidence_scores, is_direct) in enumerate(pairs):
+            association = Association(target, disease, is_direct,
+                datasources_to_datatypes.keys(), set(datasources_to_datatypes.values()))
+
+            for e in evidence_scores:
+                association.evidence_count['total']+=1
+                association.evidence_count['datatypes'][e.datatype]+=1
+                association.evidence_count['datasources'][e.datasource]+=1
+                association.set_available_datatype(e.datatype)
+                association.set_available_datasource(e.datasource)
+
+            har_sum_score = association.get_scoring_method(ScoringMethods.HARMONIC_SUM)
+            for ds, score in zip(batch_scorer.datasources, datasource_scores[i]):
+                har_sum_score.datasources[ds] = score
+            for dt, score in zip(batch_scorer.datatypes, datatype_scores[i]):
+                har_sum_score.datatypes[dt] = score
+            har_sum_score.overall = overall_scores[i]
+
+            associations.append(association)
+
+        return associations
+
+def score_target_evidence(produce, datasources_to_datatypes, data, *args):
+    '''the scored Association of every target/disease pair produce returns for data'''
+    pairs = [pair for pair in produce(data, *args) if pair[2]]
+    if not pairs:
+        return []
+    return Scorer().score_pairs(pairs, datasources_to_datatypes)
+
 def produce_evidence_local_init(es_hosts, 
         scoring_weights, is_direct_do_not_propagate, datasources_to_datatypes):
     es = new_es_client(es_hosts)
     es_query = ESQuery(es)
     return es_query, scoring_weights, is_direct_do_not_propagate, datasources_to_datatypes
 
-def produce_evidence(data, es_query, 
+def group_evidence_scores(score_rows,
         scoring_weights, is_direct_do_not_propagate, datasources_to_datatypes):
+    """group the EvidenceScoreRow of the evidence of a target by target/disease pair.
+    Returns a list of (target, disease, evidence scores, is_direct)"""
     data_cache = {}
-    target = data
 
     return_values = []
 
-    available_evidence = es_query.count_evidence_for_target(target)
-    if available_evidence:
-        evidence_iterator = es_query.get_evidence_for_target_simple(target, available_evidence)
-        for evidence in evidence_iterator:
-            efo_list = [evidence['disease']['id']] \
-                if evidence['sourceID'] in is_direct_do_not_propagate \
-                else evidence['private']['efo_codes']
-
-            for efo in efo_list:
-                key = (evidence['target']['id'], efo)
-                if key not in data_cache:
-                    data_cache[key] = []
-
-                data_source = evidence['sourceID']
-                
-                score = evidence['scores']['association_score']
-                if data_source in scoring_weights:
-                    score = score * scoring_weights[data_source]
-                    
-                is_direct = (efo == evidence['disease']['id'])
-                data_type = datasources_to_datatypes[data_source]
-
-                row = EvidenceScore(score, data_type, data_source, is_direct)
-                data_cache[key].append(row)
-
-        for key,evidence in data_cache.items():
-            #if any of the evidence is direct, the assication is direct
-            is_direct = False
-            for e in evidence:
-                if e.is_direct:
-                    is_direct = True
-                    break
-
-            return_values.append((key[0],key[1], evidence, is_direct))
+    for target, disease, efo_codes, data_source, score, hash in score_rows:
+        efo_list = [disease] \
+            if data_source in is_direct_do_not_propagate \
+            else efo_codes
+
+        if data_source in scoring_weights:
+            score = score * scoring_weights[data_source]
+        data_type = datasources_to_datatypes[data_source]
+
+        for efo in efo_list:
+            key = (target, efo)
+            if key not in data_cache:
+                data_cache[key] = []
+
+            is_direct = (efo == disease)
+
+            row = EvidenceScore(score, data_type, data_source, is_direct)
+            data_cache[key].append(row)
+
+    for key,evidence in data_cache.items():
+        #if any of the evidence is direct, the assication is direct
+        is_direct = False
+        for e in evidence:
+            if e.is_direct:
+                is_direct = True
+                break
+
+        return_values.append((key[0],key[1], evidence, is_direct))
 
     return return_values
 
+def produce_evidence(data, es_query, 
+        scoring_weights, is_direct_do_not_propagate, datasources_to_datatypes):
+    target, available_evidence = data
+
+    if not available_evidence:
+        return []
+
+    evidence_iterator = es_query.get_evidence_for_target_simple(target, available_evidence)
+    return group_evidence_scores((get_score_row(evidence) for evidence in evidence_iterator),
+        scoring_weights, is_direct_do_not_propagate, datasources_to_datatypes)
+
+def produce_sidecar_evidence_local_init(ids,
+        scoring_weights, is_direct_do_not_propagate, datasources_to_datatypes):
+    return ids, scoring_weights, is_direct_do_not_propagate, datasources_to_datatypes
+
+def produce_sidecar_evidence(data, ids,
+        scoring_weights, is_direct_do_not_propagate, datasources_to_datatypes):
+    """same as produce_evidence but from the TargetScores read by ScoreSidecar"""
+    target, available_evidence, target_scores = data
+    return group_evidence_scores(iter_score_rows(target_scores, ids),
+        scoring_weights, is_direct_do_not_propagate, datasources_to_datatypes)
+
 def produce_evidence_local_shutdown(status, es_query, 
         scoring_weights, is_direct_do_not_propagate, datasources_to_datatypes):
     pass
@@ -347,79 +418,80 @@ def produce_evidence_local_shutdown(status, es_query,
 def score_producer_local_init(es_hosts, redis_host, redis_port, 
         lookup_data, datasources_to_datatypes, dry_run):
 
-    #set the R server to lookup into
-    r_server = new_redis_client(redis_host, redis_port)
-
-    scorer = Scorer()
+    #set the R server to lookup into, if the lookup tables are in redis
+    r_server = None
+    if redis_host:
+        r_server = new_redis_client(redis_host, redis_port)
 
     loader = Loader(new_es_client(es_hosts))
 
-    return scorer, loader, r_server, lookup_data, datasources_to_datatypes, dry_run
+    return loader, r_server, lookup_data, datasources_to_datatypes, dry_run
 
 def score_producer(data, 
-        scorer, loader, r_server, lookup_data, datasources_to_datatypes, dry_run):
-    target, disease, evidence, is_direct = data
+        loader, r_server, lookup_data, datasources_to_datatypes, dry_run):
+    score = data
+    target, disease = score.target['id'], score.disease['id']
 
     logger = logging.getLogger(__name__)
 
-    if evidence:
-        score = scorer.score(target, disease, evidence, is_direct, 
-            datasources_to_datatypes)
-        # skip associations only with data with score 0
-        if score: 
-
-            gene_data = Gene()
-            try:
-                gene_data.load_json(
-                    lookup_data.available_genes.get_gene(target, r_server))
-
-            except KeyError as e:
-                logger.debug('Cannot find gene code "%s" '
-                                    'in lookup table' % target)
-                raise e
-            score.set_target_data(gene_data)
-
-            # create a hpa expression empty jsonserializable class
-            # to fill from Redis cache lookup_data
-            hpa_data = HPAExpression()
-            try:
-                hpa_data.update(
-                    lookup_data.available_hpa.get_hpa(target, r_server))
-            except KeyError:
-                pass
-            except Exception as e:
-                raise e
-            try:
-                score.set_hpa_data(hpa_data)
-            except KeyError:
-                pass
-            except Exception as e:
-                raise e
-
-
-            disease_data = EFO()
-            try:
-                disease_data.load_json(
-                    lookup_data.available_efos.get_efo(disease, r_server))
-            except KeyError as e:
-                logger.debug('Cannot find EFO code "%s" '
-                                    'in lookup table' % disease)
-                logger.exception(e)
-
-            score.set_disease_data(disease_data)
-
-
-            element_id = '%s-%s' % (target, disease)
-            if not dry_run:
-                loader.put(Const.ELASTICSEARCH_DATA_ASSOCIATION_INDEX_NAME,
-                    Const.ELASTICSEARCH_DATA_ASSOCIATION_DOC_NAME,
-                    element_id, score)
+    # skip associations only with data with score 0
+    if score: 
+
+        gene_data = Gene()
+        try:
+            gene_data.load_json(
+                lookup_data.available_genes.get_gene(target, r_server))
+
+        except KeyError as e:
+            logger.debug('Cannot find gene code "%s" '
+                                'in lookup table' % target)
+            raise e
+        score.set_target_data(gene_data)
+
+        # create a hpa expression empty jsonserializable class
+        # to fill from Redis cache lookup_data
+        hpa_data = HPAExpression()
+        try:
+            hpa_data.update(
+                lookup_data.available_hpa.get_hpa(target, r_server))
+        except KeyError:
+            pass
+        except Exception as e:
+            raise e
+        try:
+            score.set_hpa_data(hpa_data)
+        except KeyError:
+            pass
+        except Exception as e:
+            raise e
+
+
+        disease_data = EFO()
+        try:
+            disease_data.load_json(
+                lookup_data.available_efos.get_efo(disease, r_server))
+        except KeyError as e:
+            logger.debug('Cannot find EFO code "%s" '
+                                'in lookup table' % disease)
+            logger.exception(e)
+
+        score.set_disease_data(disease_data)
+
+
+        element_id = '%s-%s' % (target, disease)
+        if not dry_run:
+            loader.put(Const.ELASTICSEARCH_DATA_ASSOCIATION_INDEX_NAME,
+                Const.ELASTICSEARCH_DATA_ASSOCIATION_DOC_NAME,
+                element_id, score)
 
-        else:
-            logger.warning('Skipped association with score 0: %s-%s' % (target, disease))
+    else:
+        logger.warning('Skipped association with score 0: %s-%s' % (target, disease))
 
 def score_producer_local_shutdown(status, 
-        scorer, loader, r_server, lookup_data, datasources_to_datatypes, dry_run):
+        loader, r_server, lookup_data, datasources_to_datatypes, dry_run):
+
+    logger = logging.getLogger(__name__)
+    logger.debug("lookup tables cache usage %s", str(lookup_data.cache_info()))
 
     #cleanup elasticsearch
     if not dry_run:
@@ -427,6 +499,9 @@ def score_producer_local_shutdown(status,
 
 class ScoringProcess():
 
+    #each evidence producer gets at least this many batches of targets
+    BATCHES_PER_WORKER = 20
+
     def __init__(self, redis_host, redis_port, es_hosts):
 
         self.logger = logging.getLogger(__name__)
@@ -438,73 +513,123 @@ class ScoringProcess():
 
         self.redis_host = redis_host
         self.redis_port = redis_port
-        self.r_server = new_redis_client(self.redis_host, self.redis_port)
+        #no redis_host when the lookup tables are mmap snapshots
+        self.r_server = None
+        if self.redis_host:
+            self.r_server = new_redis_client(self.redis_host, self.redis_port)
 
     def process_all(self, scoring_weights, is_direct_do_not_propagate,
             datasources_to_datatypes, dry_run, 
-            num_workers_produce, num_workers_score, max_queued_produce_to_score):
-
-        lookup_data = LookUpDataRetriever(self.es, self.r_server,
+            num_workers_produce, num_workers_score, max_queued_produce_to_score,
+            lookup_cache_size=0, lookup_cache_ttl=None, lookup_codec='pickle',
+            lookup_backend='redis', lookup_snapshot_dir=None,
+            batch_size=1, scores_folder=None):
+        """score the associations of all the targets with evidence. The evidence is
+        read from elasticsearch, or if scores_folder from the evidence score files
+        written there by --val"""
+
+        lookup_retriever = LookUpDataRetriever(self.es, self.r_server,
             targets=[],
             data_types=(
                 LookUpDataType.DISEASE,
                 LookUpDataType.TARGET,
                 LookUpDataType.ECO,
                 LookUpDataType.HPA
-            )).lookup
-
-        targets = list(self.es_query.get_all_target_ids_with_evidence_data())
+            ),
+            cache_size=lookup_cache_size,
+            cache_ttl=lookup_cache_ttl,
+            codec=lookup_codec,
+            backend=lookup_backend,
+            snapshot_dir=lookup_snapshot_dir)
+        lookup_data = lookup_retriever.lookup
+
+        try:
+            #only the targets with evidence, largest first so that the largest
+            #targets are not the last ones still running
+            sidecar = None
+            if scores_folder:
+                sidecar = ScoreSidecar(scores_folder)
+                target_counts = sidecar.get_target_counts()
+            else:
+                target_counts = self.es_query.get_target_evidence_counts()
+            target_counts = sorted(target_counts,
+                                   key=lambda target_count: (-target_count[1], target_count[0]))
+            total_evidence = sum(count for target, count in target_counts)
+            self.logger.info('scoring %d targets with %d evidence', len(target_counts), total_evidence)
 
-        #setup elasticsearch
-        if not dry_run:
-            self.es_loader.create_new_index(Const.ELASTICSEARCH_DATA_ASSOCIATION_INDEX_NAME)
-            self.es_loader.prepare_for_bulk_indexing(
-                self.es_loader.get_versioned_index(Const.ELASTICSEARCH_DATA_ASSOCIATION_INDEX_NAME))
-
-        self.logger.info('setting up stages')
-
-        #bake the arguments for the setup into function objects
-        produce_evidence_local_init_baked = functools.partial(produce_evidence_local_init, 
-            self.es_hosts, scoring_weights, is_direct_do_not_propagate, datasources_to_datatypes)
-        score_producer_local_init_baked = functools.partial(score_producer_local_init, 
-            self.es_hosts, self.redis_host, self.redis_port,
-            lookup_data, datasources_to_datatypes, dry_run)
+            #setup elasticsearch
+            if not dry_run:
+                self.es_loader.create_new_index(Const.ELASTICSEARCH_DATA_ASSOCIATION_INDEX_NAME)
+                self.es_loader.prepare_for_bulk_indexing(
+                    self.es_loader.get_versioned_index(Const.ELASTICSEARCH_DATA_ASSOCIATION_INDEX_NAME))
+
+            self.logger.info('setting up stages')
+
+            #bake the arguments for the setup into function objects
+            if sidecar is not None:
+                produce = produce_sidecar_evidence
+                produce_evidence_local_init_baked = functools.partial(produce_sidecar_evidence_local_init,
+                    sidecar.ids, scoring_weights, is_direct_do_not_propagate, datasources_to_datatypes)
+                produce_evidence_local_shutdown_baked = None
+                #each target goes with its rows of scores
+                target_counts = ((target, count, sidecar.get_target_scores(target))
+                    for target, count in target_counts)
+            else:
+                produce = produce_evidence
+                produce_evidence_local_init_baked = functools.partial(produce_evidence_local_init,
+                    self.es_hosts, scoring_weights, is_direct_do_not_propagate, datasources_to_datatypes)
+                produce_evidence_local_shutdown_baked = produce_evidence_local_shutdown
+            score_producer_local_init_baked = functools.partial(score_producer_local_init, 
+                self.es_hosts, self.redis_host, self.redis_port,
+                lookup_data, datasources_to_datatypes, dry_run)
         
-        #this doesn't need to be in the external config, since its so content light
-        #as to be meaningless
-        max_queued_score_out = 10000
-
-        #pipeline stage for making the lists of the target/disease pairs and evidence
-        pipeline_stage = pr.flat_map(produce_evidence, targets, 
-            workers=num_workers_produce,
-            maxsize=max_queued_produce_to_score,
-            on_start=produce_evidence_local_init_baked, 
-            on_done=produce_evidence_local_shutdown)
-
-        #pipeline stage for scoring the evidence sets
-        #includes writing to elasticsearch
-        pipeline_stage = pr.each(score_producer, pipeline_stage, 
-            workers=num_workers_score,
-            maxsize=max_queued_score_out,
-            on_start=score_producer_local_init_baked, 
-            on_done=score_producer_local_shutdown)
-
-
-        #loop over the end of the pipeline to make sure everything is finished
-        self.logger.info('stages created, running scoring and writing')
-        pr.run(pipeline_stage)
-        self.logger.info('stages created, ran scoring and writing')
-
-        #cleanup elasticsearch
-        if not dry_run:
-            self.logger.info('flushing data to index')
-            self.es_loader.flush_all_and_wait(Const.ELASTICSEARCH_DATA_ASSOCIATION_INDEX_NAME)
-            #restore old pre-load settings
-            #note this automatically does all prepared indexes
-            self.es_loader.restore_after_bulk_indexing()
-            self.logger.info('flushed data to index')
+            #this doesn't need to be in the external config, since its so content light
+            #as to be meaningless
+            max_queued_score_out = 10000
+
+            #targets and pairs go between stages in lists of up to batch_size
+            #so queue sizes are in batches. A list of targets also ends once it has
+            #a fraction of the evidence for each worker, so large targets go alone
+            max_batch_evidence = max(1, total_evidence // (max(1, num_workers_produce) * self.BATCHES_PER_WORKER))
+            target_batches = batched_by_weight(target_counts, batch_size, max_batch_evidence,
+                lambda target_count: target_count[1])
+
+            #pipeline stage for making the lists of the target/disease pairs and evidence
+            #and scoring all the pairs of each target at once
+            produce_scored = functools.partial(score_target_evidence, produce, datasources_to_datatypes)
+            pipeline_stage = pr.flat_map(
+                functools.partial(flat_map_batch, produce_scored, batch_size), target_batches,
+                workers=num_workers_produce,
+                maxsize=batch_queue_size(max_queued_produce_to_score, batch_size),
+                on_start=produce_evidence_local_init_baked, 
+                on_done=produce_evidence_local_shutdown_baked)
+
+            #pipeline stage for adding the target and disease data to the associations
+            #includes writing to elasticsearch
+            pipeline_stage = pr.each(functools.partial(map_batch, score_producer), pipeline_stage,
+                workers=num_workers_score,
+                maxsize=batch_queue_size(max_queued_score_out, batch_size),
+                on_start=score_producer_local_init_baked, 
+                on_done=score_producer_local_shutdown)
+
+
+            #loop over the end of the pipeline to make sure everything is finished
+            self.logger.info('stages created, running scoring and writing')
+            pr.run(pipeline_stage)
+            self.logger.info('stages created, ran scoring and writing')
+
+            #cleanup elasticsearch
+            if not dry_run:
+                self.logger.info('flushing data to index')
+                self.es_loader.flush_all_and_wait(Const.ELASTICSEARCH_DATA_ASSOCIATION_INDEX_NAME)
+                #restore old pre-load settings
+                #note this automatically does all prepared indexes
+                self.es_loader.restore_after_bulk_indexing()
+                self.logger.info('flushed data to index')
 
-        self.logger.info("DONE")
+            self.logger.info("DONE")
+        finally:
+            lookup_retriever.close()
 
     """
     Run a series of QC tests on EFO elasticsearch index. Returns a dictionary
@@ -512,16 +637,19 @@ class ScoringProcess():
     """
     def qc(self, esquery):
 
-        #number of eco entries
-        association_count = 0
-        #Note: try to avoid doing this more than once!
-        for association in esquery.get_all_associations():
-            association_count += 1
-            if association_count % 1000 == 0:
-                self.logger.debug("checking %d", association_count)
+        #counts and score distribution computed by elasticsearch in one request
+        association_count, buckets = esquery.get_index_metrics(
+            Const.ELASTICSEARCH_DATA_ASSOCIATION_INDEX_NAME,
+            terms=('is_direct', 'private.facets.datasource.keyword'),
+            histograms=(('harmonic-sum.overall', 0.1),))
 
         #put the metrics into a single dict
         metrics = dict()
         metrics["association.count"] = association_count
+        metrics["association.direct.count"] = buckets['is_direct'].get('true', 0)
+        for datasource, count in buckets['private.facets.datasource.keyword'].items():
+            metrics["association.datasource.%s.count" % datasource] = count
+        metrics["association.score.histogram"] = ["%.1f:%d" % (score, count)
+            for score, count in sorted(buckets['harmonic-sum.overall'].items())]
 
         return metrics
\ No newline at end of file
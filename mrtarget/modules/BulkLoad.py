@@ -0,0 +1,78 @@
+import glob
+import gzip
+import logging
+import os
+import functools
+import pypeln.process as pr
+
+from mrtarget.common.ElasticsearchLoader import Loader
+from mrtarget.common.connection import new_es_client
+import mrtarget.common.JsonBackend as JsonBackend
+
+
+"""
+This function is called once in each child process to get a loader that
+sends to elasticsearch even if the stages were told to write files
+"""
+def bulk_load_local_init(es_hosts, dry_run):
+    return Loader(new_es_client(es_hosts), dry_run=dry_run, write_to_es=True),
+
+
+"""
+Read one of the gzipped bulk files written by Loader and send its documents.
+Returns the number of documents
+"""
+def bulk_load_file(filename, es_loader):
+    logger = logging.getLogger(__name__)
+    logger.info('loading %s', filename)
+    count = 0
+    with gzip.open(filename, 'rb') as bulk_file:
+        for action_line in bulk_file:
+            source = next(bulk_file).rstrip('\n')
+            action = JsonBackend.loads(action_line)['index']
+            es_loader.put_versioned(action['_index'], action['_type'], action['_id'], source)
+            count += 1
+    logger.info('loaded %d documents from %s', count, filename)
+    return count
+
+
+def bulk_load_local_shutdown(status, es_loader):
+    #this loader did not prepare any index, so closing it leaves their
+    #settings alone until they are restored once in bulk_load_folder
+    es_loader.close()
+
+
+def bulk_load_folder(es, es_hosts, folder, num_workers, dry_run=False):
+    """create the indexes listed in the folder and load all its bulk files
+    into them, one file at a time in each of num_workers processes"""
+    logger = logging.getLogger(__name__)
+
+    indexes_filename = os.path.join(folder, Loader.INDEXES_FILENAME)
+    indexes = []
+    if os.path.isfile(indexes_filename):
+        with open(indexes_filename) as indexes_file:
+            for line in indexes_file:
+                if line.strip() and line.strip() not in indexes:
+                    indexes.append(line.strip())
+
+    filenames = sorted(glob.glob(os.path.join(folder, Loader.BULK_FILENAME_PATTERN)))
+    if not filenames:
+        raise RuntimeError("No bulk files found in %s" % folder)
+
+    es_loader = Loader(es, dry_run=dry_run, write_to_es=True)
+    for index_name in indexes:
+        es_loader.create_versioned_index(index_name)
+        es_loader.prepare_for_bulk_indexing(index_name)
+
+    logger.info('loading %d bulk files into %s', len(filenames), ", ".join(indexes))
+    counts = pr.map(bulk_load_file, filenames,
+        workers=num_workers, maxsize=num_workers,
+        on_start=functools.partial(bulk_load_local_init, es_hosts, dry_run),
+        on_done=bulk_load_local_shutdown)
+    total = sum(pr.to_iterable(counts))
+
+    #flushes, merges and restores the settings of the prepared indexes
+    es_loader.restore_after_bulk_indexing()
+
+    logger.info('loaded %d documents', total)
+    return total
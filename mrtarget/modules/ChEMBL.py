@@ -7,13 +7,13 @@ import dumbdbm
 import tempfile
 
 from mrtarget.common import URLZSource
-import json
+import mrtarget.common.JsonBackend as JsonBackend
 
 
 def get_chembl_info_by_file(uri):
     with URLZSource(uri).open() as f_obj:
         for i, line in enumerate(f_obj, start=1):
-            cheml_dict = json.loads(line)
+            cheml_dict = JsonBackend.loads(line)
             yield cheml_dict
 
 
@@ -53,7 +53,7 @@ class ChEMBLLookup(object):
         shelve_out = shelve.Shelf(dict=dumb_dict)
         with URLZSource(self.molecule_set_uri_pattern).open() as f_obj:
             for line in f_obj:
-                mol = json.loads(line)
+                mol = JsonBackend.loads(line)
                 shelve_out[str(mol["molecule_chembl_id"])] = mol
 
         self._logger.info('ChEMBL Molecule loading done. ')
@@ -17,6 +17,7 @@ import itertools
 from mrtarget.constants import Const
 from mrtarget.Settings import Config
 import pypeln.process as pr
+from mrtarget.common.Batching import batched, batch_queue_size, flat_map_batch, map_batch
 
 class RelationType(object):
     SHARED_DISEASE = 'shared-disease'
@@ -193,7 +194,7 @@ used to standardize d2d and t2t code path
 def handle_pairs(type, subject_labels, subject_data, subject_ids, other_ids, 
         threshold, buckets_number, loader, dry_run, 
         workers_production, workers_score,
-        queue_production_score, queue_score_result):
+        queue_production_score, queue_score_result, batch_size=1):
 
     #do some initial setup
     vectorizer = DictVectorizer(sparse=True)
@@ -226,22 +227,28 @@ def handle_pairs(type, subject_labels, subject_data, subject_ids, other_ids,
     calculate_pairs_local_init_baked = functools.partial(calculate_pairs_local_init, 
         type, subject_labels, subject_ids, other_ids, threshold, idf, idf_)
 
+    #subjects, pairs and relations go between stages in lists of up to batch_size
+    #so queue sizes are in batches
+    subject_batches = batched(range(len(subject_ids)), batch_size)
+
     #create stage for producing disease-to-disease
-    pipeline_stage = pr.flat_map(produce_pairs, range(len(subject_ids)), 
+    pipeline_stage = pr.flat_map(
+        functools.partial(flat_map_batch, produce_pairs, batch_size), subject_batches,
         workers=workers_production,
-        maxsize=queue_production_score,
+        maxsize=batch_queue_size(queue_production_score, batch_size),
         on_start=produce_pairs_local_init_baked)
 
     #create stage to calculate disease-to-disease
-    pipeline_stage = pr.map(calculate_pair, pipeline_stage, 
+    pipeline_stage = pr.map(functools.partial(map_batch, calculate_pair), pipeline_stage,
         workers=workers_score,
-        maxsize=queue_score_result,
+        maxsize=batch_queue_size(queue_score_result, batch_size),
         on_start=calculate_pairs_local_init_baked)
 
     #store in elasticsearch
     #this could be multi process, but just use a single for now
-    for r in pipeline_stage:
-        store_in_elasticsearch(r, loader, dry_run)
+    for batch in pipeline_stage:
+        for r in batch:
+            store_in_elasticsearch(r, loader, dry_run)
 
 """
 Function to run in child processess
@@ -309,7 +316,8 @@ class DataDrivenRelationProcess(object):
             ddr_workers_production,
             ddr_workers_score,
             ddr_queue_production_score,
-            ddr_queue_score_result):
+            ddr_queue_score_result,
+            batch_size=1):
         start_time = time.time()
 
         target_data, disease_data = self.es_query.get_disease_to_targets_vectors()
@@ -342,7 +350,7 @@ class DataDrivenRelationProcess(object):
         handle_pairs(RelationType.SHARED_TARGET, disease_labels, disease_data, disease_keys, 
             target_keys, 0.19, 1024, self.loader, dry_run, 
             ddr_workers_production, ddr_workers_score, 
-            ddr_queue_production_score, ddr_queue_score_result)
+            ddr_queue_production_score, ddr_queue_score_result, batch_size)
         self.logger.info('handled disease-to-disease')
 
         #calculate and store target-to-target in multiple processess
@@ -350,7 +358,7 @@ class DataDrivenRelationProcess(object):
         handle_pairs(RelationType.SHARED_DISEASE, target_labels, target_data, target_keys, 
             disease_keys, 0.19, 1024, self.loader, dry_run, 
             ddr_workers_production, ddr_workers_score, 
-            ddr_queue_production_score, ddr_queue_score_result)
+            ddr_queue_production_score, ddr_queue_score_result, batch_size)
         self.logger.info('handled target-to-target')
 
         #cleanup elasticsearch
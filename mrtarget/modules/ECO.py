@@ -93,10 +93,8 @@ class EcoProcess():
     def qc(self, esquery):
 
         #number of eco entries
-        eco_count = 0
-        #Note: try to avoid doing this more than once!
-        for eco_entry in esquery.get_all_eco():
-            eco_count += 1
+        eco_count = esquery.count_elements_in_index(Const.ELASTICSEARCH_ECO_INDEX_NAME,
+            Const.ELASTICSEARCH_ECO_DOC_NAME)
 
         #put the metrics into a single dict
         metrics = dict()
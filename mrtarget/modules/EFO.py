@@ -197,7 +197,7 @@ class EfoProcess():
 
         #loop over all efo terms and calculate the metrics
         #Note: try to avoid doing this more than once!
-        for efo_term in esquery.get_all_diseases():
+        for efo_term in esquery.get_all_diseases(fields=['label', 'definition', 'path_labels']):
             efo_term_count += 1
 
             #path_labels is a list of lists of all paths to the root
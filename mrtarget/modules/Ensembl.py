@@ -1,8 +1,8 @@
-import simplejson as json
 import logging
 import more_itertools
 
 from mrtarget.common import URLZSource
+import mrtarget.common.JsonBackend as JsonBackend
 from mrtarget.constants import Const
 
 class EnsemblProcess(object):
@@ -31,7 +31,7 @@ class EnsemblProcess(object):
 
         inserted_lines = 0
         for line in more_itertools.with_iter(URLZSource(ensembl_filename).open()):
-            entry = json.loads(line)
+            entry = JsonBackend.loads(line)
             #store in elasticsearch if not dry running
             if not dry_run:
                 self.loader.put(Const.ELASTICSEARCH_ENSEMBL_INDEX_NAME,
@@ -57,10 +57,7 @@ class EnsemblProcess(object):
         """
         self.logger.info("Starting QC")
         # number of genes
-        ensembl_count = 0
-        # Note: try to avoid doing this more than once!
-        for _ in esquery.get_all_ensembl_genes():
-            ensembl_count += 1
+        ensembl_count = esquery.count_elements_in_index(Const.ELASTICSEARCH_ENSEMBL_INDEX_NAME)
 
         # put the metrics into a single dict
         metrics = dict()
@@ -1,33 +1,66 @@
 import hashlib
 import logging
 import os
-import json
 import pypeln.process as pr
 import addict
 import codecs
 import functools
 import itertools
+import more_itertools
 
-import opentargets_validator.helpers
 import mrtarget.common.IO as IO
+import mrtarget.common.JsonBackend as JsonBackend
 
 from mrtarget.Settings import Config
 
-from mrtarget.common.EvidenceJsonUtils import DatatStructureFlattener
-from mrtarget.common.EvidencesHelpers import make_validated_evs_obj, reduce_tuple_with_sum, setup_writers
+from mrtarget.common.Batching import batched, batch_queue_size, map_batch
+from mrtarget.common.EvidenceJsonUtils import get_canonical_hexdigest
+from mrtarget.common.EvidenceValidator import generate_validator_from_schema
+from mrtarget.common.EvidencesHelpers import make_validated_evs_obj, reduce_tuple_with_sum, setup_writers, \
+    serialise_result
 from mrtarget.common.EvidenceString import EvidenceManager, Evidence
 from mrtarget.common.LookupHelpers import LookUpDataRetriever, LookUpDataType
+from mrtarget.common.ScoreSidecar import prepare_scores_folder
 
 
 def fix_and_score_evidence(validated_evs, datasources_to_datatypes, evidence_manager):
-    """take line as a dict, convert into an evidence object and apply a list of modifiers:
+    """take the parsed evidence, convert into an evidence object and apply a list of modifiers:
     fix_evidence, and if valid then score_evidence, extend data and inject loci
     """
-    left, right = None, None
-    ev = Evidence(validated_evs.line, datasources_to_datatypes)
+    ev = Evidence(validated_evs.evidence, datasources_to_datatypes)
 
     (fixed_ev, _) = evidence_manager.fix_evidence(ev)
 
+    return score_fixed_evidence(validated_evs, fixed_ev, evidence_manager)
+
+
+def fix_and_score_evidence_batch(validated_evs_list, datasources_to_datatypes, evidence_manager):
+    """same as fix_and_score_evidence but for a chunk of validated evidence. The genes,
+    efos and ecos referred by the whole chunk are fetched with a single round trip per
+    lookup table instead of one per key and evidence. Returns a list of (left, right)
+    """
+    evs = [Evidence(validated_evs.evidence, datasources_to_datatypes)
+        for validated_evs in validated_evs_list]
+
+    try:
+        evidence_manager.prefetch_genes(evs)
+        fixed_evs = [evidence_manager.fix_evidence(ev)[0] for ev in evs]
+
+        evidence_manager.prefetch_diseases_and_ecos(fixed_evs)
+        return [score_fixed_evidence(validated_evs, fixed_ev, evidence_manager)
+            for validated_evs, fixed_ev in zip(validated_evs_list, fixed_evs)]
+    finally:
+        evidence_manager.clear_prefetched()
+
+
+def score_fixed_evidence(validated_evs, fixed_ev, evidence_manager):
+    """check a fixed evidence object is valid and if so score it and extend it.
+
+    The extended evidence is kept as a dict in validated_evs.evidence, it is only
+    serialised by the writer
+    """
+    left, right = None, None
+
     (is_valid, problem_str) = evidence_manager.check_is_valid_evs(fixed_ev, 
         datasource=fixed_ev.datasource)
     if is_valid:
@@ -38,10 +71,12 @@ def fix_and_score_evidence(validated_evs, datasources_to_datatypes, evidence_man
         fixed_ev_ext = evidence_manager.get_extended_evidence(fixed_ev)
 
         validated_evs.is_valid = True
-        validated_evs.line = fixed_ev_ext.to_json()
+        validated_evs.evidence = fixed_ev_ext.evidence
         right = validated_evs
 
     else:
+        #the line stays as it was read, as for any other invalid evidence
+        del validated_evs.evidence
         validated_evs.explanation_type = 'invalid_fixed_evidence'
         validated_evs.explanation_str = problem_str
         validated_evs.is_valid = False
@@ -64,6 +99,34 @@ def process_evidence(line, logger, validator, luts, datasources_to_datatypes, ev
     return left, right
 
 
+def process_evidence_batch(lines, logger, validator, luts, datasources_to_datatypes, evidence_manager):
+    """same as process_evidence but for a chunk of lines, so the lookups needed to
+    fix and score the valid ones can be batched. Returns a list of (left, right)
+    """
+    results = []
+    validated = []
+    for line in lines:
+        (left, right) = validate_evidence(line, logger, validator, luts, datasources_to_datatypes)
+        if right is not None:
+            validated.append(right)
+        else:
+            results.append((left, right))
+
+    if validated:
+        results.extend(fix_and_score_evidence_batch(validated, datasources_to_datatypes,
+            evidence_manager))
+
+    return results
+
+
+def process_evidence_batch_serialised(lines, logger, validator, luts, datasources_to_datatypes,
+        evidence_manager):
+    """same as process_evidence_batch but the results only hold the id and json of each
+    document, that is all the writers need"""
+    return [serialise_result(result) for result in process_evidence_batch(lines, logger,
+        validator, luts, datasources_to_datatypes, evidence_manager)]
+
+
 """
 This function is called once in each child process to do local setup for 
 validation
@@ -74,7 +137,8 @@ def validation_on_start(luts, eco_scores_uri, schema_uri, excluded_biotypes,
 
     logger.debug("called validate_evidence on_start from %s", str(os.getpid()))
 
-    validator = opentargets_validator.helpers.generate_validator_from_schema(schema_uri)
+    #one validator per evidence type, falling back to the whole schema
+    validator = generate_validator_from_schema(schema_uri)
 
     luts = luts
     datasources_to_datatypes = datasources_to_datatypes
@@ -83,6 +147,56 @@ def validation_on_start(luts, eco_scores_uri, schema_uri, excluded_biotypes,
 
     return logger, validator, luts, datasources_to_datatypes, evidence_manager
 
+"""
+This function is called once in each child process to do local cleanup after
+validation
+"""
+def validation_on_done(status, logger, validator, luts, datasources_to_datatypes, evidence_manager):
+    logger.debug("lookup tables cache usage %s", str(luts.cache_info()))
+
+
+"""
+This function is called once in each child process to do local setup for
+validating and writing the partitions it reads
+"""
+def partition_on_start(validation_on_start_baked, writer_local_init):
+    writer_state = writer_local_init() if writer_local_init else ()
+    return validation_on_start_baked() + (writer_state,)
+
+"""
+This function is called once in each child process to do local cleanup after
+validating and writing the partitions it read
+"""
+def partition_on_done(writer_local_shutdown, status, logger, validator, luts,
+        datasources_to_datatypes, evidence_manager, writer_state):
+    if writer_local_shutdown:
+        writer_local_shutdown(status, *writer_state)
+    validation_on_done(status, logger, validator, luts, datasources_to_datatypes, evidence_manager)
+
+def write_evidence_batch(writer_main, results, *writer_state):
+    """write the (left, right) results of a batch of lines and return their
+    (failed, succeed) counts"""
+    return reduce_tuple_with_sum(filter(None,
+        map_batch(writer_main, results, *writer_state)))
+
+def process_evidence_partition(partition, logger, validator, luts, datasources_to_datatypes,
+        evidence_manager, writer_state, first_n=0, batch_size=1, writer_main=None):
+    """read, validate and write all the lines of a partition made by IO.make_partitions
+    inside this process, so only the (failed, succeed) counts go back to the parent
+    """
+    logger.debug("processing partition %s", str(partition))
+    counts = (0, 0)
+    lines = IO.iter_partition_lines(partition, first_n)
+    for batch in more_itertools.chunked(lines, batch_size):
+        for result in process_evidence_batch(batch, logger, validator, luts,
+                datasources_to_datatypes, evidence_manager):
+            written = writer_main(result, *writer_state)
+            if written:
+                counts = (counts[0] + written[0], counts[1] + written[1])
+
+    logger.info("processed partition %s (failed: %d, succeed: %d)", str(partition), *counts)
+    return counts
+
 def validate_evidence(line, logger, validator, luts, datasources_to_datatypes):
     """this function is called once per line until number of lines is exhausted. 
 
@@ -104,11 +218,11 @@ def validate_evidence(line, logger, validator, luts, datasources_to_datatypes):
         parsed_line = None
 
         try:
-            parsed_line = json.loads(decoded_line)
-            validated_evs['id'] = str(DatatStructureFlattener(parsed_line).get_hexdigest())
+            parsed_line = JsonBackend.loads(decoded_line)
+            validated_evs.id = str(get_canonical_hexdigest(parsed_line))
         except Exception as e:
             validated_evs.explanation_type = 'unparseable_json'
-            validated_evs['id'] = str(hashlib.md5(decoded_line).hexdigest())
+            validated_evs.id = str(hashlib.md5(decoded_line).hexdigest())
             return validated_evs, None
 
         if 'label' in parsed_line or 'type' in parsed_line:
@@ -167,17 +281,18 @@ def validate_evidence(line, logger, validator, luts, datasources_to_datatypes):
 
         # flatten but is it always valid unique_association_fields?
         validated_evs.hash = \
-            DatatStructureFlattener(evidence_obj.unique_association_fields).get_hexdigest()
+            get_canonical_hexdigest(evidence_obj.unique_association_fields)
         evidence_obj['id'] = str(validated_evs.hash)
 
         disease_failed = False
         target_failed = False
+        id_resolver = luts.get_id_resolver()
 
         if efo_id:
             # Check disease term or phenotype term
             #redis/elasticsearch is based on short ontology id, not full iri
             if '/' in efo_id:
-                short_efo_id = luts.available_efos.get_ontology_code_from_url(efo_id)
+                short_efo_id = id_resolver.get_code(efo_id)
             else:
                 #handle being given a short id to start with
                 short_efo_id = efo_id
@@ -198,45 +313,48 @@ def validate_evidence(line, logger, validator, luts, datasources_to_datatypes):
         # http://identifiers.org/ensembl/ENSG00000178573
         if target_id:
             if 'ensembl' in target_id:
-                ensembl_id = target_id.split('/')[-1]
+                ensembl_id = id_resolver.get_code(target_id)
                 if not ensembl_id in luts.available_genes:
                     validated_evs.explanation_type = 'invalid_target'
                     validated_evs.explanation_str = ensembl_id
                     target_failed = True
 
-                elif ensembl_id in luts.non_reference_genes:
+                elif id_resolver.is_non_reference_gene(ensembl_id):
                     logger.warning('nonref ensembl gene found %s line_n %d filename %s',
                                                    ensembl_id, line_n, filename)
 
             elif 'uniprot' in target_id:
-                uniprot_id = target_id.split('/')[-1]
-                if uniprot_id not in luts.uni2ens:
+                uniprot_id = id_resolver.get_code(target_id)
+                ensembl_gene = None
+                if id_resolver.has_uniprot(uniprot_id):
+                    ensembl_gene = id_resolver.get_ensembl_gene(uniprot_id)
+
+                if not id_resolver.has_uniprot(uniprot_id):
                     validated_evs.explanation_type = 'unknown_uniprot_entry'
                     validated_evs.explanation_str = uniprot_id
                     target_failed = True
 
-                elif not luts.uni2ens[uniprot_id]:
+                elif not ensembl_gene:
                     validated_evs.explanation_type = 'missing_ensembl_xref_for_uniprot_entry'
                     validated_evs.explanation_str = uniprot_id
                     target_failed = True
 
-                elif (uniprot_id in luts.uni2ens) and \
-                        luts.uni2ens[uniprot_id] in luts.available_genes and \
-                        'is_reference' in luts.available_genes[luts.uni2ens[uniprot_id]] and \
-                        (not luts.available_genes[luts.uni2ens[uniprot_id]]['is_reference'] is True):
+                elif ensembl_gene in luts.available_genes and \
+                        'is_reference' in luts.available_genes[ensembl_gene] and \
+                        (not luts.available_genes[ensembl_gene]['is_reference'] is True):
                     validated_evs.explanation_type = 'nonref_ensembl_xref_for_uniprot_entry'
                     validated_evs.explanation_str = uniprot_id
                     target_failed = True
                 else:
                     try:
-                        reference_target_list = luts.available_genes[luts.uni2ens[uniprot_id]]['is_reference'] is True
+                        reference_target_list = luts.available_genes[ensembl_gene]['is_reference'] is True
                     except KeyError:
                         reference_target_list = []
 
                     if reference_target_list:
                         target_id = 'http://identifiers.org/ensembl/%s' % reference_target_list[0]
                     else:
-                        target_id =luts.uni2ens[uniprot_id]
+                        target_id = ensembl_gene
                     if target_id is None:
                         validated_evs.explanation_type = 'missing_target_id_for_protein'
                         validated_evs.explanation_str = uniprot_id
@@ -255,7 +373,8 @@ def validate_evidence(line, logger, validator, luts, datasources_to_datatypes):
 
             return validated_evs, None
 
-        validated_evs.line = json.dumps(evidence_obj.to_dict())
+        #pass the parsed evidence on, it is serialised once by the writer
+        validated_evs.evidence = evidence_obj.to_dict()
         validated_evs.is_valid = True
         return None, validated_evs
 
@@ -267,9 +386,27 @@ def validate_evidence(line, logger, validator, luts, datasources_to_datatypes):
 
 def process_evidences_pipeline(filenames, first_n, es_client, redis_client,
         dry_run, output_folder,
-        num_workers, num_writers, max_queued_events, 
+        num_workers, num_writers, max_queued_events, batch_size,
         eco_scores_uri, schema_uri, es_hosts, excluded_biotypes, 
-        datasources_to_datatypes):
+        datasources_to_datatypes, lookup_cache_size=0, lookup_cache_ttl=None,
+        lookup_codec='pickle', lookup_backend='redis', lookup_snapshot_dir=None,
+        partition_size=None, send_bytes=False, flush_timeout=None, scores_folder=None):
+    """validate and store the evidence in filenames.
+
+    If partition_size is None the lines of all the files are read in this process
+    and sent to num_workers validators and then to num_writers writers. Otherwise
+    each of num_workers processes reads its own files or partitions of files of up
+    to partition_size bytes (0 to never split a file), validating and writing them
+    locally.
+
+    If send_bytes the validators send only the id and json of each document to the
+    writers, instead of the whole ValidatedEvidence. Lines are sent to the validators
+    in batches of batch_size, or smaller if the first line of a batch has been
+    waiting flush_timeout seconds.
+
+    If scores_folder each writer also writes what association scoring needs of the
+    valid evidence there, replacing the files of any previous run.
+    """
     logger = logging.getLogger(__name__)
 
     if not filenames:
@@ -289,43 +426,70 @@ def process_evidences_pipeline(filenames, first_n, es_client, redis_client,
     logger.info('start evidence processing pipeline')
 
     #load lookup tables
-    lookup_data = LookUpDataRetriever(es_client,
+    lookup_retriever = LookUpDataRetriever(es_client,
         redis_client, [], 
-        ( LookUpDataType.TARGET, LookUpDataType.DISEASE,LookUpDataType.ECO)).lookup
-
-    #create a iterable of lines from all file handles
-    evs = IO.make_iter_lines(checked_filenames, first_n)
-
-    #create functions with pre-baked arguments
-    validation_on_start_baked = functools.partial(validation_on_start, 
-        lookup_data, eco_scores_uri, schema_uri, excluded_biotypes, datasources_to_datatypes)
-
-    writer_global_init, writer_local_init, writer_main, writer_local_shutdown, writer_global_shutdown = setup_writers(
-        dry_run, es_hosts, output_folder)
-    if writer_global_init:
-        writer_global_init()
-
-    #here is the pipeline definition
-    pl_stage = pr.map(process_evidence, evs, 
-        workers=num_workers, maxsize=max_queued_events,
-        on_start=validation_on_start_baked)
+        ( LookUpDataType.TARGET, LookUpDataType.DISEASE,LookUpDataType.ECO),
+        cache_size=lookup_cache_size, cache_ttl=lookup_cache_ttl,
+        codec=lookup_codec, backend=lookup_backend,
+        snapshot_dir=lookup_snapshot_dir)
+    lookup_data = lookup_retriever.lookup
 
-    pl_stage = pr.map(writer_main, pl_stage, 
-        workers=num_writers, maxsize=max_queued_events,
-        on_start=writer_local_init,
-        on_done=writer_local_shutdown)
-
-    logger.info('run evidence processing pipeline')
-    results = reduce_tuple_with_sum(pr.to_iterable(pl_stage))
-
-    #perform any single-thread cleanup
-    if writer_global_shutdown:
-        writer_global_shutdown()
-
-    logger.info("results (failed: %s, succeed: %s)", results[0], results[1])
-    if failed_filenames:
-        raise RuntimeError('unable to handle %s', str(failed_filenames))
+    try:
+        #create functions with pre-baked arguments
+        validation_on_start_baked = functools.partial(validation_on_start, 
+            lookup_data, eco_scores_uri, schema_uri, excluded_biotypes, datasources_to_datatypes)
+
+        if scores_folder:
+            prepare_scores_folder(scores_folder)
+
+        writer_global_init, writer_local_init, writer_main, writer_local_shutdown, writer_global_shutdown = setup_writers(
+            dry_run, es_hosts, output_folder, scores_folder)
+        if writer_global_init:
+            writer_global_init()
+
+        #here is the pipeline definition
+        if partition_size is not None:
+            partitions = IO.make_partitions(checked_filenames, 0 if first_n else partition_size)
+            logger.info('read %d files in %d partitions', len(checked_filenames), len(partitions))
+
+            pl_stage = pr.map(functools.partial(process_evidence_partition,
+                    first_n=first_n or 0, batch_size=batch_size, writer_main=writer_main),
+                partitions, workers=num_workers, maxsize=num_workers,
+                on_start=functools.partial(partition_on_start,
+                    validation_on_start_baked, writer_local_init),
+                on_done=functools.partial(partition_on_done, writer_local_shutdown))
 
-    if not results[1]:
-        raise RuntimeError("No evidence was sucessful!")
+        else:
+            #create a iterable of lines from all file handles
+            #grouped in chunks so lookups can be done once per chunk
+            #and the results of each chunk go to the writers together
+            evs = batched(IO.make_iter_lines(checked_filenames, first_n),
+                batch_size, flush_timeout)
+
+            pl_stage = pr.map(
+                process_evidence_batch_serialised if send_bytes else process_evidence_batch, evs,
+                workers=num_workers, maxsize=batch_queue_size(max_queued_events, batch_size),
+                on_start=validation_on_start_baked,
+                on_done=validation_on_done)
+
+            pl_stage = pr.map(functools.partial(write_evidence_batch, writer_main), pl_stage,
+                workers=num_writers, maxsize=batch_queue_size(max_queued_events, batch_size),
+                on_start=writer_local_init,
+                on_done=writer_local_shutdown)
+
+        logger.info('run evidence processing pipeline')
+        results = reduce_tuple_with_sum(pr.to_iterable(pl_stage))
+
+        #perform any single-thread cleanup
+        if writer_global_shutdown:
+            writer_global_shutdown()
+
+        logger.info("results (failed: %s, succeed: %s)", results[0], results[1])
+        if failed_filenames:
+            raise RuntimeError('unable to handle %s', str(failed_filenames))
+
+        if not results[1]:
+            raise RuntimeError("No evidence was sucessful!")
+    finally:
+        lookup_retriever.close()
 
@@ -447,10 +447,8 @@ class GeneManager():
     def qc(self, esquery):
 
         #number of gene entries
-        gene_count = 0
-        #Note: try to avoid doing this more than once!
-        for gene_entry in esquery.get_all_targets():
-            gene_count += 1
+        gene_count = esquery.count_elements_in_index(Const.ELASTICSEARCH_GENE_NAME_INDEX_NAME,
+            Const.ELASTICSEARCH_GENE_NAME_DOC_NAME)
 
         #put the metrics into a single dict
         metrics = dict()
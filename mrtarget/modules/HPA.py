@@ -18,6 +18,7 @@ from mrtarget.Settings import Config #TODO remove this eventually
 from mrtarget.common.connection import new_es_client
 from addict import Dict
 from mrtarget.common.DataStructure import JSONSerializable, json_serialize, PipelineEncoder
+import mrtarget.common.JsonBackend as JsonBackend
 
 
 _missing_tissues = {'names': {},
@@ -121,7 +122,7 @@ class HPAExpression(Dict, JSONSerializable):
         return tissue
 
     def to_json(self):
-        return json.dumps(self.to_dict(),
+        return JsonBackend.dumps(self.to_dict(),
                           default=json_serialize,
                           sort_keys=True,
                           # indent=4,
@@ -129,7 +130,7 @@ class HPAExpression(Dict, JSONSerializable):
 
     def load_json(self, data):
         try:
-            self.update(json.loads(data))
+            self.update(JsonBackend.loads(data))
         except Exception as e:
             raise e
 
@@ -588,10 +589,8 @@ class HPAProcess():
         self.logger.info("Starting QC")
 
         #number of hpa entries
-        hpa_count = 0
-        #Note: try to avoid doing this more than once!
-        for hpa_entry in esquery.get_all_hpa():
-            hpa_count += 1
+        hpa_count = esquery.count_elements_in_index(Const.ELASTICSEARCH_EXPRESSION_INDEX_NAME,
+            Const.ELASTICSEARCH_EXPRESSION_DOC_NAME)
 
         #put the metrics into a single dict
         metrics = dict()
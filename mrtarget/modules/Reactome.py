@@ -154,10 +154,8 @@ class ReactomeProcess():
         self.logger.info("Starting QC")
 
         #number of reactions
-        reaction_count = 0
-        #Note: try to avoid doing this more than once!
-        for reaction in esquery.get_all_reactions():
-            reaction_count += 1
+        reaction_count = esquery.count_elements_in_index(Const.ELASTICSEARCH_REACTOME_INDEX_NAME,
+            Const.ELASTICSEARCH_REACTOME_REACTION_DOC_NAME)
 
         #put the metrics into a single dict
         metrics = dict()
@@ -65,13 +65,7 @@ class UniprotDownloader(object):
         """
         self.logger.info("Starting QC")
         #number of uniprot entries
-        uniprot_count = 0
-        #Note: try to avoid doing this more than once!
-        for unprot_entry in esquery.get_all_uniprot_entries():
-            uniprot_count += 1
-
-            if uniprot_count % 1000 == 0:
-                self.logger.debug("QC of %d uniprot entries", uniprot_count)
+        uniprot_count = esquery.count_elements_in_index(Const.ELASTICSEARCH_UNIPROT_INDEX_NAME)
 
         #put the metrics into a single dict
         metrics = dict()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+"""
+Compare DatatStructureFlattener(...).get_hexdigest() with get_canonical_hexdigest
+hashing evidence documents and their unique_association_fields the way
+validate_evidence does, and check both give the same digests.
+
+Evidence is read from a file with one JSON document per line (gzipped is
+fine). If no file is given, synthetic evidence documents are used.
+
+usage: benchmark_canonical_hash.py [evidence.json[.gz]] [max_docs]
+"""
+
+import sys
+import time
+import json
+
+import addict
+
+from mrtarget.common.EvidenceJsonUtils import DatatStructureFlattener, get_canonical_hexdigest
+from benchmark_json_backends import fake_evidence, load_lines
+
+
+def flattener_hexdigest(data_structure):
+    return DatatStructureFlattener(data_structure).get_hexdigest()
+
+
+def main():
+    max_docs = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    if len(sys.argv) > 1:
+        lines = load_lines(sys.argv[1], max_docs)
+    else:
+        lines = [fake_evidence(i) for i in range(max_docs)]
+
+    digests = {}
+    print('%-24s %12s %12s' % ('hasher', 'evidence us', 'fields us'))
+    for name, hexdigest in (('DatatStructureFlattener', flattener_hexdigest),
+                            ('get_canonical_hexdigest', get_canonical_hexdigest)):
+        docs = [json.loads(line) for line in lines]
+        fields = [addict.Dict(doc).unique_association_fields for doc in docs]
+
+        start = time.time()
+        evidence_digests = [hexdigest(doc) for doc in docs]
+        evidence_time = time.time() - start
+
+        start = time.time()
+        fields_digests = [hexdigest(field) for field in fields]
+        fields_time = time.time() - start
+
+        digests[name] = (evidence_digests, fields_digests)
+        print('%-24s %12.1f %12.1f' % (name,
+                                       evidence_time * 1e6 / len(lines),
+                                       fields_time * 1e6 / len(lines)))
+
+    if digests['DatatStructureFlattener'] != digests['get_canonical_hexdigest']:
+        print('digests DIFFER')
+        sys.exit(1)
+    print('digests are the same')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+"""
+Compare the json backends parsing and writing evidence or association documents,
+and check they all give the same documents and evidence hashes.
+
+Documents are read from a file with one JSON document per line, e.g. an
+evidence input file or a dump of the _source of the association index (gzipped
+is fine). If no file is given, synthetic evidence documents are used.
+
+usage: benchmark_json_backends.py [documents.json[.gz]] [max_docs]
+"""
+
+import sys
+import time
+import json
+
+from mrtarget.common.IO import open_to_read
+from mrtarget.common.EvidenceJsonUtils import DatatStructureFlattener
+from mrtarget.common.JsonBackend import JSON_BACKENDS, get_json_backend
+
+
+def fake_evidence(i):
+    return json.dumps({u'sourceID': u'gwas_catalog',
+                       u'type': u'genetic_association',
+                       u'target': {u'id': u'http://identifiers.org/ensembl/ENSG%011d' % i,
+                                   u'target_type': u'http://identifiers.org/cttv.target/gene_evidence',
+                                   u'activity': u'http://identifiers.org/cttv.activity/predicted_damaging'},
+                       u'disease': {u'id': u'http://www.ebi.ac.uk/efo/EFO_%07d' % (i % 5000)},
+                       u'unique_association_fields': {u'study_name': u'study %d' % i,
+                                                      u'pubmed_refs': u'http://europepmc.org/abstract/MED/%d' % i,
+                                                      u'variant': u'http://identifiers.org/dbsnp/rs%d' % i},
+                       u'evidence': {u'variant2disease': {u'resource_score': {u'type': u'pvalue',
+                                                                              u'value': 1.0 / (i + 3) ** 9},
+                                                          u'gwas_sample_size': i * 10,
+                                                          u'odds_ratio': u'%.2f' % (1 + i % 100 / 100.)},
+                                     u'gene2variant': {u'is_associated': True,
+                                                       u'functional_consequence': u'http://purl.obolibrary.org/obo/SO_0001627'}},
+                       u'literature': {u'references': [{u'lit_id': u'http://europepmc.org/abstract/MED/%d' % (i + j)}
+                                                       for j in range(5)]}})
+
+
+def load_lines(filename, max_docs):
+    lines = []
+    for _, (_, line) in open_to_read(filename):
+        lines.append(line)
+        if len(lines) >= max_docs:
+            break
+    return lines
+
+
+def main():
+    max_docs = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    if len(sys.argv) > 1:
+        lines = load_lines(sys.argv[1], max_docs)
+    else:
+        lines = [fake_evidence(i) for i in range(max_docs)]
+
+    expected = [DatatStructureFlattener(json.loads(line)).get_hexdigest() for line in lines]
+
+    print('%-12s %12s %12s %12s %8s' % ('backend', 'loads us', 'dumps us', 'sorted us', 'hashes'))
+    for name in JSON_BACKENDS:
+        try:
+            backend = get_json_backend(name)
+        except ValueError as e:
+            print('%-12s skipped: %s' % (name, e))
+            continue
+
+        start = time.time()
+        docs = [backend.loads(line) for line in lines]
+        loads_time = time.time() - start
+
+        start = time.time()
+        for doc in docs:
+            backend.dumps(doc)
+        dumps_time = time.time() - start
+
+        start = time.time()
+        written = [backend.dumps(doc, sort_keys=True) for doc in docs]
+        sorted_time = time.time() - start
+
+        same = all(DatatStructureFlattener(backend.loads(data)).get_hexdigest() == digest
+                   for data, digest in zip(written, expected))
+
+        print('%-12s %12.1f %12.1f %12.1f %8s' % (name,
+                                                  loads_time * 1e6 / len(lines),
+                                                  dumps_time * 1e6 / len(lines),
+                                                  sorted_time * 1e6 / len(lines),
+                                                  'same' if same else 'DIFFER'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+"""
+Compare the lookup table codecs by encoded size and encode/decode time.
+
+Gene documents are read from a file with one JSON document per line, e.g. a
+dump of the _source of the gene-data index (gzipped is fine). If no file is
+given, synthetic documents with orthologs and mouse phenotypes are used.
+
+usage: benchmark_lookup_codecs.py [genes.json[.gz]] [max_docs]
+"""
+
+import sys
+import time
+import json
+
+from mrtarget.common.IO import open_to_read
+from mrtarget.common.Redis import LOOKUP_TABLE_CODECS, get_lookup_table_codec
+
+
+def fake_gene(i):
+    return {u'id': u'ENSG%011d' % i,
+            u'approved_symbol': u'GENE%d' % i,
+            u'approved_name': u'fake gene number %d' % i,
+            u'uniprot_id': u'P%05d' % i,
+            u'uniprot_accessions': [u'Q%05d' % i, u'A%05d' % i],
+            u'go': [{u'id': u'GO:%07d' % j, u'value': {u'term': u'P:process %d' % j}}
+                    for j in range(30)],
+            u'ortholog': {species: [{u'ortholog_species_symbol': u'Gene%d' % i,
+                                     u'ortholog_species_assert_ids': [u'ID%d' % j],
+                                     u'support': [u'Ensembl', u'OrthoDB', u'PANTHER']}
+                                    for j in range(3)]
+                          for species in (u'mouse', u'rat', u'dog', u'chimpanzee', u'zebrafish')},
+            u'mouse_phenotypes': [{u'mouse_gene_id': u'MGI:%d' % i,
+                                   u'phenotypes': [{u'category_mp_identifier': u'MP:%07d' % j,
+                                                    u'category_mp_label': u'phenotype %d' % j,
+                                                    u'genotype_phenotype': [{u'subject_allelic_composition': u'Gene%d<tm1>/Gene%d<tm1>' % (i, i),
+                                                                             u'mp_label': u'abnormal thing %d' % k,
+                                                                             u'pmid': u'%d' % (k * 1000 + j)}
+                                                                            for k in range(4)]}
+                                                   for j in range(8)]}]}
+
+
+def load_genes(filename, max_docs):
+    genes = []
+    for _, (_, line) in open_to_read(filename):
+        genes.append(json.loads(line))
+        if len(genes) >= max_docs:
+            break
+    return genes
+
+
+def main():
+    max_docs = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    if len(sys.argv) > 1:
+        genes = load_genes(sys.argv[1], max_docs)
+    else:
+        genes = [fake_gene(i) for i in range(max_docs)]
+
+    print('%-14s %12s %12s %12s' % ('codec', 'avg bytes', 'encode us', 'decode us'))
+    for name in LOOKUP_TABLE_CODECS:
+        try:
+            codec = get_lookup_table_codec(name)
+        except ValueError as e:
+            print('%-14s skipped: %s' % (name, e))
+            continue
+
+        start = time.time()
+        encoded = [codec.encode(gene) for gene in genes]
+        encode_time = time.time() - start
+
+        start = time.time()
+        for data in encoded:
+            codec.decode(data)
+        decode_time = time.time() - start
+
+        print('%-14s %12d %12.1f %12.1f' % (name,
+                                            sum(len(data) for data in encoded) / len(encoded),
+                                            encode_time * 1e6 / len(genes),
+                                            decode_time * 1e6 / len(genes)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+"""
+Compare loading lookup tables into redis one SETEX at a time against the
+pipelined RedisLookupTable.set_many, using synthetic gene and EFO documents
+of the same shape the lookup tables store.
+
+usage: benchmark_lookup_load.py [n_genes] [n_efos] [batch_size]
+"""
+
+import sys
+import time
+
+from mrtarget.common.Redis import RedisLookupTablePickle
+from mrtarget.common.connection import RedisManager, new_redis_client
+
+REDIS_HOST = 'localhost'
+REDIS_PORT = 35001
+
+
+def fake_gene(i):
+    return {'id': 'ENSG%011d' % i,
+            'approved_symbol': 'GENE%d' % i,
+            'approved_name': 'fake gene number %d' % i,
+            'uniprot_id': 'P%05d' % i,
+            'uniprot_accessions': ['Q%05d' % i, 'A%05d' % i],
+            'biotype': 'protein_coding',
+            'go': [{'id': 'GO:%07d' % j, 'value': {'term': 'P:process %d' % j}}
+                   for j in range(20)],
+            '_private': {'facets': {'reactome': {'pathway_code': ['R-HSA-%d' % i],
+                                                 'pathway_type_code': ['R-HSA-1']}}}}
+
+
+def fake_efo(i):
+    return {'code': 'http://www.ebi.ac.uk/efo/EFO_%07d' % i,
+            'label': 'fake disease %d' % i,
+            'path_codes': [['EFO_0000408', 'EFO_%07d' % i]],
+            'path_labels': [['disease', 'fake disease %d' % i]]}
+
+
+def time_load(r_server, namespace, docs, batch_size):
+    table = RedisLookupTablePickle(namespace=namespace + '_single', r_server=r_server)
+    start = time.time()
+    for key, doc in docs:
+        table.set(key, doc)
+    single = time.time() - start
+
+    table = RedisLookupTablePickle(namespace=namespace + '_batch', r_server=r_server,
+                                   batch_size=batch_size)
+    start = time.time()
+    table.set_many(docs)
+    batched = time.time() - start
+
+    return single, batched
+
+
+def main():
+    n_genes = int(sys.argv[1]) if len(sys.argv) > 1 else 60000
+    n_efos = int(sys.argv[2]) if len(sys.argv) > 2 else 25000
+    batch_size = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+
+    genes = [(g['id'], g) for g in (fake_gene(i) for i in range(n_genes))]
+    efos = [(e['path_codes'][0][-1], e) for e in (fake_efo(i) for i in range(n_efos))]
+
+    with RedisManager(False, REDIS_HOST, REDIS_PORT):
+        r_server = new_redis_client(REDIS_HOST, REDIS_PORT)
+        for name, docs in (('genes', genes), ('efos', efos)):
+            single, batched = time_load(r_server, name, docs, batch_size)
+            print('%s: %d docs, one by one %.2fs, set_many(batch_size=%d) %.2fs, speedup %.1fx'
+                  % (name, len(docs), single, batch_size, batched, single / batched))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+"""
+Compare validating evidence against the whole schema with validating it against
+the branch of the schema for its type, as lines per second for each datasource,
+and check both find the same errors.
+
+Evidence is read from a file with one JSON document per line (gzipped is fine),
+e.g. one of the --val input files.
+
+usage: benchmark_schema_validation.py schema_uri evidence.json[.gz] [max_lines]
+"""
+
+import sys
+import time
+import json
+from collections import defaultdict
+
+import opentargets_validator.helpers
+
+from mrtarget.common.IO import open_to_read
+from mrtarget.common.EvidenceValidator import EvidenceValidator
+
+
+def load_evidence(filename, max_lines):
+    by_datasource = defaultdict(list)
+    for n, (_, (_, line)) in enumerate(open_to_read(filename)):
+        if n >= max_lines:
+            break
+        evidence = json.loads(line)
+        if 'label' in evidence:
+            evidence['type'] = evidence.pop('label')
+        by_datasource[evidence.get('sourceID')].append(evidence)
+    return by_datasource
+
+
+def time_validator(validator, evidences):
+    start = time.time()
+    errors = [[str(e) for e in validator.iter_errors(evidence)] for evidence in evidences]
+    return len(evidences) / max(time.time() - start, 1e-9), errors
+
+
+def main():
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(1)
+    max_lines = int(sys.argv[3]) if len(sys.argv) > 3 else 10000
+    schema_validator = opentargets_validator.helpers.generate_validator_from_schema(sys.argv[1])
+    validator = EvidenceValidator(schema_validator)
+    print('types with their own validator: %s' % ', '.join(sorted(validator.type_validators)))
+
+    print('%-24s %8s %14s %14s %8s' % ('datasource', 'lines', 'schema l/s', 'by type l/s', 'errors'))
+    for datasource, evidences in sorted(load_evidence(sys.argv[2], max_lines).items()):
+        schema_rate, schema_errors = time_validator(schema_validator, evidences)
+        type_rate, type_errors = time_validator(validator, evidences)
+        print('%-24s %8d %14.1f %14.1f %8s' % (datasource, len(evidences), schema_rate, type_rate,
+                                               'same' if schema_errors == type_errors else 'DIFFER'))
+
+
+if __name__ == '__main__':
+    main()
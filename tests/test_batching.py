@@ -0,0 +1,59 @@
+from mrtarget.common.Batching import batched, batched_by_weight, map_batch, flat_map_batch, batch_queue_size
+import time
+import unittest
+
+
+def slow_range(n, pause_after, pause):
+    for i in range(n):
+        if i == pause_after:
+            time.sleep(pause)
+        yield i
+
+
+def failing_range(n):
+    for i in range(n):
+        yield i
+    raise ValueError('read failed')
+
+
+class BatchingTestCase(unittest.TestCase):
+
+    def test_batched(self):
+        self.assertEquals(list(batched(range(7), 3)), [[0, 1, 2], [3, 4, 5], [6]])
+        self.assertEquals(list(batched([], 3)), [])
+
+    def test_batched_flush_timeout(self):
+        #without a pause all batches are full
+        self.assertEquals(list(batched(range(7), 3, flush_timeout=5)),
+                          [[0, 1, 2], [3, 4, 5], [6]])
+
+        #the first items are sent before the source resumes
+        batches = list(batched(slow_range(4, 2, 0.5), 3, flush_timeout=0.05))
+        self.assertEquals(batches, [[0, 1], [2, 3]])
+
+    def test_batched_flush_timeout_error(self):
+        batches = batched(failing_range(2), 5, flush_timeout=1)
+        self.assertRaises(ValueError, list, batches)
+
+    def test_batched_by_weight(self):
+        items = [('a', 10), ('b', 6), ('c', 3), ('d', 1), ('e', 1), ('f', 1)]
+        batches = batched_by_weight(items, 2, 5, lambda item: item[1])
+        self.assertEquals([[key for key, weight in batch] for batch in batches],
+                          [['a'], ['b'], ['c', 'd'], ['e', 'f']])
+
+    def test_map_batch(self):
+        self.assertEquals(map_batch(lambda x, y: x + y, [1, 2, 3], 10), [11, 12, 13])
+
+    def test_flat_map_batch(self):
+        self.assertEquals(flat_map_batch(lambda x: [x] * x, 2, [1, 2, 3]),
+                          [[1, 2], [2, 3], [3, 3]])
+        self.assertEquals(flat_map_batch(lambda x: [], 2, [1, 2]), [])
+
+    def test_batch_queue_size(self):
+        self.assertEquals(batch_queue_size(1000, 50), 20)
+        self.assertEquals(batch_queue_size(10, 50), 1)
+        self.assertEquals(batch_queue_size(10, 0), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
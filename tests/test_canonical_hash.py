@@ -0,0 +1,66 @@
+import copy
+import json
+import unittest
+from collections import OrderedDict
+
+import addict
+import simplejson
+
+from mrtarget.common.EvidenceJsonUtils import DatatStructureFlattener, get_canonical_hexdigest
+
+
+EVIDENCE = u'''{"sourceID": "eva", "type": "genetic_association",
+"target": {"id": "http://identifiers.org/ensembl/ENSG00000155657", "target_type": "http://identifiers.org/cttv.target/gene_evidence"},
+"disease": {"id": "http://www.orpha.net/ORDO/Orphanet_\\u00e91", "name": "caf\\u00e9 disease", "synonyms": ["b", "a", "c"]},
+"unique_association_fields": {"clinvarAccession": "RCV000000", "alleleOrigin": "germline", "phenotype": "http://www.orpha.net/ORDO/Orphanet_1"},
+"evidence": {"variant2disease": {"resource_score": {"type": "pvalue", "value": 1e-120}, "date_asserted": "2018-01-01", "is_associated": true,
+"provenance_type": {"literature": {"references": [{"lit_id": "http://europepmc.org/abstract/MED/2"}, {"lit_id": "http://europepmc.org/abstract/MED/1"}]}},
+"evidence_codes": ["http://purl.obolibrary.org/obo/ECO_0000205", "http://identifiers.org/eco/cttv_mapping_pipeline"]},
+"gene2variant": {"functional_consequence": "http://purl.obolibrary.org/obo/SO_0001583", "is_associated": false, "score": 0.30000000000000004, "count": 12345678901234567890, "empty": [], "nothing": null, "nested": [[3, 1], [2]]}},
+"variant": {"id": "http://identifiers.org/dbsnp/rs1", "type": "snp single"}}'''
+
+
+class CanonicalHashTestCase(unittest.TestCase):
+
+    def assertSameDigest(self, data):
+        expected_data = copy.deepcopy(data)
+        expected = DatatStructureFlattener(expected_data).get_hexdigest()
+        self.assertEquals(get_canonical_hexdigest(data), expected, repr(data))
+        #lists are sorted in place in the same way
+        self.assertEquals(data, expected_data)
+
+    def test_evidence(self):
+        self.assertSameDigest(json.loads(EVIDENCE))
+        self.assertSameDigest(simplejson.loads(EVIDENCE))
+        self.assertSameDigest(json.loads(EVIDENCE)['unique_association_fields'])
+
+    def test_addict(self):
+        #the association fields are hashed from an addict.Dict, which is a single value
+        evidence = addict.Dict(json.loads(EVIDENCE))
+        self.assertSameDigest(evidence.unique_association_fields)
+        self.assertSameDigest({'a': evidence.disease, 'b': OrderedDict([('z', 1), ('a', 2)])})
+
+    def test_shapes(self):
+        for data in [{}, [], [3, 1, 2], 'string', u'\u00e9', 1, 1.5, None, True,
+                     {'a': []}, {'a': {}}, {'a': [{'b': 1}, {'a': 2}]},
+                     [[1, 2], [1]], {'': 1, 'a': {'': 2}},
+                     {'a': float('nan'), 'b': float('inf')},
+                     {'x': 'caf\xc3\xa9', u'y\u00e9': [u'\u00e9', 'a']},
+                     {'0': 1, 'l': ['x', 'y']}]:
+            self.assertSameDigest(data)
+
+    def test_colliding_keys(self):
+        #keys that are the same once flattened and cleaned
+        for data in [{' a': 1, 'a': 2},
+                     {'a->b': 1, 'a': {'b': 2}},
+                     {'a->': {'->b': 1}, 'ab': 2}]:
+            self.assertSameDigest(data)
+
+    def test_stable_ids(self):
+        #evidence ids must not change across releases
+        self.assertEquals(get_canonical_hexdigest({'a': 1, 'b': [u'y', u'x']}),
+                          '9b14f9c5adae40cb82814bf13d2ec27d')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,6 +5,10 @@ import mrtarget.common as common
 from toolz import curry, take
 from tempfile import NamedTemporaryFile
 import os
+import gzip
+import shutil
+import tempfile
+import zipfile
 from mrtarget.common import URLZSource
 from toolz.functoolz import compose
 from string import rstrip
@@ -23,3 +27,41 @@ class DataStructureTests(unittest.TestCase):
         print(str(lines4))
         self.assertGreaterEqual(len(lines4), 1,
                               "Failed to get more than 0 lines")
+
+    def test_urlzsource_gzip_stream(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmp_dir, 'test.txt.gz')
+            #two gzip members, as written by appending to a file
+            with gzip.open(filename, 'wb') as f:
+                f.write('first\n')
+            with gzip.open(filename, 'ab') as f:
+                f.write(''.join('line %d\n' % i for i in range(100000)))
+
+            with URLZSource(filename).open() as f:
+                lines = list(f)
+            self.assertEquals(len(lines), 100001)
+            self.assertEquals(lines[0], 'first\n')
+            self.assertEquals(lines[-1], 'line 99999\n')
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_urlzsource_spool_cleanup(self):
+        tmp_dir = tempfile.mkdtemp()
+        spool_dir = tempfile.mkdtemp()
+        old_tempdir = tempfile.tempdir
+        try:
+            filename = os.path.join(tmp_dir, 'test.zip')
+            zipped = zipfile.ZipFile(filename, 'w')
+            zipped.writestr('test.txt', 'a\nb\n')
+            zipped.close()
+
+            tempfile.tempdir = spool_dir
+            with URLZSource(filename, spool=True).open() as f:
+                self.assertEquals(list(f), ['a\n', 'b\n'])
+                self.assertEquals(len(os.listdir(spool_dir)), 1)
+            self.assertEquals(os.listdir(spool_dir), [])
+        finally:
+            tempfile.tempdir = old_tempdir
+            shutil.rmtree(tmp_dir)
+            shutil.rmtree(spool_dir)
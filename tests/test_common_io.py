@@ -1,5 +1,9 @@
+import itertools
+import os
+import shutil
+import tempfile
 import unittest
-from mrtarget.common.IO import check_to_open
+from mrtarget.common.IO import check_to_open, make_partitions, iter_partition_lines, make_iter_lines
 
 
 class IOTests(unittest.TestCase):
@@ -10,3 +14,29 @@ class IOTests(unittest.TestCase):
     def test_check_to_open_true(self):
         filename = 'https://www.google.com/robots.txt'
         self.assertTrue(check_to_open(filename),'google robots url must exist')
+
+    def test_partitions(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmp_dir, 'evidence.json')
+            lines = ['{"line": %d%s}\n' % (i, ' ' * (i % 7)) for i in range(1000)]
+            with open(filename, 'w') as f:
+                f.writelines(lines)
+
+            self.assertEquals(make_partitions([filename], 0), [(filename, 0, None)])
+
+            for partition_size in (1, 16, 17, 1000, 10 ** 6):
+                partitions = make_partitions([filename], partition_size)
+                read = [l for p in partitions for (_, (_, l)) in iter_partition_lines(p)]
+                self.assertEquals(read, lines)
+
+            #first_n is applied to each partition
+            first = list(iter_partition_lines((filename, 0, None), first_n=3))
+            self.assertEquals(first, list(itertools.islice(make_iter_lines([filename]), 3)))
+
+            #line numbers of later partitions are counted from their start
+            second = list(iter_partition_lines(make_partitions([filename], 1000)[1]))
+            self.assertEquals(second[0][0], filename + '@1000')
+            self.assertEquals(second[0][1][0], 1)
+        finally:
+            shutil.rmtree(tmp_dir)
@@ -0,0 +1,150 @@
+from mrtarget.common.ElasticsearchLoader import Loader
+from mrtarget.modules.BulkLoad import bulk_load_file
+from mrtarget.Settings import Config
+from elasticsearch.helpers import BulkIndexError
+import glob
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+
+class RecordingLoader(Loader):
+    '''keeps the chunks instead of sending them to elasticsearch'''
+
+    def __init__(self, *args, **kwargs):
+        Loader.__init__(self, None, *args, **kwargs)
+        self.chunks = []
+        self.lock = threading.Lock()
+
+    def _flush(self, chunk):
+        with self.lock:
+            self.chunks.append(list(chunk))
+
+
+class FailingLoader(Loader):
+
+    INITIAL_BACKOFF = 0
+
+    def _flush(self, chunk):
+        raise ValueError('bulk failed')
+
+
+class RejectingLoader(RecordingLoader):
+    '''rejects the first try of odd documents as too many requests and
+    document 0 as a bad request'''
+
+    INITIAL_BACKOFF = 0
+
+    def _flush(self, chunk):
+        RecordingLoader._flush(self, chunk)
+        failed = []
+        for action in chunk:
+            doc_id = int(action['_id'])
+            if doc_id == 0:
+                failed.append((action, {'type': 'mapper_parsing_exception'}, False))
+            elif doc_id % 2 and len(self.chunks) == 1:
+                failed.append((action, {'type': 'es_rejected_execution_exception'}, True))
+        return failed
+
+
+class LoaderTestCase(unittest.TestCase):
+
+    def test_chunk_size(self):
+        loader = RecordingLoader(chunk_size=10, concurrency=0)
+        for i in range(25):
+            loader.put('test-index', 'test', str(i), {'value': i})
+        loader.wait()
+        self.assertEquals([len(c) for c in loader.chunks], [10, 10, 5])
+
+    def test_chunk_bytes(self):
+        loader = RecordingLoader(chunk_size=1000, concurrency=0, chunk_bytes=100)
+        for i in range(10):
+            loader.put('test-index', 'test', str(i), {'value': 'x' * 40})
+        loader.wait()
+        self.assertEquals([len(c) for c in loader.chunks], [2, 2, 2, 2, 2])
+        self.assertTrue(isinstance(loader.chunks[0][0]['_source'], basestring))
+
+    def test_background_flush(self):
+        loader = RecordingLoader(chunk_size=10, concurrency=3, max_queued_chunks=2)
+        for i in range(1000):
+            loader.put('test-index', 'test', str(i), {'value': i})
+        loader.wait()
+        ids = sorted(int(doc['_id']) for chunk in loader.chunks for doc in chunk)
+        self.assertEquals(ids, range(1000))
+        loader._stop_workers()
+
+    def test_background_error(self):
+        loader = FailingLoader(None, chunk_size=10, concurrency=2)
+        for i in range(5):
+            loader.put('test-index', 'test', str(i), {'value': i})
+        loader.flush(max_retry=1)
+        self.assertRaises(BulkIndexError, loader.wait)
+        loader._stop_workers()
+
+    def test_item_retry(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            dead_letter_file = os.path.join(tmp_dir, 'dead_letter.json')
+            loader = RejectingLoader(chunk_size=100, concurrency=0, chunk_bytes=10 ** 6,
+                                     dead_letter_file=dead_letter_file)
+            for i in range(10):
+                loader.put('test-index', 'test', str(i), {'value': i})
+            loader.wait()
+
+            #only the rejected documents are sent again
+            self.assertEquals([int(doc['_id']) for doc in loader.chunks[1]], [1, 3, 5, 7, 9])
+            self.assertEquals(len(loader.chunks), 2)
+            #and chunks got smaller after the rejections
+            self.assertTrue(loader.chunk_bytes < 10 ** 6)
+
+            with open(dead_letter_file) as dead_letter:
+                failed = [json.loads(line) for line in dead_letter]
+            self.assertEquals([f['action']['_id'] for f in failed], ['0'])
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_bulk_files(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            loader = Loader(None, chunk_size=3, concurrency=0, output_folder=tmp_dir)
+            loader.create_new_index('test-index')
+            for i in range(10):
+                loader.put('test-index', 'test', str(i), {'value': i, 'name': u'\u00e9'})
+            loader.close()
+
+            with open(os.path.join(tmp_dir, Loader.INDEXES_FILENAME)) as indexes:
+                self.assertEquals(indexes.read().strip(), loader.get_versioned_index('test-index'))
+
+            filenames = glob.glob(os.path.join(tmp_dir, Loader.BULK_FILENAME_PATTERN))
+            self.assertEquals(len(filenames), 1)
+
+            reader = RecordingLoader(chunk_size=100, concurrency=0, write_to_es=True)
+            self.assertEquals(bulk_load_file(filenames[0], reader), 10)
+            reader.wait()
+            docs = reader.chunks[0]
+            self.assertEquals([doc['_id'] for doc in docs], [str(i) for i in range(10)])
+            self.assertEquals(docs[0]['_index'], loader.get_versioned_index('test-index'))
+            self.assertEquals(json.loads(docs[9]['_source']), {'value': 9, 'name': u'\u00e9'})
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_output_folder_setting(self):
+        old_output_folder = Config.ES_OUTPUT_FOLDER
+        Config.ES_OUTPUT_FOLDER = tempfile.mkdtemp()
+        try:
+            #an empty folder does not override the setting
+            self.assertEquals(Loader(None, concurrency=0, output_folder='').output_folder,
+                              Config.ES_OUTPUT_FOLDER)
+            self.assertEquals(Loader(None, concurrency=0, write_to_es=True).output_folder, None)
+            self.assertRaises(ValueError, Loader, None, concurrency=0,
+                              output_folder=Config.ES_OUTPUT_FOLDER, write_to_es=True)
+        finally:
+            shutil.rmtree(Config.ES_OUTPUT_FOLDER)
+            Config.ES_OUTPUT_FOLDER = old_output_folder
+
+
+if __name__ == '__main__':
+    unittest.main()
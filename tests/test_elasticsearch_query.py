@@ -0,0 +1,64 @@
+from mrtarget.common.ElasticsearchQuery import ESQuery, merge_iterators
+import unittest
+
+
+class TermsHandler(object):
+    '''answers the cardinality and partitioned terms aggregations over
+    target.id of an evidence index with these evidence counts'''
+
+    def __init__(self, counts, cardinality):
+        self.counts = counts
+        self.cardinality = cardinality
+        self.searches = []
+
+    def search(self, index, body):
+        self.searches.append(body)
+        agg = body['aggs']['targets']
+        if 'cardinality' in agg:
+            return {'aggregations': {'targets': {'value': self.cardinality}}}
+
+        include = agg['terms']['include']
+        keys = sorted(k for k in self.counts
+                      if hash(k) % include['num_partitions'] == include['partition'])
+        size = agg['terms']['size']
+        return {'aggregations': {'targets': {
+            'buckets': [{'key': k, 'doc_count': self.counts[k]} for k in keys[:size]],
+            'sum_other_doc_count': sum(self.counts[k] for k in keys[size:])}}}
+
+
+class TargetEvidenceCountsTestCase(unittest.TestCase):
+
+    def test_target_evidence_counts(self):
+        counts = dict(('ENSG%011d' % i, i + 1) for i in range(50))
+        handler = TermsHandler(counts, 50)
+        self.assertEquals(dict(ESQuery(handler).get_target_evidence_counts(partition_size=20)),
+                          counts)
+
+    def test_target_evidence_counts_retry(self):
+        #the cardinality is far too low, so the partitions are too large
+        counts = dict(('ENSG%011d' % i, 1) for i in range(50))
+        handler = TermsHandler(counts, 1)
+        self.assertEquals(dict(ESQuery(handler).get_target_evidence_counts(partition_size=20)),
+                          counts)
+        partitions = [s['aggs']['targets']['terms']['include']['num_partitions']
+                      for s in handler.searches if 'terms' in s['aggs']['targets']]
+        self.assertTrue(max(partitions) > 1)
+
+
+class MergeIteratorsTestCase(unittest.TestCase):
+
+    def test_merge_iterators(self):
+        merged = merge_iterators([iter(range(5)), iter(range(10, 13)), iter([])])
+        self.assertEquals(sorted(merged), [0, 1, 2, 3, 4, 10, 11, 12])
+
+    def test_merge_iterators_error(self):
+        def failing():
+            yield 1
+            raise ValueError('failed slice')
+
+        merged = merge_iterators([failing(), iter(range(1000))], max_queued=10)
+        self.assertRaises(ValueError, list, merged)
+
+
+if __name__ == '__main__':
+    unittest.main()
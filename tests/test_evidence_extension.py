@@ -0,0 +1,101 @@
+import logging
+import unittest
+
+from mrtarget.common.EvidenceString import EvidenceManager, Evidence, make_gene_extension, \
+    make_efo_extension
+from mrtarget.common.IdResolver import IdResolver
+from mrtarget.modules.EFO import EFO
+from mrtarget.modules.GeneData import Gene
+
+
+GENE = {'id': 'ENSG00000155657', 'approved_symbol': 'TTN', 'approved_name': 'titin',
+        '_private': {'facets': {'reactome': {'pathway_type_code': ['R-HSA-1', 'R-HSA-1'],
+                                             'pathway_code': ['R-HSA-2']}}},
+        'go': [{'id': 'GO:1', 'value': {'term': 'P:muscle contraction'}},
+               {'id': 'GO:2', 'value': {'term': 'C:sarcomere'}},
+               {'id': 'GO:3', 'value': {}}],
+        'uniprot_keywords': ['Muscle protein'],
+        'protein_classification': {'chembl': [{'l1': 'Enzyme', 'l2': 'Kinase'}]}}
+
+EFO_TERM = {'code': 'EFO_0000270', 'label': 'asthma',
+            'path_codes': [['EFO_0000408', 'EFO_0000270'], ['EFO_0000270']],
+            'path_labels': [['disease', 'asthma'], ['asthma']]}
+
+EVIDENCE = {'sourceID': 'chembl', 'type': 'known_drug', 'id': 'abc',
+            'target': {'id': 'ENSG00000155657'},
+            'disease': {'id': 'EFO_0000270'},
+            'evidence': {}}
+
+
+class CountingTable(dict):
+    '''a lookup table that counts how many times each key is read'''
+
+    def __init__(self, *args):
+        dict.__init__(self, *args)
+        self.reads = 0
+
+    def __getitem__(self, key):
+        self.reads += 1
+        return dict.__getitem__(self, key)
+
+
+class LookupEvidenceManager(EvidenceManager):
+    '''without the lookup tables and eco scores EvidenceManager needs to load'''
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self.available_genes = CountingTable({GENE['id']: GENE})
+        self.available_efos = CountingTable({EFO_TERM['code']: EFO_TERM})
+        self.available_ecos = {}
+        self.id_resolver = IdResolver({}, {})
+        self.datasources_to_datatypes = {'chembl': 'known_drug'}
+        self._gene_extensions = {}
+        self._efo_extensions = {}
+
+
+class EvidenceExtensionTestCase(unittest.TestCase):
+
+    def test_gene_extension(self):
+        gene = Gene(GENE['id'])
+        gene.load_json(GENE)
+        extension = make_gene_extension(gene)
+        self.assertEquals(extension['gene_info'], dict(geneid='ENSG00000155657', symbol='TTN', name='titin'))
+        self.assertEquals(extension['facets']['reactome'], dict(pathway_type_code=['R-HSA-1'],
+                                                                pathway_code=['R-HSA-2']))
+        self.assertEquals(extension['facets']['go'],
+                          dict(biological_process=[dict(code='GO:1', term='muscle contraction')],
+                               cellular_component=[dict(code='GO:2', term='sarcomere')],
+                               molecular_function=[]))
+        self.assertEquals(extension['facets']['uniprot_keywords'], ['Muscle protein'])
+        self.assertEquals(extension['facets']['target_class'], dict(level1=[['Enzyme']], level2=[['Kinase']]))
+
+    def test_efo_extension(self):
+        efo = EFO(EFO_TERM['code'])
+        efo.load_json(EFO_TERM)
+        extension = make_efo_extension(efo)
+        self.assertEquals(extension['efo_info']['efo_id'], 'EFO_0000270')
+        self.assertEquals(extension['efo_info']['therapeutic_area'],
+                          dict(codes=['EFO_0000408'], labels=['disease']))
+        self.assertEquals(sorted(extension['efo_codes']), ['EFO_0000270', 'EFO_0000408'])
+
+    def test_extended_evidence(self):
+        manager = LookupEvidenceManager()
+        for i in range(3):
+            evidence = Evidence(dict(EVIDENCE, target=dict(EVIDENCE['target']),
+                                     disease=dict(EVIDENCE['disease']), evidence={}),
+                                {'chembl': 'known_drug'})
+            extended = manager.get_extended_evidence(evidence).evidence
+            self.assertEquals(extended['target']['gene_info']['symbol'], 'TTN')
+            self.assertEquals(extended['disease']['efo_info']['label'], 'asthma')
+            self.assertEquals(sorted(extended['private']['efo_codes']), ['EFO_0000270', 'EFO_0000408'])
+            self.assertEquals(sorted(extended['private']['facets']),
+                              ['go', 'reactome', 'target_class', 'uniprot_keywords'])
+            self.assertEquals(extended['private']['datatype'], 'known_drug')
+
+        #the gene and disease were only read and extracted once
+        self.assertEquals(manager.available_genes.reads, 1)
+        self.assertEquals(manager.available_efos.reads, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
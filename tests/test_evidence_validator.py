@@ -0,0 +1,85 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import opentargets_validator.helpers
+
+from mrtarget.common.EvidenceValidator import EvidenceValidator, generate_validator_from_schema
+
+
+SCHEMAS = {
+    'opentargets.json': {
+        '$schema': 'http://json-schema.org/draft-07/schema#',
+        'type': 'object',
+        'required': ['type', 'sourceID'],
+        'oneOf': [{'$ref': 'src/genetics.json'}, {'$ref': 'src/literature.json'}]},
+    'src/genetics.json': {
+        'type': 'object',
+        'properties': {'type': {'const': 'genetic_association'},
+                       'evidence': {'$ref': 'base.json#/definitions/evidence'}},
+        'required': ['evidence']},
+    'src/literature.json': {
+        'allOf': [{'properties': {'type': {'$ref': 'base.json#/definitions/literature_type'}},
+                   'required': ['literature']}]},
+    'src/base.json': {
+        'definitions': {
+            'evidence': {'type': 'object', 'required': ['score'],
+                         'properties': {'score': {'type': 'number'}}},
+            'literature_type': {'enum': ['literature', 'text_mining']}}},
+}
+
+
+class EvidenceValidatorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.tmp_dir, 'src'))
+        for filename, schema in SCHEMAS.items():
+            with open(os.path.join(self.tmp_dir, filename), 'w') as schema_file:
+                json.dump(schema, schema_file)
+        self.schema_uri = 'file://' + os.path.join(self.tmp_dir, 'opentargets.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_type_validators(self):
+        validator = generate_validator_from_schema(self.schema_uri)
+        self.assertEquals(sorted(validator.type_validators),
+                          ['genetic_association', 'literature', 'text_mining'])
+
+    def test_same_errors(self):
+        schema_validator = opentargets_validator.helpers.generate_validator_from_schema(self.schema_uri)
+        validator = EvidenceValidator(schema_validator)
+
+        for evidence in [{'type': 'genetic_association', 'sourceID': 'a', 'evidence': {'score': 1}},
+                         {'type': 'genetic_association', 'sourceID': 'a', 'evidence': {'score': 'x'}},
+                         {'type': 'genetic_association', 'sourceID': 'a'},
+                         {'type': 'text_mining', 'sourceID': 'b', 'literature': {}},
+                         {'type': 'text_mining', 'sourceID': 'b'},
+                         {'type': 'literature', 'literature': {}},
+                         {'type': 'unknown', 'sourceID': 'c'},
+                         {'sourceID': 'c'},
+                         'not an object']:
+            self.assertEquals([str(e) for e in validator.iter_errors(evidence)],
+                              [str(e) for e in schema_validator.iter_errors(evidence)])
+            self.assertEquals(validator.is_valid(evidence), schema_validator.is_valid(evidence))
+
+    def test_valid_skips_schema(self):
+        validator = generate_validator_from_schema(self.schema_uri)
+        validator.validator = None
+        self.assertEquals(list(validator.iter_errors(
+            {'type': 'genetic_association', 'sourceID': 'a', 'evidence': {'score': 1}})), [])
+
+    def test_undiscriminated_branch(self):
+        schema = dict(SCHEMAS['opentargets.json'])
+        schema['oneOf'] = schema['oneOf'] + [{'type': 'object'}]
+        with open(os.path.join(self.tmp_dir, 'opentargets.json'), 'w') as schema_file:
+            json.dump(schema, schema_file)
+        validator = generate_validator_from_schema(self.schema_uri)
+        self.assertEquals(validator.type_validators, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
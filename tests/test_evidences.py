@@ -0,0 +1,101 @@
+import cPickle as pickle
+import json
+import unittest
+
+from mrtarget.common.EvidenceString import Evidence
+from mrtarget.common.EvidencesHelpers import make_validated_evs_obj, serialise_valid_evidence, file_main, \
+    serialise_result, SerialisedEvidence
+from mrtarget.common.ScoreSidecar import EvidenceScoreRow
+from mrtarget.modules.Evidences import fix_and_score_evidence
+
+
+EVIDENCE = {u'sourceID': u'chembl', u'type': u'known_drug', u'id': u'abc',
+            u'target': {u'id': u'http://identifiers.org/ensembl/ENSG00000155657'},
+            u'disease': {u'id': u'http://www.ebi.ac.uk/efo/EFO_0000270'},
+            u'evidence': {u'drug2clinic': {u'resource_score': {u'value': 0.5}},
+                          u'target2drug': {u'resource_score': {u'value': 0.2}}}}
+
+
+class StubEvidenceManager(object):
+    '''fixes and extends nothing, and finds evidence valid if is_valid'''
+
+    score_modifiers = {}
+
+    def __init__(self, is_valid):
+        self.is_valid = is_valid
+
+    def fix_evidence(self, ev):
+        return ev, False
+
+    def check_is_valid_evs(self, ev, datasource):
+        return self.is_valid, 'problem'
+
+    def get_extended_evidence(self, ev):
+        return ev
+
+
+class StubFile(object):
+
+    def __init__(self):
+        self.lines = []
+
+    def writelines(self, line):
+        self.lines.append(line)
+
+
+class EvidencesTestCase(unittest.TestCase):
+
+    def make_validated_evs(self):
+        validated_evs = make_validated_evs_obj(filename='f', hash='h', line=json.dumps(EVIDENCE), line_n=1)
+        validated_evs.evidence = json.loads(json.dumps(EVIDENCE))
+        return validated_evs
+
+    def test_valid_evidence_serialised_once(self):
+        (left, right) = fix_and_score_evidence(self.make_validated_evs(), {'chembl': 'known_drug'},
+                                               StubEvidenceManager(True))
+        self.assertEquals(left, None)
+        self.assertEquals(right.evidence['scores']['association_score'], 0.1)
+
+        #the writer serialises the evidence as Evidence.to_json would have
+        expected = Evidence(dict(right.evidence), {'chembl': 'known_drug'}).to_json()
+        self.assertEquals(serialise_valid_evidence(right), expected)
+
+        valids, invalids = StubFile(), StubFile()
+        self.assertEquals(file_main((left, right), valids, invalids), (0, 1))
+        self.assertEquals(json.loads(valids.lines[0]), json.loads(expected))
+
+    def test_invalid_fixed_evidence(self):
+        validated_evs = self.make_validated_evs()
+        (left, right) = fix_and_score_evidence(validated_evs, {'chembl': 'known_drug'},
+                                               StubEvidenceManager(False))
+        self.assertEquals(right, None)
+        self.assertEquals(left.explanation_type, 'invalid_fixed_evidence')
+        self.assertFalse(hasattr(left, 'evidence'))
+        self.assertEquals(left.line, json.dumps(EVIDENCE))
+
+    def test_pickle_validated_evs(self):
+        validated_evs = self.make_validated_evs()
+        validated_evs.explanation_type = 'validation_error'
+        for protocol in (0, 2):
+            copy = pickle.loads(pickle.dumps(validated_evs, protocol))
+            self.assertEquals(copy.to_dict(), validated_evs.to_dict())
+            self.assertEquals(copy.evidence, validated_evs.evidence)
+            self.assertFalse(hasattr(copy, 'data_source'))
+        self.assertFalse('data_source' in json.loads(validated_evs.to_json()))
+
+    def test_send_bytes(self):
+        (left, right) = fix_and_score_evidence(self.make_validated_evs(), {'chembl': 'known_drug'},
+                                               StubEvidenceManager(True))
+        expected = serialise_valid_evidence(right)
+        (left, right) = serialise_result((left, right))
+        self.assertEquals(right, SerialisedEvidence('h', expected, EvidenceScoreRow(
+            EVIDENCE['target']['id'], EVIDENCE['disease']['id'], [], 'chembl', 0.1, 'h')))
+
+        valids, invalids = StubFile(), StubFile()
+        self.assertEquals(file_main(pickle.loads(pickle.dumps((left, right), 2)), valids, invalids),
+                          (0, 1))
+        self.assertEquals(valids.lines[0].rstrip(), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+
+from mrtarget.common.EvidenceString import EvidenceManager
+from mrtarget.common.IdResolver import IdResolver, load_non_reference_genes
+
+
+NON_REFERENCE_GENES = {'ABCB11': {'reference': 'ENSG00000073734',
+                                  'alternative': ['ENSG00000276582', 'ENSG00000280000']}}
+UNI2ENS = {'P12345': 'ENSG00000276582', 'Q99999': 'ENSG00000155657', 'O00000': None}
+
+
+class IdResolverTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.resolver = IdResolver(UNI2ENS, NON_REFERENCE_GENES)
+
+    def test_load_non_reference_genes(self):
+        non_reference_genes = load_non_reference_genes()
+        self.assertEquals(non_reference_genes['ABCB11']['reference'], 'ENSG00000073734')
+        self.assertTrue('ENSG00000276582' in non_reference_genes['ABCB11']['alternative'])
+        self.assertFalse('gene_symbol' in non_reference_genes)
+
+    def test_reference_gene(self):
+        self.assertTrue(self.resolver.is_non_reference_gene('ENSG00000280000'))
+        self.assertEquals(self.resolver.get_reference_gene('ENSG00000280000'), 'ENSG00000073734')
+        self.assertFalse(self.resolver.is_non_reference_gene('ENSG00000073734'))
+        self.assertEquals(self.resolver.get_reference_gene('ENSG00000073734'), None)
+
+    def test_parse_target_url(self):
+        self.assertEquals(self.resolver.parse_target_url('http://identifiers.org/uniprot/P12345-2'),
+                          ('uniprot', 'P12345'))
+        self.assertEquals(self.resolver.parse_target_url('http://identifiers.org/ensembl/ENSG00000155657'),
+                          ('ensembl', 'ENSG00000155657'))
+        self.assertEquals(self.resolver.parse_target_url('http://example.com/ENSG00000155657'),
+                          (None, None))
+
+    def test_codes(self):
+        self.assertEquals(self.resolver.get_code('http://identifiers.org/cttv.activity/up'), 'up')
+        self.assertEquals(self.resolver.get_ontology_code('http://identifiers.org/efo/0000270'),
+                          'EFO_0000270')
+        self.assertEquals(self.resolver.get_ontology_code('http://identifiers.org/eco/ECO:0000205'),
+                          'ECO_0000205')
+
+    def test_memo_size(self):
+        self.resolver.MAX_MEMO_SIZE = 2
+        for i in range(5):
+            self.assertEquals(self.resolver.get_code('http://example.com/%d' % i), str(i))
+        self.assertTrue(len(self.resolver._codes) <= 2)
+
+    def test_fix_target_id(self):
+        available_genes = set(['ENSG00000073734', 'ENSG00000155657'])
+        for target_id, expected in [('http://identifiers.org/ensembl/ENSG00000155657', 'ENSG00000155657'),
+                                    ('http://identifiers.org/ensembl/ENSG00000280000', 'ENSG00000073734'),
+                                    ('http://identifiers.org/uniprot/P12345', 'ENSG00000073734'),
+                                    ('http://identifiers.org/uniprot/Q99999-1', 'ENSG00000155657'),
+                                    ('http://identifiers.org/uniprot/A00000', None)]:
+            evidence = {'target': {'id': target_id}}
+            EvidenceManager.fix_target_id(evidence, self.resolver, available_genes)
+            self.assertEquals(evidence['target']['id'], expected)
+
+    def test_fix_disease_id(self):
+        evidence = {'id': 'abc', 'disease': {'id': 'http://www.ebi.ac.uk/efo/EFO_0000270'}}
+        EvidenceManager.fix_disease_id(evidence, self.resolver)
+        self.assertEquals(evidence['disease']['id'], 'EFO_0000270')
+
+
+if __name__ == '__main__':
+    unittest.main()
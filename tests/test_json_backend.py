@@ -0,0 +1,66 @@
+import json
+import unittest
+
+import mrtarget.common.JsonBackend as JsonBackend
+from mrtarget.common.DataStructure import JSONSerializable
+from mrtarget.common.EvidenceJsonUtils import DatatStructureFlattener
+
+
+EVIDENCE = u'''{"sourceID": "gwas_catalog", "type": "genetic_association",
+"target": {"id": "http://identifiers.org/ensembl/ENSG00000155657", "target_type": "http://identifiers.org/cttv.target/gene_evidence", "activity": "http://identifiers.org/cttv.activity/predicted_damaging"},
+"disease": {"id": "http://www.ebi.ac.uk/efo/EFO_0000270", "name": "asthma \\u00e9"},
+"unique_association_fields": {"study_name": "gwas", "pubmed_refs": "http://europepmc.org/abstract/MED/20860503", "object": "http://www.ebi.ac.uk/efo/EFO_0000270", "variant": "http://identifiers.org/dbsnp/rs2981579"},
+"evidence": {"variant2disease": {"resource_score": {"type": "pvalue", "value": 1.0000000000000001e-120, "method": {"description": "pvalue"}}, "gwas_sample_size": 12345, "odds_ratio": "1.23", "confidence_interval": "[1.13-1.33]"},
+"gene2variant": {"functional_consequence": "http://purl.obolibrary.org/obo/SO_0001627", "is_associated": true, "date_asserted": "2018-01-01T00:00:00"}},
+"literature": {"references": [{"lit_id": "http://europepmc.org/abstract/MED/20860503"}]},
+"scores": [0.1, 0.30000000000000004, 12345678901234567890]}'''
+
+
+class SerializeStub(JSONSerializable):
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(**kwargs)
+
+
+class JsonBackendTestCase(unittest.TestCase):
+
+    def tearDown(self):
+        JsonBackend.set_json_backend('simplejson')
+
+    def available_backends(self):
+        backends = []
+        for name in JsonBackend.JSON_BACKENDS:
+            try:
+                backends.append(JsonBackend.get_json_backend(name))
+            except ValueError:
+                pass
+        return backends
+
+    def test_unknown_backend(self):
+        self.assertRaises(ValueError, JsonBackend.get_json_backend, 'yaml')
+
+    def test_same_hashes(self):
+        expected = DatatStructureFlattener(json.loads(EVIDENCE)).get_hexdigest()
+        for backend in self.available_backends():
+            parsed = backend.loads(EVIDENCE)
+            self.assertEquals(DatatStructureFlattener(parsed).get_hexdigest(), expected,
+                              'hash differs with %s' % backend.name)
+            #and again after a round trip, as evidence is written and read back
+            parsed = backend.loads(backend.dumps(parsed, sort_keys=True))
+            self.assertEquals(DatatStructureFlattener(parsed).get_hexdigest(), expected,
+                              'hash differs after a round trip with %s' % backend.name)
+
+    def test_same_documents(self):
+        expected = json.loads(EVIDENCE)
+        for backend in self.available_backends():
+            self.assertEquals(json.loads(backend.dumps(expected, sort_keys=True)), expected)
+
+    def test_custom_encoder(self):
+        for backend in self.available_backends():
+            JsonBackend.set_json_backend(backend.name)
+            encoded = json.loads(SerializeStub(id='a', set=set([1]), child=SerializeStub(id='b')).to_json())
+            self.assertEquals(encoded, {'id': 'a', 'set': [1], 'child': {'id': 'b'}})
+
+
+if __name__ == '__main__':
+    unittest.main()
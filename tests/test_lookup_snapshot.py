@@ -0,0 +1,94 @@
+from mrtarget.common.LookupSnapshot import MmapLookupTable
+from mrtarget.common.LookupHelpers import LookUpDataRetriever, LookUpBackend
+from mrtarget.common.LookupTables import ECOLookUpTable
+from mrtarget.common.ElasticsearchQuery import ESQuery
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+
+class LookupSnapshotTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmp_dir, 'test.lut')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_snapshot_lookup(self):
+        table = MmapLookupTable(self.filename)
+        items = [('key_%d' % i, {'id': i, 'values': range(i)}) for i in range(100)]
+        self.assertEquals(table.set_many(iter(items)), 100)
+
+        self.assertEquals(table.get('key_42'), {'id': 42, 'values': range(42)})
+        self.assertTrue('key_0' in table)
+        self.assertFalse('missing' in table)
+        self.assertRaises(KeyError, table.get, 'missing')
+        self.assertEquals(sorted(table.get_many(['key_1', 'key_2', 'missing']).keys()),
+                          ['key_1', 'key_2'])
+        self.assertEquals(len(table.keys()), 100)
+
+        table.set('extra', 'value')
+        self.assertEquals(table.get('extra'), 'value')
+
+        #a second table reads the same file
+        other = MmapLookupTable(self.filename)
+        other.open_snapshot()
+        self.assertEquals(other.get('key_99'), {'id': 99, 'values': range(99)})
+        self.assertFalse('extra' in other)
+
+    def test_pickled_snapshot_lookup(self):
+        table = MmapLookupTable(self.filename, codec='pickle-zlib')
+        table.set_many([('a', [1, 2, 3])])
+
+        copy = pickle.loads(pickle.dumps(table))
+        self.assertEquals(copy.get('a'), [1, 2, 3])
+
+    def test_reused_snapshot_lookup(self):
+        table = MmapLookupTable(self.filename, fingerprint='release:index:1')
+        self.assertFalse(table.reused)
+        table.set_many([('a', 1)])
+
+        same = MmapLookupTable(self.filename, fingerprint='release:index:1')
+        self.assertTrue(same.reused)
+        self.assertEquals(same.get('a'), 1)
+
+        changed = MmapLookupTable(self.filename, fingerprint='release:index:2')
+        self.assertFalse(changed.reused)
+        self.assertFalse('a' in changed)
+
+        other_codec = MmapLookupTable(self.filename, codec='pickle-zlib',
+                                      fingerprint='release:index:1')
+        self.assertFalse(other_codec.reused)
+
+    def test_snapshot_lookup_table_without_redis(self):
+        ecos = [{'code': 'http://purl.obolibrary.org/obo/ECO_0000205', 'label': 'curator inference'}]
+        get_all_eco = ESQuery.get_all_eco
+        ESQuery.get_all_eco = lambda self, fields=None: iter(ecos)
+        try:
+            table = ECOLookUpTable(None, 'ECO_LOOKUP', r_server=None,
+                                   table=MmapLookupTable(self.filename))
+        finally:
+            ESQuery.get_all_eco = get_all_eco
+        self.assertTrue('ECO_0000205' in table)
+        self.assertEquals(table.get_eco('ECO_0000205'), ecos[0])
+
+    def test_temporary_snapshot_dir(self):
+        #a directory the retriever made is removed when it is closed
+        retriever = LookUpDataRetriever(None, None, [], (), backend=LookUpBackend.MMAP)
+        self.assertTrue(os.path.isdir(retriever.snapshot_dir))
+        retriever.close()
+        self.assertFalse(os.path.exists(retriever.snapshot_dir))
+
+        #a given directory is kept for the next run
+        retriever = LookUpDataRetriever(None, None, [], (), backend=LookUpBackend.MMAP,
+                                        snapshot_dir=self.tmp_dir)
+        retriever.close()
+        self.assertTrue(os.path.isdir(self.tmp_dir))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,6 @@
-from mrtarget.common.Redis import RedisLookupTable, RedisLookupTableJson, RedisLookupTablePickle
+from mrtarget.common.Redis import RedisLookupTable, RedisLookupTableJson, RedisLookupTablePickle, \
+    RedisLookupTableCodec, LOOKUP_TABLE_CODECS, get_lookup_table_codec
+import time
 import unittest
 from mrtarget.common.connection import RedisManager, new_redis_client
 
@@ -40,4 +42,85 @@ class LookupTableTestCase(unittest.TestCase):
             test = PicklableObject()
             key = 'test_key'
             table.set(key, test)
-            self.assertEquals(table.get(key), test)
\ No newline at end of file
+            self.assertEquals(table.get(key), test)
+
+    def test_set_many_lookup(self):
+        with RedisManager(False, "localhost", 35000):
+            r_server = new_redis_client("localhost", 35000)
+            table = RedisLookupTablePickle(r_server=r_server, batch_size=7)
+
+            items = [('key_%d' % i, {'value': i}) for i in range(50)]
+            stored = table.set_many(iter(items))
+            self.assertEquals(stored, len(items))
+            for key, value in items:
+                self.assertEquals(table.get(key), value)
+            self.assertEquals(len(table.keys()), len(items))
+
+    def test_get_many_lookup(self):
+        with RedisManager(False, "localhost", 35000):
+            r_server = new_redis_client("localhost", 35000)
+            table = RedisLookupTablePickle(r_server=r_server, batch_size=3)
+
+            items = dict(('key_%d' % i, {'value': i}) for i in range(10))
+            table.set_many(items.items())
+            found = table.get_many(items.keys() + ['missing_key'])
+            self.assertEquals(found, items)
+
+    def test_cached_lookup(self):
+        with RedisManager(False, "localhost", 35000):
+            r_server = new_redis_client("localhost", 35000)
+            table = RedisLookupTablePickle(r_server=r_server, cache_size=2)
+
+            table.set_many([('a', 1), ('b', 2), ('c', 3)])
+            self.assertEquals(table.get('a'), 1)
+            self.assertEquals(table.get('a'), 1)
+            self.assertEquals(table.get('b'), 2)
+            self.assertEquals(table.get('c'), 3)
+            #a is the least recently used so it has been evicted
+            self.assertEquals(table.get('a'), 1)
+            self.assertEquals(table.get_many(['a', 'c']), {'a': 1, 'c': 3})
+
+            info = table.cache_info()
+            self.assertEquals(info['hits'], 3)
+            self.assertEquals(info['misses'], 4)
+            self.assertEquals(info['size'], 2)
+
+            #setting a key drops the stale cached value
+            table.set('a', 10)
+            self.assertEquals(table.get('a'), 10)
+
+    def test_cached_contains_ttl(self):
+        with RedisManager(False, "localhost", 35000):
+            r_server = new_redis_client("localhost", 35000)
+            table = RedisLookupTablePickle(r_server=r_server, cache_size=2, cache_ttl=1)
+
+            table.set_many([('a', 1)])
+            self.assertEquals(table.get('a'), 1)
+            r_server.delete(table._get_key_namespace('a'))
+            #still cached
+            self.assertTrue('a' in table)
+            self.assertEquals(table.get('a'), 1)
+
+            #once expired the cached entry does not count
+            table._cache['a'] = (1, time.time() - 2)
+            info = table.cache_info()
+            self.assertFalse('a' in table)
+            self.assertRaises(KeyError, table.get, 'a')
+            self.assertEquals(table.cache_info()['misses'], info['misses'] + 1)
+
+    def test_codec_lookup(self):
+        with RedisManager(False, "localhost", 35000):
+            r_server = new_redis_client("localhost", 35000)
+
+            test = {u'id': u'ENSG00000157764', u'go': [{u'id': u'GO:0000186'}], u'score': 0.5}
+            for codec in LOOKUP_TABLE_CODECS:
+                try:
+                    table = RedisLookupTableCodec(codec=codec, r_server=r_server)
+                except ValueError:
+                    #optional module for this codec not installed
+                    continue
+                table.set('test_key', test)
+                self.assertEquals(table.get('test_key'), test)
+
+    def test_unknown_codec(self):
+        self.assertRaises(ValueError, get_lookup_table_codec, 'not-a-codec')
@@ -1,7 +1,32 @@
+import json
+import random
 import unittest
 
-from mrtarget.common.Scoring import HarmonicSumScorer
+from mrtarget.common.Scoring import HarmonicSumScorer, grouped_harmonic_sum
 from mrtarget.common.EvidenceString import DataNormaliser, Evidence
+from mrtarget.modules.Association import EvidenceScore, Scorer
+
+
+DATASOURCES_TO_DATATYPES = {'chembl': 'known_drug', 'eva': 'genetic_association',
+                            'gwas_catalog': 'genetic_association', 'europepmc': 'literature',
+                            'expression_atlas': 'rna_expression'}
+
+
+def random_pairs(rng, n_pairs):
+    '''target/disease pairs with random evidence, some with more than 100 scores of a datasource'''
+    datasources = sorted(DATASOURCES_TO_DATATYPES)
+    pairs = []
+    for i in range(n_pairs):
+        evidence = []
+        for datasource in rng.sample(datasources, rng.randint(1, len(datasources))):
+            n_scores = rng.choice([1, 3, 20, 150])
+            for j in range(n_scores):
+                score = rng.choice([rng.random(), rng.random() * 2, 1., 0.])
+                evidence.append(EvidenceScore(score, DATASOURCES_TO_DATATYPES[datasource],
+                                              datasource, rng.random() < 0.5))
+        rng.shuffle(evidence)
+        pairs.append(('ENSG1', 'EFO_%d' % i, evidence, rng.random() < 0.5))
+    return pairs
 
 
 class HarmonicSumTestCase(unittest.TestCase):
@@ -58,6 +83,43 @@ class HarmonicSumTestCase(unittest.TestCase):
         self.assertEqual(harmonic_sum_scorer.score(scale_factor=2.), 2.1349839001848925)
         self.assertEqual(harmonic_sum_scorer.score(cap=2), 2)
 
+    def test_heap_buffer(self):
+        rng = random.Random(7)
+        data = [rng.random() for i in range(500)]
+        harmonic_sum_scorer = HarmonicSumScorer(buffer=100)
+        for i in data:
+            harmonic_sum_scorer.add(i)
+        self.assertEqual(harmonic_sum_scorer.min, min(harmonic_sum_scorer.data))
+        self.assertEqual(sorted(harmonic_sum_scorer.data), sorted(data)[-100:])
+        self.assertEqual(harmonic_sum_scorer.score(scale_factor=2),
+                         HarmonicSumScorer.harmonic_sum(sorted(data)[-100:], scale_factor=2))
+
+    def test_grouped_harmonic_sum(self):
+        rng = random.Random(11)
+        groups = [rng.randint(0, 3) for i in range(400)]
+        scores = [rng.random() for i in range(400)]
+        for cap in (None, 1):
+            harmonic_sums = grouped_harmonic_sum(groups, scores, 5, 100, 2, cap=cap)
+            for group in range(5):
+                harmonic_sum_scorer = HarmonicSumScorer(buffer=100)
+                for g, score in zip(groups, scores):
+                    if g == group:
+                        harmonic_sum_scorer.add(score)
+                self.assertEqual(harmonic_sums[group],
+                                 harmonic_sum_scorer.score(scale_factor=2, cap=cap))
+        self.assertEqual(grouped_harmonic_sum([], [], 2).tolist(), [0., 0.])
+
+    def test_score_pairs(self):
+        '''golden output of the batch scoring against scoring each pair on its own'''
+        pairs = random_pairs(random.Random(3), 30)
+        scorer = Scorer()
+        expected = [scorer.score(target, disease, evidence, is_direct, DATASOURCES_TO_DATATYPES)
+                    for target, disease, evidence, is_direct in pairs]
+        scored = scorer.score_pairs(pairs, DATASOURCES_TO_DATATYPES)
+        self.assertEqual([json.loads(a.to_json()) for a in scored],
+                         [json.loads(a.to_json()) for a in expected])
+        self.assertEqual([bool(a) for a in scored], [bool(a) for a in expected])
+
     def test_renormalize(self):
         value = DataNormaliser.renormalize(0.2,[0.,.9],[.5,1])
         self.assertEqual(value,0.6111111111111112)
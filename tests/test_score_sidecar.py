@@ -0,0 +1,109 @@
+import shutil
+import tempfile
+import unittest
+
+from mrtarget.common.EvidencesHelpers import setup_writers
+from mrtarget.common.ScoreSidecar import EvidenceScoreRow, ScoreSidecar, ScoreSidecarWriter, \
+    get_score_row, iter_score_rows, prepare_scores_folder
+from mrtarget.modules.Association import group_evidence_scores, produce_sidecar_evidence
+
+
+ROWS = [EvidenceScoreRow(u'ENSG1', u'EFO_1', [u'EFO_1', u'EFO_0'], u'chembl', 0.5, 'a1'),
+        EvidenceScoreRow(u'ENSG2', u'EFO_2', [u'EFO_2'], u'eva', 1e-120, 'b2'),
+        EvidenceScoreRow(u'ENSG1', u'EFO_2', [], u'eva', 0.25, 'c3'),
+        EvidenceScoreRow(u'ENSG2', u'EFO_1', [u'EFO_1', u'EFO_0', u'EFO_2'], u'chembl', 1.0, 'd4'),
+        EvidenceScoreRow(u'ENSG1', u'EFO_3', [u'EFO_3'], u'europepmc', 0.125, 'e5')]
+
+DATASOURCES_TO_DATATYPES = {'chembl': 'known_drug', 'eva': 'genetic_association',
+                            'europepmc': 'literature'}
+
+
+def comparable(pairs):
+    return sorted((target, disease, sorted(sorted(vars(e).items()) for e in evidence), is_direct)
+                  for target, disease, evidence, is_direct in pairs)
+
+
+class ScoreSidecarTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def write(self, rows):
+        writer = ScoreSidecarWriter(self.folder)
+        for row in rows:
+            writer.add(row)
+        writer.close()
+
+    def read_rows(self, sidecar):
+        return dict((target, list(iter_score_rows(sidecar.get_target_scores(target), sidecar.ids)))
+                    for target, count in sidecar.get_target_counts())
+
+    def test_round_trip(self):
+        #two writers that intern the same ids differently
+        self.write(ROWS[:2])
+        self.write(ROWS[2:])
+        self.write([])
+
+        sidecar = ScoreSidecar(self.folder)
+        self.assertEquals(sorted(sidecar.get_target_counts()), [(u'ENSG1', 3), (u'ENSG2', 2)])
+        rows = self.read_rows(sidecar)
+        self.assertEquals(sorted(rows[u'ENSG1']), sorted([ROWS[0], ROWS[2], ROWS[4]]))
+        self.assertEquals(sorted(rows[u'ENSG2']), sorted([ROWS[1], ROWS[3]]))
+
+    def test_prepare_scores_folder(self):
+        self.write(ROWS)
+        prepare_scores_folder(self.folder)
+        self.assertRaises(RuntimeError, ScoreSidecar, self.folder)
+
+    def test_writers(self):
+        global_init, local_init, main, local_shutdown, global_shutdown = setup_writers(
+            True, None, None, self.folder)
+        writer_state = local_init()
+        evidence = {'target': {'id': 'ENSG1'}, 'disease': {'id': 'EFO_1'}, 'sourceID': 'chembl',
+                    'private': {'efo_codes': ['EFO_1', 'EFO_0']},
+                    'scores': {'association_score': 0.5}}
+
+        class Valid(object):
+            pass
+        right = Valid()
+        right.evidence = evidence
+        right.hash = 'h1'
+        self.assertEquals(main((None, right), *writer_state), (0, 1))
+        self.assertEquals(main((right, None), *writer_state), (1, 0))
+        local_shutdown(None, *writer_state)
+
+        sidecar = ScoreSidecar(self.folder)
+        self.assertEquals(self.read_rows(sidecar), {u'ENSG1': [get_score_row(evidence, 'h1')]})
+
+    def test_duplicate_hashes(self):
+        #two writers with evidence of the same hash, which elasticsearch
+        #would store as a single document
+        duplicate = ROWS[0]._replace(score=0.75)
+        self.write(ROWS[:3])
+        self.write([duplicate] + ROWS[3:])
+
+        sidecar = ScoreSidecar(self.folder)
+        self.assertEquals(sorted(sidecar.get_target_counts()), [(u'ENSG1', 3), (u'ENSG2', 2)])
+        rows = self.read_rows(sidecar)
+        self.assertEquals(len([row for row in rows[u'ENSG1'] if row.hash == 'a1']), 1)
+        self.assertEquals(sorted(row.hash for row in rows[u'ENSG1']), ['a1', 'c3', 'e5'])
+
+        self.assertRaises(ValueError, ScoreSidecarWriter(self.folder).add, ROWS[0]._replace(hash=None))
+
+    def test_produce_sidecar_evidence(self):
+        self.write(ROWS)
+        sidecar = ScoreSidecar(self.folder)
+        for target, count in sidecar.get_target_counts():
+            expected = group_evidence_scores([row for row in ROWS if row.target == target],
+                                             {'chembl': 0.5}, ['eva'], DATASOURCES_TO_DATATYPES)
+            produced = produce_sidecar_evidence((target, count, sidecar.get_target_scores(target)),
+                                                sidecar.ids, {'chembl': 0.5}, ['eva'],
+                                                DATASOURCES_TO_DATATYPES)
+            self.assertEquals(comparable(produced), comparable(expected))
+
+
+if __name__ == '__main__':
+    unittest.main()